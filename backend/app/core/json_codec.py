@@ -0,0 +1,96 @@
+"""
+Codec JSON del camino de ingesta (decodificación de mensajes, cuerpo _bulk, DLX/reproceso
+y serializer del cliente OpenSearch).
+
+Si orjson está instalado (dependencia opcional) se usa como backend rápido: decodifica los
+bytes del mensaje sin pasar por str y codifica directamente a bytes UTF-8. Sin orjson, o con
+JSON_CODEC=stdlib, se usa el módulo json estándar con la salida de siempre (compacta,
+default=str).
+
+La salida de ambos backends es equivalente para los tipos del pipeline: datetimes y
+dataclasses pasan también por default=str, y las claves no str se convierten como en
+json. Los casos que orjson no acepta (enteros de más de 64 bits al codificar; NaN,
+Infinity o surrogates sueltos al decodificar) se reintentan con json, así que el
+resultado y las excepciones son los del módulo estándar. Diferencia conocida: al
+decodificar, orjson convierte a float los enteros de más de 64 bits.
+"""
+import json
+import logging
+import os
+from typing import Any, Callable, NamedTuple, Union
+
+try:
+    import orjson
+except ImportError:  # dependencia opcional
+    orjson = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+JSON_CODEC = os.getenv("JSON_CODEC", "auto").lower()
+
+JsonInput = Union[bytes, bytearray, memoryview, str]
+
+
+class JsonCodec(NamedTuple):
+    name: str
+    loads: Callable[[JsonInput], Any]
+    dumps: Callable[[Any], bytes]
+
+
+def _stdlib_loads(data: JsonInput) -> Any:
+    if isinstance(data, memoryview):
+        data = bytes(data)
+    return json.loads(data)
+
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, separators=(",", ":"), default=str).encode("utf-8")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = (
+        orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+    )
+
+    def _orjson_loads(data: JsonInput) -> Any:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # NaN/Infinity, surrogates: json los acepta o da su propio error
+            return _stdlib_loads(data)
+
+    def _orjson_dumps(obj: Any) -> bytes:
+        try:
+            return orjson.dumps(obj, default=str, option=_ORJSON_OPTIONS)
+        except TypeError:
+            # Enteros > 64 bits (o ciclos: json lanza su ValueError de siempre)
+            return _stdlib_dumps(obj)
+
+
+STDLIB = JsonCodec("stdlib", _stdlib_loads, _stdlib_dumps)
+
+
+def build_codec(name: str = "auto") -> JsonCodec:
+    """
+    Codec por nombre: "auto" (orjson si está instalado), "orjson" o "stdlib".
+    Si se pide orjson y no está instalado se usa stdlib con un aviso.
+    """
+    if name not in ("auto", "orjson", "stdlib"):
+        raise ValueError(f"JSON_CODEC desconocido: {name!r}")
+    if name == "stdlib":
+        return STDLIB
+    if orjson is None:
+        if name == "orjson":
+            logger.warning("json_codec_orjson_unavailable", extra={"fallback": "stdlib"})
+        return STDLIB
+    return JsonCodec("orjson", _orjson_loads, _orjson_dumps)
+
+
+CODEC = build_codec(JSON_CODEC)
+BACKEND = CODEC.name
+loads = CODEC.loads
+dumps = CODEC.dumps
+
+
+def dumps_str(obj: Any) -> str:
+    return CODEC.dumps(obj).decode("utf-8")
@@ -1,16 +1,289 @@
+"""
+Logging JSON a stdout.
+
+Con LOG_QUEUE=true (por defecto) los handlers de la raíz sólo encolan el record
+(QueueHandler) y un hilo QueueListener formatea y escribe en stdout: el hilo del consumer no
+espera a stdout. La cola está acotada (LOG_QUEUE_MAX_RECORDS); si se llena, los records se
+descartan y se cuentan en `log_records_dropped_total` en lugar de bloquear.
+
+EventLog agrupa los logs por evento del camino caliente (`event_indexed`,
+`mapped_host_to_tenant`...): con LOG_EVENT_MODE=sampled sólo se escribe 1 de cada
+1/LOG_EVENT_SAMPLE_RATE eventos y cada LOG_EVENT_SUMMARY_SECONDS un record `<evento>_summary`
+con el total, los eventos por tenant y los percentiles de latencia de la ventana. El resumen
+lo escribe un hilo de fondo, así que la última ventana sale aunque dejen de llegar eventos.
+Con LOG_EVENT_MODE=all (por defecto) se escribe cada evento como antes.
+"""
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
+import random
 import sys
-from typing import Optional
+import threading
+import time
+import weakref
+from typing import Any, Dict, List, Optional
 
 from pythonjsonlogger import jsonlogger
 
+LOG_QUEUE = os.getenv("LOG_QUEUE", "true").lower() == "true"
+LOG_QUEUE_MAX_RECORDS = int(os.getenv("LOG_QUEUE_MAX_RECORDS", "100000"))
+LOG_EVENT_MODE = os.getenv("LOG_EVENT_MODE", "all").lower()
+LOG_EVENT_SAMPLE_RATE = float(os.getenv("LOG_EVENT_SAMPLE_RATE", "0.01"))
+LOG_EVENT_SUMMARY_SECONDS = float(os.getenv("LOG_EVENT_SUMMARY_SECONDS", "10"))
 
-def configure_logging(level: Optional[str] = None) -> None:
-    logger = logging.getLogger()
-    logger.setLevel(level or logging.INFO)
+_listener: Optional[logging.handlers.QueueListener] = None
+_listener_lock = threading.Lock()
+_dropped_counter: Any = None
+
+
+def records_dropped_counter() -> Any:
+    """
+    Counter `log_records_dropped_total`, creado al primer uso: este módulo se importa antes
+    de fijar PROMETHEUS_MULTIPROC_DIR (supervisor) y no debe importar prometheus_client.
+    """
+    global _dropped_counter
+    if _dropped_counter is None:
+        from prometheus_client import Counter
+
+        _dropped_counter = Counter(
+            "log_records_dropped_total", "Records de log descartados por cola de logging llena"
+        )
+    return _dropped_counter
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler que nunca bloquea: cola llena -> record descartado y contado.
+    El record se encola sin formatear (el listener está en el mismo proceso); sólo se
+    resuelve `msg % args` para que no cambie si los argumentos se modifican después.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            records_dropped_counter().inc()
+
+
+def _stdout_handler() -> logging.Handler:
     handler = logging.StreamHandler(sys.stdout)
     formatter = jsonlogger.JsonFormatter(
         "%(asctime)s %(levelname)s %(name)s %(message)s %(tenant_id)s %(errors)s"
     )
     handler.setFormatter(formatter)
-    logger.handlers = [handler]
+    return handler
+
+
+def _start_queue_logging(logger: logging.Logger) -> None:
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+        log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(LOG_QUEUE_MAX_RECORDS)
+        _listener = logging.handlers.QueueListener(
+            log_queue, _stdout_handler(), respect_handler_level=True
+        )
+        _listener.start()
+        logger.handlers = [NonBlockingQueueHandler(log_queue)]
+
+
+def stop_queue_logging() -> None:
+    """Escribe los records pendientes y para el hilo listener."""
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def _restart_after_fork() -> None:
+    # El hilo listener no sobrevive al fork: el proceso hijo arranca el suyo con una cola nueva
+    global _listener
+    if _listener is not None:
+        _listener = None
+        _start_queue_logging(logging.getLogger())
+
+
+def configure_logging(level: Optional[str] = None, use_queue: bool = LOG_QUEUE) -> None:
+    logger = logging.getLogger()
+    logger.setLevel(level or logging.INFO)
+    if use_queue:
+        _start_queue_logging(logger)
+    else:
+        stop_queue_logging()
+        logger.handlers = [_stdout_handler()]
+
+
+atexit.register(stop_queue_logging)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+# EventLogs en modo sampled; un hilo por proceso escribe sus resúmenes vencidos
+_event_logs: "weakref.WeakSet[EventLog]" = weakref.WeakSet()
+_summary_lock = threading.Lock()
+_summary_thread_pid: Optional[int] = None
+SUMMARY_TICK_SECONDS = 1.0
+
+
+def _summary_loop() -> None:
+    while True:
+        logs = list(_event_logs)
+        tick = min([SUMMARY_TICK_SECONDS] + [log.summary_seconds for log in logs])
+        time.sleep(max(tick, 0.05))
+        for log in logs:
+            log.flush_if_due()
+
+
+def _register_event_log(log: "EventLog") -> None:
+    global _summary_thread_pid
+    with _summary_lock:
+        _event_logs.add(log)
+        # Tras un fork el hilo del padre no existe en el hijo
+        if _summary_thread_pid != os.getpid():
+            _summary_thread_pid = os.getpid()
+            threading.Thread(target=_summary_loop, name="event-log-summary", daemon=True).start()
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class EventLog:
+    """
+    Log por evento con muestreo y resumen periódico.
+
+    record() cuenta el evento (por tenant y con su latencia, si la hay) y lo escribe sólo si
+    toca por muestreo (1 de cada round(1 / sample_rate); el record lleva `sampled: true`).
+    Pasados `summary_seconds`, el siguiente record() o el hilo de resúmenes (como mucho cada
+    SUMMARY_TICK_SECONDS) escribe `<evento>_summary` con `count`, `sampled`, `by_tenant` (los
+    `max_tenants` con más eventos) y `latency_p50`, `latency_p95`, `latency_p99` y
+    `latency_max` en segundos. Los percentiles salen de un reservorio de
+    `max_latency_samples` valores; `latency_max` es el máximo exacto de la ventana.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        event: str,
+        mode: str = LOG_EVENT_MODE,
+        sample_rate: float = LOG_EVENT_SAMPLE_RATE,
+        summary_seconds: float = LOG_EVENT_SUMMARY_SECONDS,
+        max_tenants: int = 50,
+        max_latency_samples: int = 10_000,
+    ):
+        if mode not in ("all", "sampled"):
+            raise ValueError(f"LOG_EVENT_MODE desconocido: {mode!r}")
+        self.logger = logger
+        self.event = event
+        self.aggregate = mode == "sampled"
+        self.every = max(1, round(1 / sample_rate)) if sample_rate > 0 else 0
+        self.summary_seconds = summary_seconds
+        self.max_tenants = max_tenants
+        self.max_latency_samples = max_latency_samples
+        self._lock = threading.Lock()
+        self._reset(time.monotonic())
+        if self.aggregate:
+            _register_event_log(self)
+
+    def _reset(self, now: float) -> None:
+        self._window_start = now
+        self._count = 0
+        self._sampled = 0
+        self._by_tenant: Dict[str, int] = {}
+        self._latencies: List[float] = []
+        self._latency_max: Optional[float] = None
+
+    def record(
+        self,
+        tenant_id: Optional[str] = None,
+        latency_seconds: Optional[float] = None,
+        **extra: Any,
+    ) -> None:
+        if not self.aggregate:
+            if tenant_id is not None:
+                extra["tenant_id"] = tenant_id
+            if latency_seconds is not None:
+                extra["latency_seconds"] = round(latency_seconds, 6)
+            self.logger.info(self.event, extra=extra)
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._count += 1
+            n = self._count
+            if tenant_id is not None:
+                self._by_tenant[tenant_id] = self._by_tenant.get(tenant_id, 0) + 1
+            if latency_seconds is not None:
+                if self._latency_max is None or latency_seconds > self._latency_max:
+                    self._latency_max = latency_seconds
+                if len(self._latencies) < self.max_latency_samples:
+                    self._latencies.append(latency_seconds)
+                else:
+                    # Reservorio (algoritmo R): muestra uniforme de la ventana
+                    j = random.randrange(n)
+                    if j < self.max_latency_samples:
+                        self._latencies[j] = latency_seconds
+            sample = self.every and n % self.every == 1 % self.every
+            if sample:
+                self._sampled += 1
+            summary = (
+                self._take_summary(now)
+                if now - self._window_start >= self.summary_seconds
+                else None
+            )
+        if sample:
+            extra["sampled"] = True
+            if tenant_id is not None:
+                extra["tenant_id"] = tenant_id
+            if latency_seconds is not None:
+                extra["latency_seconds"] = round(latency_seconds, 6)
+            self.logger.info(self.event, extra=extra)
+        if summary is not None:
+            self.logger.info(f"{self.event}_summary", extra=summary)
+
+    def _take_summary(self, now: float) -> Optional[Dict[str, Any]]:
+        if not self._count:
+            self._reset(now)
+            return None
+        top = sorted(self._by_tenant.items(), key=lambda kv: kv[1], reverse=True)
+        summary: Dict[str, Any] = {
+            "count": self._count,
+            "sampled": self._sampled,
+            "window_seconds": round(now - self._window_start, 3),
+            "by_tenant": dict(top[: self.max_tenants]),
+        }
+        if self._latencies:
+            ordered = sorted(self._latencies)
+            summary["latency_p50"] = round(_percentile(ordered, 0.50), 6)
+            summary["latency_p95"] = round(_percentile(ordered, 0.95), 6)
+            summary["latency_p99"] = round(_percentile(ordered, 0.99), 6)
+            summary["latency_max"] = round(self._latency_max, 6)
+        self._reset(now)
+        return summary
+
+    def flush_if_due(self) -> None:
+        """Escribe el resumen si la ventana ya ha vencido (hilo de resúmenes)."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._window_start < self.summary_seconds:
+                return
+            summary = self._take_summary(now)
+        if summary is not None:
+            self.logger.info(f"{self.event}_summary", extra=summary)
+
+    def flush(self) -> None:
+        """Escribe el resumen de la ventana en curso (p.ej. al parar)."""
+        if not self.aggregate:
+            return
+        with self._lock:
+            summary = self._take_summary(time.monotonic())
+        if summary is not None:
+            self.logger.info(f"{self.event}_summary", extra=summary)
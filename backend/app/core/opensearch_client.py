@@ -1,19 +1,73 @@
 import os
 from functools import lru_cache
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 from opensearchpy import OpenSearch
+from opensearchpy.exceptions import SerializationError
+from opensearchpy.serializer import JSONSerializer
+
+from backend.app.core import json_codec
+
+try:
+    from opensearchpy import AsyncOpenSearch
+except Exception:  # requiere aiohttp
+    AsyncOpenSearch = None  # type: ignore
 
 OPENSEARCH_DEFAULT = os.getenv("OPENSEARCH_HOST", "http://opensearch:9200")
 OS_USER = os.getenv("OS_USER")
 OS_PASS = os.getenv("OS_PASS")
 
 
-@lru_cache(maxsize=1)
-def get_client() -> OpenSearch:
+class CodecJSONSerializer(JSONSerializer):
+    """
+    JSONSerializer de opensearch-py sobre orjson (json_codec). Mismo `default` que el
+    original (datetimes en ISO, Decimal, UUID); dumps() sigue devolviendo str porque el
+    cliente une con "\\n" los cuerpos _bulk que recibe como lista.
+    """
+
+    def loads(self, s: Any) -> Any:
+        try:
+            return json_codec.loads(s)
+        except (ValueError, TypeError) as e:
+            raise SerializationError(s, e)
+
+    def dumps(self, data: Any) -> Any:
+        if isinstance(data, (str, bytes)):
+            return data
+        try:
+            return json_codec.orjson.dumps(
+                data, default=self.default, option=json_codec.orjson.OPT_NON_STR_KEYS
+            ).decode("utf-8")
+        except TypeError:
+            # Enteros > 64 bits o tipos que `default` no sabe convertir
+            return super().dumps(data)
+
+
+def client_serializer() -> Optional[JSONSerializer]:
+    """Serializer para los clientes OpenSearch; None = el de opensearch-py (json)."""
+    return CodecJSONSerializer() if json_codec.BACKEND == "orjson" else None
+
+
+def _client_kwargs() -> Dict[str, Any]:
     kwargs: Dict[str, Any] = {"hosts": [OPENSEARCH_DEFAULT], "timeout": 30}
     if OS_USER and OS_PASS:
         kwargs["http_auth"] = (OS_USER, OS_PASS)
+    serializer = client_serializer()
+    if serializer is not None:
+        kwargs["serializer"] = serializer
+    return kwargs
+
+
+@lru_cache(maxsize=1)
+def get_client() -> OpenSearch:
+    kwargs = _client_kwargs()
     client = OpenSearch(**kwargs)
     client.info()
     return client
+
+
+def get_async_client():
+    # Sin cache: el cliente async queda ligado al event loop que lo crea
+    if AsyncOpenSearch is None:
+        raise RuntimeError("AsyncOpenSearch no disponible (instala opensearch-py[async])")
+    return AsyncOpenSearch(**_client_kwargs())
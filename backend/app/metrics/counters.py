@@ -1,4 +1,14 @@
-from prometheus_client import Counter
+from prometheus_client import Counter, Gauge, Histogram
 
 # Contador de reintentos de indexación
 INDEX_RETRIES = Counter("index_retries_total", "Número total de reintentos de indexación")
+
+# Compartidas entre consumer y bulk_indexer (una sola definición por registry)
+INDEX_LATENCY = Histogram(
+    "index_latency_seconds",
+    "Latencia por flush bulk o documento individual",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0),
+)
+BUFFER_SIZE = Gauge(
+    "consumer_buffer_size", "Número de eventos en buffer bulk", multiprocess_mode="livesum"
+)
@@ -0,0 +1,295 @@
+"""
+Servidor de métricas del consumer con endpoints de profiling bajo demanda.
+
+Además de las métricas Prometheus (cualquier ruta que no sea /debug/profile/...):
+- GET /debug/profile/sample?seconds=10&interval_ms=10: profiler por muestreo de todos los
+  hilos (sys._current_frames); devuelve stacks colapsados (`hilo;f1;f2;f3 N`, formato de
+  flamegraph.pl / speedscope).
+- GET /debug/profile/cprofile?seconds=10&sort=cumulative&limit=50: cProfile del hilo de
+  consumo (decode, normalize, validación, encolado); texto pstats, o el volcado binario
+  de pstats con `format=pstats` (`python -m pstats fichero`, snakeviz).
+- GET /debug/profile/tracemalloc?seconds=10&top=30&key=lineno: tracemalloc durante la
+  ventana y top de lo asignado que sigue vivo al final, por línea, fichero o traceback.
+
+Los endpoints sólo existen con PROFILING_TOKEN; cada petición lo envía en
+`Authorization: Bearer <token>` (o `X-Profiling-Token`). Un perfil a la vez (409 si hay
+otro en curso) y como mucho PROFILING_MAX_SECONDS.
+
+Sin peticiones no hay coste: el hilo de muestreo, cProfile y tracemalloc sólo están activos
+durante la ventana pedida. cProfile sólo perfila el hilo que lo activa, así que el hilo de
+consumo llama a PROFILER.poll() en su bucle (cada segundo como mucho, no por evento) y ahí
+empieza y termina la sesión pedida por HTTP.
+"""
+import cProfile
+import hmac
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from socketserver import ThreadingMixIn
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from prometheus_client import REGISTRY, CollectorRegistry, make_wsgi_app
+
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILING_MAX_SECONDS = float(os.getenv("PROFILING_MAX_SECONDS", "60"))
+
+PROFILE_PREFIX = "/debug/profile/"
+
+
+def _frame_label(frame: Any) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(
+    seconds: float, interval: float = 0.01, ignore: Iterable[int] = ()
+) -> Tuple[Counter, int]:
+    """
+    Muestrea los stacks de todos los hilos cada `interval` durante `seconds`.
+    Devuelve (stacks colapsados -> nº de muestras, nº de rondas de muestreo).
+    """
+    skip = set(ignore) | {threading.get_ident()}
+    stacks: Counter = Counter()
+    rounds = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident in skip:
+                continue
+            labels: List[str] = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(ident, str(ident)))
+            stacks[";".join(reversed(labels))] += 1
+        rounds += 1
+        time.sleep(interval)
+    return stacks, rounds
+
+
+def format_collapsed(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def tracemalloc_top(seconds: float, top: int = 30, key: str = "lineno") -> str:
+    """
+    Top de memoria asignada durante la ventana y aún viva al final. Si tracemalloc ya estaba
+    activo (PYTHONTRACEMALLOC), se usa tal cual y no se para.
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(25 if key == "traceback" else 1)
+    try:
+        before = tracemalloc.take_snapshot()
+        time.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started:
+            tracemalloc.stop()
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    stats = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), key)
+    lines = [
+        f"# tracemalloc {seconds:g}s, top {top} por {key}; "
+        f"traced {current / 1024:.1f} KiB, pico {peak / 1024:.1f} KiB\n"
+    ]
+    for stat in stats[:top]:
+        lines.append(
+            f"{stat.size_diff / 1024:+.1f} KiB ({stat.size / 1024:.1f} KiB) "
+            f"{stat.count_diff:+d} bloques\n"
+        )
+        for line in stat.traceback.format():
+            lines.append(f"    {line.strip()}\n")
+    return "".join(lines)
+
+
+class _ProfileRequest:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.profile = cProfile.Profile()
+        self.deadline = 0.0
+        self.done = threading.Event()
+
+
+class CooperativeProfiler:
+    """
+    cProfile en el hilo que llama a poll(): request() (desde el hilo HTTP) deja la petición,
+    el siguiente poll() activa el perfil y el primero pasada la ventana lo para y la entrega.
+    """
+
+    def __init__(self):
+        self._pending: Optional[_ProfileRequest] = None
+        self._running: Optional[_ProfileRequest] = None
+        self._lock = threading.Lock()
+
+    def poll(self) -> None:
+        running = self._running
+        if running is not None:
+            if time.monotonic() >= running.deadline:
+                running.profile.disable()
+                self._running = None
+                running.done.set()
+            return
+        if self._pending is None:
+            return
+        with self._lock:
+            req, self._pending = self._pending, None
+        if req is not None:
+            req.deadline = time.monotonic() + req.seconds
+            self._running = req
+            req.profile.enable()
+
+    def request(self, seconds: float, timeout: float) -> Optional[cProfile.Profile]:
+        """Perfil de `seconds`; None si está ocupado o no se completa en `timeout`."""
+        req = _ProfileRequest(seconds)
+        with self._lock:
+            if self._pending is not None or self._running is not None:
+                return None
+            self._pending = req
+        if req.done.wait(timeout):
+            return req.profile
+        with self._lock:
+            if self._pending is req:
+                self._pending = None
+        # Si ya había empezado, el hilo de consumo lo para al acabar la ventana
+        return None
+
+
+PROFILER = CooperativeProfiler()
+poll = PROFILER.poll
+
+
+def _num_param(params: Dict[str, List[str]], name: str, default: float) -> float:
+    value = params.get(name, [None])[0]
+    return float(value) if value not in (None, "") else default
+
+
+class ProfilingApp:
+    """App WSGI: /debug/profile/* con token; el resto, métricas Prometheus."""
+
+    def __init__(
+        self,
+        registry: CollectorRegistry = REGISTRY,
+        token: str = PROFILING_TOKEN,
+        max_seconds: float = PROFILING_MAX_SECONDS,
+        profiler: CooperativeProfiler = PROFILER,
+    ):
+        self.metrics_app = make_wsgi_app(registry)
+        self.token = token
+        self.max_seconds = max_seconds
+        self.profiler = profiler
+        self._busy = threading.Lock()
+        self._routes: Dict[str, Callable[[Dict[str, List[str]], float], Tuple[str, bytes]]] = {
+            "sample": self._sample,
+            "cprofile": self._cprofile,
+            "tracemalloc": self._tracemalloc,
+        }
+
+    def __call__(self, environ: Dict[str, Any], start_response: Callable[..., Any]):
+        path = environ.get("PATH_INFO", "")
+        if not path.startswith(PROFILE_PREFIX):
+            return self.metrics_app(environ, start_response)
+        route = self._routes.get(path[len(PROFILE_PREFIX) :].strip("/"))
+        if route is None or not self.token:
+            return _reply(start_response, "404 Not Found", b"unknown profile\n")
+        if not self._authorized(environ):
+            return _reply(start_response, "403 Forbidden", b"invalid token\n")
+        params = parse_qs(environ.get("QUERY_STRING", ""))
+        try:
+            seconds = _num_param(params, "seconds", 10)
+        except ValueError:
+            return _reply(start_response, "400 Bad Request", b"invalid seconds\n")
+        if not 0 < seconds <= self.max_seconds:
+            msg = f"seconds must be in (0, {self.max_seconds:g}]\n".encode()
+            return _reply(start_response, "400 Bad Request", msg)
+        if not self._busy.acquire(blocking=False):
+            return _reply(start_response, "409 Conflict", b"another profile is running\n")
+        try:
+            content_type, body = route(params, seconds)
+        except ValueError as e:
+            return _reply(start_response, "400 Bad Request", f"{e}\n".encode())
+        except TimeoutError as e:
+            return _reply(start_response, "503 Service Unavailable", f"{e}\n".encode())
+        finally:
+            self._busy.release()
+        return _reply(start_response, "200 OK", body, content_type)
+
+    def _authorized(self, environ: Dict[str, Any]) -> bool:
+        auth = environ.get("HTTP_AUTHORIZATION", "")
+        given = auth[7:] if auth.startswith("Bearer ") else environ.get("HTTP_X_PROFILING_TOKEN")
+        return bool(given) and hmac.compare_digest(given.encode(), self.token.encode())
+
+    def _sample(self, params: Dict[str, List[str]], seconds: float) -> Tuple[str, bytes]:
+        interval_ms = _num_param(params, "interval_ms", 10)
+        if not 1 <= interval_ms <= 1000:
+            raise ValueError("interval_ms must be in [1, 1000]")
+        stacks, _ = sample_stacks(seconds, interval_ms / 1000.0)
+        return "text/plain; charset=utf-8", format_collapsed(stacks).encode()
+
+    def _cprofile(self, params: Dict[str, List[str]], seconds: float) -> Tuple[str, bytes]:
+        sort = params.get("sort", ["cumulative"])[0]
+        if sort not in pstats.Stats.sort_arg_dict_default:
+            raise ValueError(f"unknown sort {sort!r}")
+        limit = int(_num_param(params, "limit", 50))
+        # El hilo de consumo llama a poll() al menos cada segundo
+        profile = self.profiler.request(seconds, timeout=seconds + 5)
+        if profile is None:
+            raise TimeoutError("consumer thread did not run the profile")
+        stats = pstats.Stats(profile)
+        if params.get("format", ["text"])[0] == "pstats":
+            return "application/octet-stream", marshal.dumps(stats.stats)
+        out = io.StringIO()
+        stats.stream = out
+        stats.sort_stats(sort).print_stats(limit)
+        return "text/plain; charset=utf-8", out.getvalue().encode()
+
+    def _tracemalloc(self, params: Dict[str, List[str]], seconds: float) -> Tuple[str, bytes]:
+        key = params.get("key", ["lineno"])[0]
+        if key not in ("lineno", "filename", "traceback"):
+            raise ValueError("key must be lineno, filename or traceback")
+        top = int(_num_param(params, "top", 30))
+        return "text/plain; charset=utf-8", tracemalloc_top(seconds, top, key).encode()
+
+
+def _reply(
+    start_response: Callable[..., Any],
+    status: str,
+    body: bytes,
+    content_type: str = "text/plain; charset=utf-8",
+) -> List[bytes]:
+    start_response(status, [("Content-Type", content_type), ("Content-Length", str(len(body)))])
+    return [body]
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _SilentHandler(WSGIRequestHandler):
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def start_metrics_server(
+    port: int, addr: str = "0.0.0.0", app: Optional[ProfilingApp] = None
+) -> WSGIServer:
+    """Como prometheus_client.start_http_server, con los endpoints de profiling."""
+    server = make_server(
+        addr,
+        port,
+        app or ProfilingApp(),
+        server_class=_ThreadingWSGIServer,
+        handler_class=_SilentHandler,
+    )
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,307 @@
+"""
+Tiempos por etapa del pipeline de consumo en `pipeline_stage_seconds{stage}`.
+
+Etapas: decode (JSON del mensaje), normalize (normalize + severidad + prepare_event),
+tenant (mapeo host -> tenant y registro), validate (schema NCS), enqueue (buffer bulk),
+flush (petición _bulk o indexación unitaria) y ack (ack/nack en RabbitMQ). decode..enqueue
+se miden por evento; flush y ack por batch.
+
+Cada etapa se mide con perf_counter_ns y se acumula en memoria, en cubetas con los mismos
+límites que el histograma y un acumulador por hilo (con su propio lock, sin contención en
+el camino caliente). Nada se observa en Prometheus por evento:
+- En un proceso, un collector propio vuelca los acumulados de todos los hilos en cada
+  scrape y publica el histograma (HistogramMetricFamily) con los totales.
+- Con el supervisor (PROMETHEUS_MULTIPROC_DIR), el scrape no llega a los workers: cada
+  worker suma sus acumulados en Counters multiprocess por cubeta (`pipeline_stage_bucket`,
+  `pipeline_stage_time_seconds`) como mucho cada `export_interval_ms` o `max_pending`
+  observaciones, y además desde un hilo de fondo para no perder los de hilos que dejan de
+  observar. En el padre, StageHistogramCollector los convierte en el mismo histograma.
+
+Uso: `t = lap(DECODE, t)` tras cada etapa, una lectura de reloj por frontera.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from time import perf_counter_ns
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter
+from prometheus_client.core import HistogramMetricFamily, Metric
+from prometheus_client.utils import floatToGoString
+
+STAGE_METRICS_ENABLED = os.getenv("STAGE_METRICS_ENABLED", "true").lower() == "true"
+STAGE_METRICS_EXPORT_MS = int(os.getenv("STAGE_METRICS_EXPORT_MS", "1000"))
+
+STAGES = ("decode", "normalize", "tenant", "validate", "enqueue", "flush", "ack")
+DECODE, NORMALIZE, TENANT, VALIDATE, ENQUEUE, FLUSH, ACK = range(len(STAGES))
+
+STAGE_BUCKETS = (
+    0.00001,
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+METRIC_NAME = "pipeline_stage_seconds"
+METRIC_HELP = "Tiempo por etapa del pipeline de consumo"
+
+
+def _bucket_labels(buckets: Sequence[float]) -> List[str]:
+    return [floatToGoString(b) for b in buckets] + ["+Inf"]
+
+
+def _histogram_family(
+    name: str,
+    documentation: str,
+    stages: Sequence[str],
+    les: Sequence[str],
+    counts: Sequence[Sequence[float]],
+    sums: Sequence[float],
+) -> HistogramMetricFamily:
+    """Histograma con label `stage` a partir de cuentas por cubeta (no acumuladas) y sumas."""
+    family = HistogramMetricFamily(name, documentation, labels=["stage"])
+    for stage, stage_counts, total in zip(stages, counts, sums):
+        cumulative, running = [], 0.0
+        for le, c in zip(les, stage_counts):
+            running += c
+            cumulative.append((le, running))
+        family.add_metric([stage], cumulative, total)
+    return family
+
+
+class _Accumulator:
+    __slots__ = ("counts", "sums", "pending", "next_export", "lock")
+
+    def __init__(self, stages: int, buckets: int):
+        self.counts = [[0] * buckets for _ in range(stages)]
+        self.sums = [0] * stages
+        self.pending = 0
+        self.next_export = 0
+        self.lock = threading.Lock()
+
+
+class StageMetrics:
+    """
+    Acumulador por hilo de duraciones por etapa publicado como histograma `name{stage}`.
+    flush() vuelca los acumulados de todos los hilos (lo hace cada scrape en un proceso).
+    """
+
+    def __init__(
+        self,
+        name: str = METRIC_NAME,
+        documentation: str = METRIC_HELP,
+        registry: Optional[CollectorRegistry] = REGISTRY,
+        stages: Sequence[str] = STAGES,
+        buckets: Sequence[float] = STAGE_BUCKETS,
+        export_interval_ms: int = STAGE_METRICS_EXPORT_MS,
+        max_pending: int = 4096,
+        enabled: bool = True,
+        multiprocess: Optional[bool] = None,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.stages = tuple(stages)
+        self.enabled = enabled
+        self.export_interval_ns = export_interval_ms * 1_000_000
+        self.max_pending = max_pending
+        # Límites finitos en ns; el índice len(bounds) es la cubeta +Inf
+        self._bounds_ns = [int(b * 1e9) for b in buckets]
+        self._les = _bucket_labels(buckets)
+        self._buckets = len(self._les)
+        self._local = threading.local()
+        self._accumulators: List[_Accumulator] = []
+        # Totales desde el arranque: cuentas por cubeta y ns por etapa
+        self._counts = [[0] * self._buckets for _ in self.stages]
+        self._sums = [0] * len(self.stages)
+        self._lock = threading.Lock()
+        if multiprocess is None:
+            multiprocess = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+        self.multiprocess = multiprocess
+        self._flusher_pid: Optional[int] = None
+        if multiprocess:
+            bucket_name, seconds_name = _multiprocess_names(name)
+            self._bucket_counter = Counter(
+                bucket_name, f"{documentation} (cubetas)", ["stage", "le"], registry=registry
+            )
+            self._seconds_counter = Counter(
+                seconds_name, f"{documentation} (suma)", ["stage"], registry=registry
+            )
+        elif registry is not None:
+            registry.register(self)
+
+    def _new_accumulator(self) -> _Accumulator:
+        acc = _Accumulator(len(self.stages), self._buckets)
+        acc.next_export = perf_counter_ns() + self.export_interval_ns
+        self._local.acc = acc
+        with self._lock:
+            self._accumulators.append(acc)
+        if self.multiprocess and self._flusher_pid != os.getpid():
+            self._start_flusher()
+        return acc
+
+    def _start_flusher(self) -> None:
+        # Tras un fork el hilo del padre no existe en el hijo: uno por proceso
+        self._flusher_pid = os.getpid()
+        interval = max(self.export_interval_ns / 1e9, 0.1)
+
+        def run() -> None:
+            while True:
+                time.sleep(interval)
+                self.flush()
+
+        threading.Thread(target=run, name="stage-metrics-flush", daemon=True).start()
+
+    def observe_ns(self, stage: int, ns: int, now: Optional[int] = None) -> None:
+        if not self.enabled:
+            return
+        try:
+            acc = self._local.acc
+        except AttributeError:
+            acc = self._new_accumulator()
+        with acc.lock:
+            acc.counts[stage][bisect_left(self._bounds_ns, ns)] += 1
+            acc.sums[stage] += ns
+            acc.pending += 1
+            due = acc.pending >= self.max_pending or (now or perf_counter_ns()) >= acc.next_export
+        if due:
+            self._export(acc)
+
+    def lap(self, stage: int, start_ns: int) -> int:
+        """Registra la etapa desde `start_ns` y devuelve el instante actual (inicio de la siguiente)."""
+        if not self.enabled:
+            return start_ns
+        now = perf_counter_ns()
+        ns = now - start_ns
+        # observe_ns en línea: una llamada menos por etapa
+        try:
+            acc = self._local.acc
+        except AttributeError:
+            acc = self._new_accumulator()
+        with acc.lock:
+            acc.counts[stage][bisect_left(self._bounds_ns, ns)] += 1
+            acc.sums[stage] += ns
+            acc.pending += 1
+            due = acc.pending >= self.max_pending or now >= acc.next_export
+        if due:
+            self._export(acc)
+        return now
+
+    def _export(self, acc: _Accumulator) -> None:
+        with acc.lock:
+            counts, sums = acc.counts, acc.sums
+            # Se sustituyen bajo el lock: el hilo dueño sigue acumulando en las nuevas
+            acc.counts = [[0] * self._buckets for _ in self.stages]
+            acc.sums = [0] * len(self.stages)
+            acc.pending = 0
+            acc.next_export = perf_counter_ns() + self.export_interval_ns
+        with self._lock:
+            for stage, stage_counts in enumerate(counts):
+                if not sums[stage] and not any(stage_counts):
+                    continue
+                totals = self._counts[stage]
+                for i, c in enumerate(stage_counts):
+                    totals[i] += c
+                self._sums[stage] += sums[stage]
+        if self.multiprocess:
+            for stage, stage_counts in enumerate(counts):
+                if not any(stage_counts):
+                    continue
+                name = self.stages[stage]
+                for le, c in zip(self._les, stage_counts):
+                    if c:
+                        self._bucket_counter.labels(stage=name, le=le).inc(c)
+                self._seconds_counter.labels(stage=name).inc(sums[stage] / 1e9)
+
+    def flush(self) -> None:
+        with self._lock:
+            accumulators = list(self._accumulators)
+        for acc in accumulators:
+            self._export(acc)
+
+    def collect(self) -> Iterator[Metric]:
+        """Collector de un proceso: vuelca y publica los totales como histograma."""
+        self.flush()
+        with self._lock:
+            counts = [list(c) for c in self._counts]
+            sums = [ns / 1e9 for ns in self._sums]
+        yield _histogram_family(self.name, self.documentation, self.stages, self._les, counts, sums)
+
+    def describe(self) -> Iterator[Metric]:
+        # Evita que register() llame a collect() (y vuelque) al registrarse
+        yield HistogramMetricFamily(self.name, self.documentation, labels=["stage"])
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Observaciones y media en µs por etapa desde el arranque (vuelca antes)."""
+        self.flush()
+        with self._lock:
+            totals = [(sum(c), ns) for c, ns in zip(self._counts, self._sums)]
+        return {
+            name: {"count": n, "mean_us": round(ns / n / 1000, 3) if n else 0.0}
+            for name, (n, ns) in zip(self.stages, totals)
+        }
+
+
+def _multiprocess_names(name: str) -> Tuple[str, str]:
+    base = name[: -len("_seconds")] if name.endswith("_seconds") else name
+    return f"{base}_bucket", f"{base}_time_seconds"
+
+
+class StageHistogramCollector:
+    """
+    Collector del padre multiprocess: envuelve `source` (p.ej. MultiProcessCollector) y
+    sustituye los Counters por cubeta de los workers por el histograma `name{stage}`.
+    """
+
+    def __init__(self, source, name: str = METRIC_NAME, documentation: str = METRIC_HELP):
+        self.source = source
+        self.name = name
+        self.documentation = documentation
+        bucket_name, seconds_name = _multiprocess_names(name)
+        self._bucket_sample = f"{bucket_name}_total"
+        self._seconds_sample = f"{seconds_name}_total"
+        self._families = {bucket_name, seconds_name}
+
+    def collect(self) -> Iterator[Metric]:
+        buckets: Dict[str, Dict[str, float]] = {}
+        sums: Dict[str, float] = {}
+        for metric in self.source.collect():
+            if metric.name not in self._families:
+                yield metric
+                continue
+            for s in metric.samples:
+                if s.name == self._bucket_sample:
+                    per_stage = buckets.setdefault(s.labels["stage"], {})
+                    per_stage[s.labels["le"]] = per_stage.get(s.labels["le"], 0.0) + s.value
+                elif s.name == self._seconds_sample:
+                    stage = s.labels["stage"]
+                    sums[stage] = sums.get(stage, 0.0) + s.value
+        if not buckets:
+            return
+        # Sólo existen las cubetas con alguna observación: se completan con las de STAGE_BUCKETS
+        observed = {le for per in buckets.values() for le in per}
+        les = sorted(observed.union(_bucket_labels(STAGE_BUCKETS)), key=float)
+        stages = [s for s in STAGES if s in buckets] + sorted(set(buckets) - set(STAGES))
+        counts = [[buckets[s].get(le, 0.0) for le in les] for s in stages]
+        yield _histogram_family(
+            self.name, self.documentation, stages, les, counts, [sums.get(s, 0.0) for s in stages]
+        )
+
+
+STAGE_METRICS = StageMetrics(enabled=STAGE_METRICS_ENABLED)
+lap = STAGE_METRICS.lap
+observe_ns = STAGE_METRICS.observe_ns
+flush = STAGE_METRICS.flush
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Motor de consumo asyncio (CONSUMER_ENGINE=asyncio).
+aio-pika + AsyncOpenSearch: la decodificación/normalización de mensajes nuevos se solapa con
+los _bulk en vuelo, en lugar de bloquear el I/O loop de pika durante client.bulk().
+Reutiliza process_message (normalize, prepare_event, checks de tenant y schema) de consumer.py.
+Siempre indexa vía _bulk; el ack (multiple=True) se envía tras cada flush correcto. Reintentos
+por item, spool y controlador adaptativo son los de BulkIndexer (BulkSend).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from time import perf_counter_ns
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from backend.app.core.config import settings
+from backend.app.core.logging import configure_logging
+from backend.app.metrics import profiling, stages
+from backend.app.metrics.counters import BUFFER_SIZE
+from backend.app.metrics.stages import lap as stage_lap
+from backend.app.processing import consumer
+from backend.app.processing.backpressure import CONSUMER_PAUSED, CONSUMER_PAUSES
+from backend.app.processing.bulk_controller import AdaptiveBulkController
+from backend.app.processing.bulk_indexer import BulkIndexer, BulkSend, NdjsonEncoder
+from backend.app.processing.dedup import RecentIdFilter, event_document_id
+from backend.app.processing.spool import DiskSpool, SpoolReplayer
+
+try:
+    import aio_pika
+except Exception:
+    aio_pika = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPending(NamedTuple):
+    """Mensaje AMQP en buffer bulk pendiente de ack."""
+
+    message: Any
+    tenant_id: str
+    doc_id: Optional[str] = None
+
+
+SettleFn = Callable[[List[Any], List[Tuple[Any, str]]], Awaitable[None]]
+
+
+class AsyncBulkPipeline:
+    """
+    Buffer bulk asíncrono: hasta `max_in_flight` _bulk concurrentes.
+    Las liquidaciones (ack/DLX) se hacen en orden de flush para que multiple=True sea seguro.
+
+    Mismo tratamiento de la respuesta que BulkIndexer (BulkSend): los items con 429/5xx se
+    reintentan solos con backoff, los que agotan reintentos van al `spool` si lo hay, y con
+    `controller` el tamaño de batch y los bulks en vuelo se ajustan en caliente.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        settle: SettleFn,
+        max_items: int = 500,
+        max_interval_ms: int = 1000,
+        max_in_flight: int = 2,
+        default_pipeline: Optional[str] = None,
+        max_bytes: int = 5 * 1024 * 1024,
+        max_retries: int = 3,
+        retry_backoff_ms: int = 200,
+        controller: Optional[AdaptiveBulkController] = None,
+        spool: Optional[DiskSpool] = None,
+    ):
+        self.client = client
+        self.settle = settle
+        self.max_items = max_items
+        self.max_interval_ms = max_interval_ms
+        self.max_in_flight = max(1, max_in_flight)
+        self.default_pipeline = default_pipeline
+        self.max_bytes = max_bytes
+        self.max_retries = max_retries
+        self.retry_backoff_ms = retry_backoff_ms
+        self.spool = spool
+        # Con controlador adaptativo max_items / max_in_flight pasan a ser sus setpoints
+        self.controller = controller
+        if controller is not None:
+            self.max_items = controller.batch_size
+            self.max_in_flight = controller.concurrency
+        self.encoder = NdjsonEncoder()
+        self._payload: List[bytes] = []
+        self._payload_bytes = 0
+        self._refs: List[Any] = []
+        self._first_ts = 0.0
+        self._in_flight = 0
+        self._slots = asyncio.Condition()
+        self._tasks: Set[asyncio.Task] = set()
+        self._last_settled: Optional[asyncio.Future] = None
+
+    async def add(
+        self, index: str, doc: Dict[str, Any], ref: Any = None, doc_id: Optional[str] = None
+    ) -> None:
+        line = self.encoder.encode(index, doc, self.default_pipeline, doc_id)
+        if self._refs and self._payload_bytes + len(line) > self.max_bytes:
+            await self.flush()
+        if not self._refs:
+            self._first_ts = time.monotonic()
+        self._payload.append(line)
+        self._payload_bytes += len(line)
+        self._refs.append(ref)
+        BUFFER_SIZE.set(len(self._refs))
+        if len(self._refs) >= self.max_items or self._payload_bytes >= self.max_bytes:
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self._refs:
+            return
+        actions, refs = self._payload, self._refs
+        self._payload, self._refs = [], []
+        self._payload_bytes = 0
+        BUFFER_SIZE.set(0)
+        # Se encadena en orden de corte, antes de esperar slot: otro flush (timer o handler)
+        # puede conseguir slot antes y no debe liquidar (ack multiple) por delante de éste
+        prev = self._last_settled
+        done = asyncio.get_running_loop().create_future()
+        self._last_settled = done
+        try:
+            await self._acquire_slot()
+        except BaseException:
+            # Cancelado sin enviar: el siguiente batch sólo espera a los anteriores
+            if prev is None:
+                done.set_result(None)
+            else:
+                prev.add_done_callback(lambda _: done.set_result(None))
+            raise
+        task = asyncio.create_task(self._send(actions, refs, prev, done))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _acquire_slot(self) -> None:
+        async with self._slots:
+            if self._in_flight < self.max_in_flight:
+                self._in_flight += 1
+                return
+            # Backpressure: con max_in_flight bulks en curso se deja de leer de la cola
+            CONSUMER_PAUSED.set(1)
+            CONSUMER_PAUSES.inc()
+            try:
+                await self._slots.wait_for(lambda: self._in_flight < self.max_in_flight)
+                self._in_flight += 1
+            finally:
+                CONSUMER_PAUSED.set(0)
+
+    async def _release_slot(self) -> None:
+        async with self._slots:
+            self._in_flight -= 1
+            # También despierta si el controlador ha subido max_in_flight
+            self._slots.notify_all()
+
+    def _observe(
+        self, latency: float, took_ms: Optional[float], rejected: int, failed: bool
+    ) -> None:
+        if self.controller is None:
+            return
+        self.controller.observe(latency, took_ms=took_ms, rejected=rejected, failed=failed)
+        self.max_items = self.controller.batch_size
+        self.max_in_flight = self.controller.concurrency
+
+    async def _send(
+        self,
+        actions: List[bytes],
+        refs: List[Any],
+        prev: Optional[asyncio.Future],
+        done: asyncio.Future,
+    ) -> None:
+        send = BulkSend(
+            actions,
+            refs,
+            max_retries=self.max_retries,
+            retry_backoff_ms=self.retry_backoff_ms,
+            spool=self.spool,
+            observe=self._observe,
+        )
+        try:
+            while True:
+                start = time.time()
+                start_ns = perf_counter_ns()
+                try:
+                    resp = await self.client.bulk(body=send.body(), refresh=False)
+                    stage_lap(stages.FLUSH, start_ns)
+                    send.on_response(resp, time.time() - start)
+                except Exception as e:
+                    send.on_error(e, time.time() - start)
+                delay = send.next_delay()
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
+            if send.spools:
+                # Escritura (y fsync) del spool fuera del event loop
+                result = await asyncio.get_running_loop().run_in_executor(None, send.finish)
+            else:
+                result = send.finish()
+            ok, failed = result.ok, result.failed
+        except Exception as e:
+            ok, failed = [], [(ref, "bulk_failed") for ref in refs]
+            logger.exception("bulk_flush_failed", extra={"items": len(refs), "error": str(e)})
+        finally:
+            await self._release_slot()
+            consumer.EVENTS_BULK_FLUSHES.inc()
+        try:
+            if prev is not None:
+                await prev
+            await self.settle(ok, failed)
+        except Exception:
+            logger.exception("bulk_settle_failed")
+        finally:
+            done.set_result(None)
+
+    async def run_timer(self) -> None:
+        # Flush por intervalo aunque no lleguen mensajes
+        interval = self.max_interval_ms / 1000.0
+        while True:
+            await asyncio.sleep(min(interval, 0.25))
+            # cProfile pedido por /debug/profile/cprofile: se activa en el hilo del event loop
+            profiling.poll()
+            if self._refs and time.monotonic() - self._first_ts >= interval:
+                await self.flush()
+
+    async def close(self) -> None:
+        await self.flush()
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+
+async def _publish_dlx(dlx_exchange, message, reason: str) -> None:
+    await dlx_exchange.publish(
+        aio_pika.Message(body=message.body, headers={"x-reject-reason": reason}),
+        routing_key=message.routing_key or "unknown",
+    )
+    consumer.EVENTS_NACKED.inc()
+    consumer.EVENTS_NACKED_BY_REASON.labels(reason=reason).inc()
+
+
+async def _reject(dlx_exchange, message, reason: str) -> None:
+    if consumer.USE_MANUAL_DLX:
+        await _publish_dlx(dlx_exchange, message, reason)
+        await message.ack()
+    else:
+        await message.reject(requeue=False)
+        consumer.EVENTS_NACKED.inc()
+        consumer.EVENTS_NACKED_BY_REASON.labels(reason=reason).inc()
+
+
+def make_settle(dlx_exchange) -> SettleFn:
+    async def settle(ok: List[AsyncPending], failed: List[Tuple[AsyncPending, str]]) -> None:
+        t = perf_counter_ns()
+        ack_upto = None
+        for ref, reason in failed:
+            consumer.EVENTS_INDEX_FAILED.inc()
+            logger.warning(
+                "bulk_item_rejected", extra={"tenant_id": ref.tenant_id, "reject_reason": reason}
+            )
+            if consumer.USE_MANUAL_DLX:
+                await _publish_dlx(dlx_exchange, ref.message, reason)
+                if ack_upto is None or ref.message.delivery_tag > ack_upto.delivery_tag:
+                    ack_upto = ref.message
+            else:
+                await ref.message.reject(requeue=False)
+                consumer.EVENTS_NACKED.inc()
+                consumer.EVENTS_NACKED_BY_REASON.labels(reason=reason).inc()
+        for ref in ok:
+            consumer.EVENTS_INDEXED.inc()
+            consumer.EVENTS_INDEXED_BY_TENANT.labels(tenant_id=ref.tenant_id).inc()
+            consumer.remember_indexed(ref.doc_id)
+            if ack_upto is None or ref.message.delivery_tag > ack_upto.delivery_tag:
+                ack_upto = ref.message
+        if ack_upto is not None:
+            await ack_upto.ack(multiple=True)
+        stage_lap(stages.ACK, t)
+
+    return settle
+
+
+async def _consume(
+    validators,
+    controller: Optional[AdaptiveBulkController] = None,
+    spool: Optional[DiskSpool] = None,
+) -> None:
+    from backend.app.core.opensearch_client import get_async_client
+
+    connection = await aio_pika.connect_robust(
+        host=settings.rabbitmq_host,
+        port=int(os.getenv("RABBITMQ_PORT", "5672")),
+        login=settings.rabbitmq_user,
+        password=settings.rabbitmq_password,
+        virtualhost=os.getenv("RABBITMQ_VHOST", "/"),
+    )
+    client = get_async_client()
+    max_in_flight = consumer.BULK_MAX_IN_FLIGHT
+    # Un batch en buffer + max_in_flight batches sin ack (los máximos del controlador)
+    max_items = controller.max_batch_size if controller else consumer.BULK_MAX_ITEMS
+    max_batches = (controller.max_concurrency if controller else max_in_flight) + 1
+    prefetch = max(consumer.CONSUMER_PREFETCH, max_items * max_batches)
+    async with connection:
+        channel = await connection.channel()
+        await channel.set_qos(prefetch_count=prefetch)
+        exchange = await channel.declare_exchange(
+            settings.rabbitmq_exchange, aio_pika.ExchangeType.TOPIC, durable=True
+        )
+        dlx_exchange = await channel.declare_exchange(
+            consumer.MANUAL_DLX_EXCHANGE, aio_pika.ExchangeType.TOPIC, durable=True
+        )
+        queue = await channel.declare_queue(
+            settings.rabbitmq_queue,
+            durable=True,
+            arguments={"x-dead-letter-exchange": settings.rabbitmq_dlx},
+        )
+        await queue.bind(exchange, routing_key=settings.rabbitmq_routing_key)
+
+        pipeline = AsyncBulkPipeline(
+            client=client,
+            settle=make_settle(dlx_exchange),
+            max_items=consumer.BULK_MAX_ITEMS,
+            max_interval_ms=consumer.BULK_MAX_INTERVAL_MS,
+            max_in_flight=max_in_flight,
+            default_pipeline="logs_ingest",
+            max_bytes=consumer.BULK_MAX_BYTES,
+            max_retries=consumer.BULK_RETRY_MAX,
+            retry_backoff_ms=consumer.BULK_RETRY_BACKOFF_MS,
+            controller=controller,
+            spool=spool,
+        )
+        timer = asyncio.create_task(pipeline.run_timer())
+        logger.info(
+            "consumer_started",
+            extra={
+                "engine": "asyncio",
+                "queue": settings.rabbitmq_queue,
+                "exchange": settings.rabbitmq_exchange,
+                "manual_dlx": consumer.USE_MANUAL_DLX,
+                "prefetch": prefetch,
+                "max_in_flight": max_in_flight,
+                "adaptive": controller is not None,
+                "spool": spool is not None,
+            },
+        )
+        try:
+            async with queue.iterator() as it:
+                async for message in it:
+                    consumer.EVENTS_PROCESSED.inc()
+                    try:
+                        evt = consumer.process_message(message.body, validators)
+                    except consumer.EventRejected as rej:
+                        await _reject(dlx_exchange, message, rej.reason)
+                        continue
+                    except Exception:
+                        logger.exception("processing_failed")
+                        await _reject(dlx_exchange, message, "processing_exception")
+                        continue
+                    tenant = evt["tenant_id"]
+                    doc_id = event_document_id(evt) if consumer.DETERMINISTIC_IDS else None
+                    if consumer.is_recent_duplicate(doc_id, message.redelivered, message.headers):
+                        await message.ack()
+                        continue
+                    t = perf_counter_ns()
+                    await pipeline.add(
+                        f"logs-{tenant}", evt, AsyncPending(message, tenant, doc_id), doc_id
+                    )
+                    stage_lap(stages.ENQUEUE, t)
+        finally:
+            timer.cancel()
+            try:
+                await pipeline.close()
+            except Exception:
+                logger.exception("final_bulk_flush_failed")
+            for event_log in (
+                consumer.INDEXED_LOG,
+                consumer.HOST_MAPPED_LOG,
+                consumer.DUPLICATE_LOG,
+            ):
+                event_log.flush()
+            await client.close()
+
+
+def main(start_metrics_server: bool = True) -> None:
+    from backend.app.core.opensearch_client import AsyncOpenSearch
+
+    if aio_pika is None or AsyncOpenSearch is None:
+        logger.error("async_engine_unavailable", extra={"requires": ["aio-pika", "aiohttp"]})
+        return
+    if start_metrics_server:
+        consumer.start_metrics()
+    validators = consumer.init_processing()
+    if consumer.DETERMINISTIC_IDS and consumer.DEDUP_FILTER_ENABLED:
+        consumer.recent_ids = RecentIdFilter(
+            consumer.DEDUP_FILTER_CAPACITY, consumer.DEDUP_FILTER_ERROR_RATE
+        )
+    try:
+        import uvloop
+
+        uvloop.install()
+    except Exception:
+        pass
+    controller = consumer.build_bulk_controller()
+    spool = consumer.open_spool() if consumer.SPOOL_ENABLED else None
+    replayer: Optional[SpoolReplayer] = None
+    if spool is not None:
+        # Replay síncrono en su hilo, con el mismo send_raw que el motor blocking
+        replay_indexer = BulkIndexer(
+            client=consumer.get_es(),
+            max_retries=consumer.BULK_RETRY_MAX,
+            retry_backoff_ms=consumer.BULK_RETRY_BACKOFF_MS,
+        )
+        replayer = consumer.start_spool_replayer(spool, replay_indexer)
+    try:
+        asyncio.run(_consume(validators, controller, spool))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if replayer is not None:
+            replayer.stop(timeout=30.0)
+        if spool is not None:
+            spool.close()
+
+
+if __name__ == "__main__":
+    configure_logging(level=os.getenv("LOG_LEVEL", "INFO"))
+    main()
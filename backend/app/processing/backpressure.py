@@ -0,0 +1,65 @@
+import logging
+from typing import Optional
+
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+CONSUMER_PAUSED = Gauge(
+    "consumer_paused",
+    "1 si el consumo está pausado por backpressure del indexado",
+    multiprocess_mode="livesum",
+)
+CONSUMER_PAUSES = Counter("consumer_pauses_total", "Pausas de consumo por backpressure")
+
+
+class BackpressureGate:
+    """
+    Histéresis de pausa/reanudación del consumo según la presión del camino de indexado.
+
+    Pausa si los bytes pendientes (buffer + bulks en vuelo) alcanzan `high_bytes` y reanuda
+    cuando bajan de `low_bytes`. Mientras está pausado el backlog queda en RabbitMQ en lugar
+    de en memoria.
+
+    Con flush en segundo plano tener todos los slots ocupados es el estado normal (add() ya
+    espera a que se libere uno), así que por defecto no pausa por bulks en vuelo: cada pausa
+    devuelve a la cola los mensajes recibidos y provoca redelivery. Con `use_in_flight`
+    también pausa con todos los slots ocupados, y reanuda cuando queda en vuelo menos de la
+    mitad del límite (ninguno con el límite por defecto de 2).
+    """
+
+    def __init__(
+        self, high_bytes: int, low_bytes: Optional[int] = None, use_in_flight: bool = False
+    ):
+        self.high_bytes = max(1, high_bytes)
+        self.low_bytes = self.high_bytes // 2 if low_bytes is None else min(low_bytes, high_bytes)
+        self.use_in_flight = use_in_flight
+        self.paused = False
+        CONSUMER_PAUSED.set(0)
+
+    def update(self, pending_bytes: int, in_flight: int, max_in_flight: int) -> Optional[bool]:
+        """
+        Evalúa la presión actual. Devuelve True al pasar a pausado, False al reanudar y
+        None si no hay cambio de estado.
+        """
+        if not self.paused:
+            saturated = self.use_in_flight and max_in_flight > 0 and in_flight >= max_in_flight
+            if pending_bytes >= self.high_bytes or saturated:
+                self.paused = True
+                CONSUMER_PAUSED.set(1)
+                CONSUMER_PAUSES.inc()
+                logger.warning(
+                    "consumer_paused",
+                    extra={"pending_bytes": pending_bytes, "in_flight": in_flight},
+                )
+                return True
+            return None
+        drained = not self.use_in_flight or in_flight <= (max_in_flight - 1) // 2
+        if pending_bytes <= self.low_bytes and drained:
+            self.paused = False
+            CONSUMER_PAUSED.set(0)
+            logger.info(
+                "consumer_resumed", extra={"pending_bytes": pending_bytes, "in_flight": in_flight}
+            )
+            return False
+        return None
@@ -0,0 +1,127 @@
+import logging
+import threading
+from typing import Optional
+
+from prometheus_client import Gauge
+
+logger = logging.getLogger(__name__)
+
+BULK_BATCH_SIZE_SETPOINT = Gauge(
+    "bulk_batch_size_setpoint",
+    "Tamaño de batch bulk actual (controlador adaptativo)",
+    multiprocess_mode="livesum",
+)
+BULK_CONCURRENCY_SETPOINT = Gauge(
+    "bulk_concurrency_setpoint",
+    "Bulks concurrentes permitidos (controlador adaptativo)",
+    multiprocess_mode="livesum",
+)
+BULK_LATENCY_EWMA = Gauge(
+    "bulk_latency_ewma_seconds", "Latencia _bulk suavizada (EWMA)", multiprocess_mode="max"
+)
+BULK_TOOK_EWMA = Gauge(
+    "bulk_took_ewma_ms", "Campo took de OpenSearch suavizado (EWMA)", multiprocess_mode="max"
+)
+
+
+class AdaptiveBulkController:
+    """
+    Controlador AIMD del tamaño de batch y la concurrencia del BulkIndexer.
+
+    - Rechazos 429 / fallo de request: decremento multiplicativo (primero concurrencia,
+      luego batch).
+    - Latencia EWMA por encima del objetivo: decremento multiplicativo suave del batch.
+    - Latencia sana: incremento aditivo del batch; en el techo, +1 de concurrencia.
+    Cada ajuste espera `cooldown` observaciones para no oscilar.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 500,
+        min_batch_size: int = 50,
+        max_batch_size: int = 2000,
+        concurrency: int = 1,
+        max_concurrency: int = 4,
+        target_latency_ms: float = 500.0,
+        additive_step: int = 50,
+        decrease_factor: float = 0.5,
+        latency_decrease_factor: float = 0.8,
+        ewma_alpha: float = 0.3,
+        cooldown: int = 3,
+    ):
+        self.min_batch_size = max(1, min_batch_size)
+        self.max_batch_size = max(self.min_batch_size, max_batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.batch_size = self._clamp_batch(batch_size)
+        self.concurrency = min(max(1, concurrency), self.max_concurrency)
+        self.target_latency = target_latency_ms / 1000.0
+        self.additive_step = max(1, additive_step)
+        self.decrease_factor = decrease_factor
+        self.latency_decrease_factor = latency_decrease_factor
+        self.ewma_alpha = ewma_alpha
+        self.cooldown = max(1, cooldown)
+        self.latency_ewma: Optional[float] = None
+        self.took_ewma: Optional[float] = None
+        self._since_change = 0
+        self._lock = threading.Lock()
+        self._export()
+
+    def _clamp_batch(self, n: float) -> int:
+        return int(min(max(n, self.min_batch_size), self.max_batch_size))
+
+    def _export(self) -> None:
+        BULK_BATCH_SIZE_SETPOINT.set(self.batch_size)
+        BULK_CONCURRENCY_SETPOINT.set(self.concurrency)
+        if self.latency_ewma is not None:
+            BULK_LATENCY_EWMA.set(self.latency_ewma)
+        if self.took_ewma is not None:
+            BULK_TOOK_EWMA.set(self.took_ewma)
+
+    def _smooth(self, prev: Optional[float], value: float) -> float:
+        return value if prev is None else prev + self.ewma_alpha * (value - prev)
+
+    def observe(
+        self,
+        latency_seconds: float,
+        took_ms: Optional[float] = None,
+        rejected: int = 0,
+        failed: bool = False,
+    ) -> None:
+        """Registra el resultado de una request _bulk y ajusta los setpoints."""
+        with self._lock:
+            if not failed:
+                self.latency_ewma = self._smooth(self.latency_ewma, latency_seconds)
+                if took_ms is not None:
+                    self.took_ewma = self._smooth(self.took_ewma, float(took_ms))
+            self._since_change += 1
+            before = (self.batch_size, self.concurrency)
+
+            if rejected or failed:
+                # Congestión explícita: reaccionar ya, sin esperar cooldown
+                if self.concurrency > 1:
+                    self.concurrency = max(1, int(self.concurrency * self.decrease_factor))
+                else:
+                    self.batch_size = self._clamp_batch(self.batch_size * self.decrease_factor)
+            elif self._since_change >= self.cooldown and self.latency_ewma is not None:
+                if self.latency_ewma > self.target_latency:
+                    self.batch_size = self._clamp_batch(
+                        self.batch_size * self.latency_decrease_factor
+                    )
+                elif self.batch_size < self.max_batch_size:
+                    self.batch_size = self._clamp_batch(self.batch_size + self.additive_step)
+                elif self.concurrency < self.max_concurrency:
+                    self.concurrency += 1
+
+            if (self.batch_size, self.concurrency) != before:
+                self._since_change = 0
+                logger.info(
+                    "bulk_setpoints_changed",
+                    extra={
+                        "batch_size": self.batch_size,
+                        "concurrency": self.concurrency,
+                        "latency_ewma_seconds": self.latency_ewma,
+                        "rejected": rejected,
+                        "failed": failed,
+                    },
+                )
+            self._export()
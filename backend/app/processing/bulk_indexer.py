@@ -1,24 +1,137 @@
 import logging
+import random
+import threading
 import time
-from typing import Any, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from time import perf_counter_ns
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from opensearchpy import OpenSearch
-from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client import Counter, Gauge
+
+from backend.app.core import json_codec
+from backend.app.metrics.counters import BUFFER_SIZE, INDEX_LATENCY
+from backend.app.metrics.stages import FLUSH
+from backend.app.metrics.stages import lap as stage_lap
+from backend.app.processing.bulk_controller import AdaptiveBulkController
+from backend.app.processing.spool import DiskSpool
 
 logger = logging.getLogger(__name__)
 
-INDEX_LATENCY = Histogram(
-    "index_latency_seconds",
-    "Latencia por flush bulk o documento individual",
-    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0),
-)
-BUFFER_SIZE = Gauge("consumer_buffer_size", "Número de eventos en buffer bulk")
+MAX_RETRY_BACKOFF_MS = 10_000
+
 BULK_ERRORS = Counter("bulk_errors_total", "Errores en flush bulk")
+BULK_ITEM_ERRORS = Counter(
+    "bulk_item_errors_total",
+    "Items con error en respuestas _bulk",
+    ["error_type", "retryable"],
+)
+BULK_DUPLICATES = Counter(
+    "bulk_item_duplicates_total", "Items create con 409 (documento ya indexado con ese _id)"
+)
+BULK_RETRIES = Counter("bulk_item_retries_total", "Items reenviados tras error transitorio")
+BUFFER_BYTES = Gauge(
+    "consumer_buffer_bytes", "Bytes NDJSON en buffer bulk", multiprocess_mode="livesum"
+)
+BULK_IN_FLIGHT = Gauge(
+    "bulk_in_flight", "Flushes bulk en curso en segundo plano", multiprocess_mode="livesum"
+)
+
+
+@dataclass
+class FlushResult:
+    """
+    Resultado de un flush: refs de items indexados y (ref, motivo) de los fallidos.
+    `ref` es el valor opaco pasado a add() (p.ej. delivery tag del consumer).
+    """
+
+    items: int = 0
+    ok: List[Any] = field(default_factory=list)
+    failed: List[Tuple[Any, str]] = field(default_factory=list)
+    # Items escritos en el spool local (incluidos en ok: ya están en disco)
+    spooled: int = 0
+    # Items de `failed` cuyo error era transitorio (429/5xx/fallo de request)
+    transient_failures: int = 0
+
+
+@dataclass
+class _Batch:
+    seq: int
+    actions: List[bytes]
+    refs: List[Any]
+    nbytes: int = 0
+
+
+class NdjsonEncoder:
+    """
+    Serializa acciones _bulk a NDJSON (cabecera + documento) una única vez, en add().
+    Las cabeceras se cachean por (índice, pipeline). Con `doc_id` la acción es `create`
+    con ese _id (un 409 posterior indica que el documento ya estaba indexado).
+    """
+
+    def __init__(self):
+        self._headers: Dict[Tuple[str, Optional[str]], bytes] = {}
+        self._create_prefixes: Dict[Tuple[str, Optional[str]], bytes] = {}
+
+    def header(self, index: str, pipeline: Optional[str]) -> bytes:
+        key = (index, pipeline)
+        h = self._headers.get(key)
+        if h is None:
+            meta: Dict[str, Any] = {"_index": index}
+            if pipeline:
+                meta["pipeline"] = pipeline
+            h = _dumps({"index": meta}) + b"\n"
+            self._headers[key] = h
+        return h
+
+    def create_header(self, index: str, pipeline: Optional[str], doc_id: str) -> bytes:
+        key = (index, pipeline)
+        prefix = self._create_prefixes.get(key)
+        if prefix is None:
+            meta: Dict[str, Any] = {"_index": index}
+            if pipeline:
+                meta["pipeline"] = pipeline
+            # '{"create":{...,"_id":' ; el _id se añade por acción
+            prefix = _dumps({"create": meta})[:-2] + b',"_id":'
+            self._create_prefixes[key] = prefix
+        return prefix + _dumps(doc_id) + b"}}\n"
+
+    def encode(
+        self,
+        index: str,
+        doc: Dict[str, Any],
+        pipeline: Optional[str] = None,
+        doc_id: Optional[str] = None,
+    ) -> bytes:
+        if doc_id is not None:
+            return self.create_header(index, pipeline, doc_id) + _dumps(doc) + b"\n"
+        return self.header(index, pipeline) + _dumps(doc) + b"\n"
+
+
+# Compacto, a bytes UTF-8; orjson si está instalado (ver core.json_codec)
+_dumps = json_codec.dumps
 
 
 class BulkIndexer:
     """
-    Buffer simple en memoria; flush por tamaño o intervalo.
+    Buffer en memoria; flush por tamaño o intervalo.
+    Si se pasa on_flush, se invoca con el FlushResult de cada flush (ack diferido), siempre
+    en el orden en que se cortaron los batches.
+
+    Los items con 429/5xx se reintentan (max_retries, backoff con jitter); los errores
+    permanentes llegan en FlushResult.failed con el tipo de error como motivo.
+
+    Con `spool` (DiskSpool) los items que agotan reintentos por error transitorio
+    (cluster caído, 429/5xx) se escriben en disco y se reportan como ok; SpoolReplayer
+    los reenvía con send_raw() cuando vuelve el cluster.
+
+    Con `controller` (AdaptiveBulkController) el tamaño de batch y la concurrencia se
+    ajustan en caliente a partir de latencia, `took` y rechazos 429.
+
+    Con start() arranca un hilo temporizador que fuerza el flush por intervalo aunque no
+    lleguen eventos. Con background=True el batch lleno se cambia por un buffer nuevo y se
+    envía en un hilo worker (máx. max_in_flight en curso; add() espera si se alcanza).
     """
 
     def __init__(
@@ -27,59 +140,412 @@ class BulkIndexer:
         max_items: int = 500,
         max_interval_ms: int = 1000,
         default_pipeline: Optional[str] = None,
+        on_flush: Optional[Callable[[FlushResult], None]] = None,
+        background: bool = False,
+        max_in_flight: int = 1,
+        max_bytes: int = 5 * 1024 * 1024,
+        max_retries: int = 3,
+        retry_backoff_ms: int = 200,
+        controller: Optional[AdaptiveBulkController] = None,
+        spool: Optional[DiskSpool] = None,
     ):
         self.client = client
         self.max_items = max_items
         self.max_interval_ms = max_interval_ms
         self.default_pipeline = default_pipeline
-        self.buffer: List[Dict[str, Any]] = []
+        self.on_flush = on_flush
+        self.background = background
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_bytes = max_bytes
+        self.max_retries = max_retries
+        self.retry_backoff_ms = retry_backoff_ms
+        self.spool = spool
+        # Con controlador adaptativo max_items / max_in_flight pasan a ser sus setpoints
+        self.controller = controller
+        if controller is not None:
+            self.max_items = controller.batch_size
+            self.max_in_flight = controller.concurrency
+        self.encoder = NdjsonEncoder()
+        self.buffer: List[bytes] = []
+        self.buffer_bytes = 0
+        self.refs: List[Any] = []
+        self.first_add_ts = 0.0
         self.last_flush_ts = time.time()
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._in_flight_bytes = 0
+        self._in_flight_cond = threading.Condition()
+        self._seq = 0
+        self._next_delivery = 0
+        self._completed: Dict[int, FlushResult] = {}
+        self._delivery_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._timer: Optional[threading.Thread] = None
+        self._stop = threading.Event()
         BUFFER_SIZE.set(0)
+        BUFFER_BYTES.set(0)
 
-    def add(self, index: str, doc: Dict[str, Any], pipeline: Optional[str] = None):
-        action = {
-            "_index": index,
-            "_source": doc,
-        }
-        if pipeline or self.default_pipeline:
-            action["pipeline"] = pipeline or self.default_pipeline
-        self.buffer.append(action)
-        BUFFER_SIZE.set(len(self.buffer))
+    def start(self) -> None:
+        if self.background and self._executor is None:
+            workers = self.controller.max_concurrency if self.controller else self.max_in_flight
+            self._executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="bulk-flush"
+            )
+        if self._timer is None:
+            self._stop.clear()
+            self._timer = threading.Thread(
+                target=self._run_timer, name="bulk-flush-timer", daemon=True
+            )
+            self._timer.start()
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Para el temporizador, envía lo pendiente y espera a los flushes en curso."""
+        self._stop.set()
+        if self._timer is not None:
+            self._timer.join(timeout=timeout)
+            self._timer = None
+        self.flush()
+        self.wait_idle(timeout=timeout)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def add(
+        self,
+        index: str,
+        doc: Dict[str, Any],
+        pipeline: Optional[str] = None,
+        ref: Any = None,
+        doc_id: Optional[str] = None,
+    ):
+        line = self.encoder.encode(index, doc, pipeline or self.default_pipeline, doc_id)
         now = time.time()
-        if len(self.buffer) >= self.max_items or (
-            (now - self.last_flush_ts) * 1000 >= self.max_interval_ms
-        ):
-            self.flush()
+        batches: List[_Batch] = []
+        with self._lock:
+            # Corta antes de superar max_bytes: tamaño de request estable
+            if self.buffer and self.buffer_bytes + len(line) > self.max_bytes:
+                batches.append(self._cut())
+            if not self.buffer:
+                self.first_add_ts = now
+            self.buffer.append(line)
+            self.buffer_bytes += len(line)
+            self.refs.append(ref)
+            BUFFER_SIZE.set(len(self.buffer))
+            BUFFER_BYTES.set(self.buffer_bytes)
+            if (
+                len(self.buffer) >= self.max_items
+                or self.buffer_bytes >= self.max_bytes
+                or (now - self.first_add_ts) * 1000 >= self.max_interval_ms
+            ):
+                batches.append(self._cut())
+        for batch in batches:
+            self._dispatch(batch)
+
+    def flush(self) -> FlushResult:
+        """Flush síncrono del buffer actual en el hilo llamante."""
+        with self._lock:
+            batch = self._cut()
+        if batch is None:
+            return FlushResult()
+        return self._run(batch)
+
+    def send_raw(self, actions: List[bytes]) -> FlushResult:
+        """
+        Envía acciones ya serializadas (p.ej. desde el spool) con la misma lógica de
+        reintentos, sin volver a escribirlas en el spool. Los refs son las posiciones.
+        """
+        return self._send(actions, list(range(len(actions))), use_spool=False)
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._in_flight_cond:
+            while self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._in_flight_cond.wait(remaining)
+        return True
+
+    def pressure(self) -> Tuple[int, int, int]:
+        """(bytes pendientes en buffer y en vuelo, bulks en vuelo, límite de bulks en vuelo)."""
+        with self._in_flight_cond:
+            return (
+                self.buffer_bytes + self._in_flight_bytes,
+                self._in_flight,
+                self.max_in_flight if self._executor is not None else 0,
+            )
 
-    def flush(self):
+    def _cut(self) -> Optional[_Batch]:
+        # Llamar con self._lock tomado
         if not self.buffer:
+            return None
+        batch = _Batch(self._seq, self.buffer, self.refs, self.buffer_bytes)
+        self._seq += 1
+        self.buffer, self.refs = [], []
+        self.buffer_bytes = 0
+        BUFFER_SIZE.set(0)
+        BUFFER_BYTES.set(0)
+        return batch
+
+    def _dispatch(self, batch: _Batch) -> None:
+        if self._executor is None:
+            self._run(batch)
             return
-        payload: List[Dict[str, Any]] = []
-        for a in self.buffer:
-            header = {"index": {"_index": a["_index"]}}
-            if "pipeline" in a:
-                header["index"]["pipeline"] = a["pipeline"]
-            payload.append(header)
-            payload.append(a["_source"])
-
-        start = time.time()
+        with self._in_flight_cond:
+            while self._in_flight >= self.max_in_flight:
+                self._in_flight_cond.wait()
+            self._in_flight += 1
+            self._in_flight_bytes += batch.nbytes
+            BULK_IN_FLIGHT.inc()
+        self._executor.submit(self._run_in_background, batch)
+
+    def _run_in_background(self, batch: _Batch) -> None:
+        try:
+            self._run(batch)
+        finally:
+            with self._in_flight_cond:
+                self._in_flight -= 1
+                self._in_flight_bytes -= batch.nbytes
+                BULK_IN_FLIGHT.dec()
+                self._in_flight_cond.notify_all()
+
+    def _run_timer(self) -> None:
+        tick = min(self.max_interval_ms / 1000.0, 0.25)
+        while not self._stop.wait(tick):
+            batch = None
+            with self._lock:
+                if self.buffer and (
+                    (time.time() - self.first_add_ts) * 1000 >= self.max_interval_ms
+                ):
+                    batch = self._cut()
+            if batch is not None:
+                try:
+                    self._dispatch(batch)
+                except Exception:
+                    logger.exception("bulk_timer_flush_failed")
+
+    def _run(self, batch: _Batch) -> FlushResult:
         try:
-            resp = self.client.bulk(body=payload, refresh=False)
-            took = time.time() - start
-            INDEX_LATENCY.observe(took)
-            if resp.get("errors"):
-                BULK_ERRORS.inc()
-                logger.warning("bulk_flush_partial_errors", extra={"items": len(self.buffer)})
-            else:
-                logger.info(
-                    "bulk_flush_ok", extra={"items": len(self.buffer), "took_seconds": took}
-                )
+            result = self._send(batch.actions, batch.refs)
         except Exception as e:
+            # Sin entrega el seq bloquearía todas las siguientes (y sus acks)
+            result = FlushResult(
+                items=len(batch.actions), failed=[(ref, "bulk_failed") for ref in batch.refs]
+            )
+            logger.exception("bulk_flush_failed", extra={"items": len(batch.refs), "error": str(e)})
+        self._deliver(batch.seq, result)
+        return result
+
+    def _deliver(self, seq: int, result: FlushResult) -> None:
+        # Entrega on_flush en orden de batch aunque los envíos terminen desordenados
+        with self._delivery_lock:
+            self._completed[seq] = result
+            while self._next_delivery in self._completed:
+                ready = self._completed.pop(self._next_delivery)
+                self._next_delivery += 1
+                if self.on_flush is not None:
+                    try:
+                        self.on_flush(ready)
+                    except Exception:
+                        logger.exception("bulk_on_flush_callback_failed")
+
+    def _send(self, buffer: List[bytes], refs: List[Any], use_spool: bool = True) -> FlushResult:
+        """
+        Envía el batch y procesa la respuesta item a item: 429/5xx se reintentan con backoff
+        (sólo esos items, en un bulk más pequeño); el resto de errores son permanentes.
+        """
+        send = BulkSend(
+            buffer,
+            refs,
+            max_retries=self.max_retries,
+            retry_backoff_ms=self.retry_backoff_ms,
+            spool=self.spool if use_spool else None,
+            observe=self._observe,
+        )
+        while True:
+            start = time.time()
+            start_ns = perf_counter_ns()
+            try:
+                resp = self.client.bulk(body=send.body(), refresh=False)
+                stage_lap(FLUSH, start_ns)
+                send.on_response(resp, time.time() - start)
+            except Exception as e:
+                send.on_error(e, time.time() - start)
+            delay = send.next_delay()
+            if delay is None:
+                break
+            time.sleep(delay)
+        self.last_flush_ts = time.time()
+        return send.finish()
+
+    def _observe(
+        self, latency: float, took_ms: Optional[float], rejected: int, failed: bool
+    ) -> None:
+        if self.controller is None:
+            return
+        self.controller.observe(latency, took_ms=took_ms, rejected=rejected, failed=failed)
+        with self._in_flight_cond:
+            self.max_items = self.controller.batch_size
+            self.max_in_flight = self.controller.concurrency
+            self._in_flight_cond.notify_all()
+
+    def _backoff_seconds(self, attempt: int) -> float:
+        return retry_backoff_seconds(attempt, self.retry_backoff_ms)
+
+
+def retry_backoff_seconds(attempt: int, base_ms: int) -> float:
+    # Exponencial con jitter completo para no sincronizar reintentos entre consumers
+    cap = min(base_ms * (2 ** (attempt - 1)), MAX_RETRY_BACKOFF_MS)
+    return random.uniform(0, cap) / 1000.0
+
+
+class BulkSend:
+    """
+    Un envío _bulk con reintento por item, común a BulkIndexer y al motor asyncio (cada uno
+    hace la petición y las esperas a su manera):
+
+        send = BulkSend(actions, refs, ...)
+        while True:
+            petición con send.body() -> send.on_response(resp, took) / send.on_error(e, took)
+            delay = send.next_delay()  # None: no hay más intentos
+            if delay is None: break
+            esperar delay
+        result = send.finish()
+
+    Los items con 429/5xx (o todos si falla la petición) se reenvían solos hasta
+    `max_retries` veces; después van al spool si lo hay (y cuentan como ok) o a
+    FlushResult.failed. `observe(latency, took_ms, rejected, failed)` recibe cada intento
+    (controlador adaptativo).
+    """
+
+    def __init__(
+        self,
+        actions: List[bytes],
+        refs: List[Any],
+        max_retries: int = 3,
+        retry_backoff_ms: int = 200,
+        spool: Optional[DiskSpool] = None,
+        observe: Optional[Callable[[float, Optional[float], int, bool], None]] = None,
+    ):
+        self.actions = actions
+        self.refs = refs
+        self.max_retries = max_retries
+        self.retry_backoff_ms = retry_backoff_ms
+        self.spool = spool
+        self.observe = observe
+        self.result = FlushResult(items=len(actions))
+        self.pending = list(range(len(actions)))
+        self.retry: List[Tuple[int, str]] = []
+        self.attempt = 0
+
+    def body(self) -> bytes:
+        return b"".join(self.actions[i] for i in self.pending)
+
+    def on_response(self, resp: Dict[str, Any], took: float) -> None:
+        INDEX_LATENCY.observe(took)
+        self.retry = []
+        rejected = 0
+        if resp.get("errors"):
             BULK_ERRORS.inc()
-            logger.exception(
-                "bulk_flush_failed", extra={"items": len(self.buffer), "error": str(e)}
+            items = resp.get("items") or []
+            by_type: Dict[str, int] = {}
+            for pos, i in enumerate(self.pending):
+                if pos < len(items):
+                    status, reason = parse_bulk_item(items[pos])
+                else:
+                    status, reason = 0, "bulk_item_missing"
+                if reason is None:
+                    if status == 409:
+                        BULK_DUPLICATES.inc()
+                    self.result.ok.append(self.refs[i])
+                    continue
+                retryable = is_retryable_status(status)
+                if status == 429:
+                    rejected += 1
+                BULK_ITEM_ERRORS.labels(error_type=reason, retryable=str(retryable).lower()).inc()
+                by_type[reason] = by_type.get(reason, 0) + 1
+                if retryable:
+                    self.retry.append((i, reason))
+                else:
+                    self.result.failed.append((self.refs[i], reason))
+            logger.warning(
+                "bulk_flush_partial_errors",
+                extra={
+                    "items": len(self.pending),
+                    "retryable": len(self.retry),
+                    "attempt": self.attempt,
+                    "errors_by_type": by_type,
+                },
             )
-        finally:
-            self.buffer.clear()
-            BUFFER_SIZE.set(0)
-            self.last_flush_ts = time.time()
+        else:
+            self.result.ok.extend(self.refs[i] for i in self.pending)
+            logger.info("bulk_flush_ok", extra={"items": len(self.pending), "took_seconds": took})
+        if self.observe is not None:
+            self.observe(took, resp.get("took"), rejected, False)
+
+    def on_error(self, exc: BaseException, elapsed: float) -> None:
+        BULK_ERRORS.inc()
+        self.retry = [(i, "bulk_failed") for i in self.pending]
+        logger.warning(
+            "bulk_flush_failed",
+            extra={"items": len(self.pending), "attempt": self.attempt, "error": str(exc)},
+            exc_info=self.attempt >= self.max_retries,
+        )
+        if self.observe is not None:
+            self.observe(elapsed, None, 0, True)
+
+    def next_delay(self) -> Optional[float]:
+        """Espera antes del siguiente intento, o None si no quedan items a reintentar."""
+        if not self.retry or self.attempt >= self.max_retries:
+            return None
+        self.attempt += 1
+        BULK_RETRIES.inc(len(self.retry))
+        self.pending = [i for i, _ in self.retry]
+        self.retry = []
+        return retry_backoff_seconds(self.attempt, self.retry_backoff_ms)
+
+    @property
+    def spools(self) -> bool:
+        """finish() escribirá en disco (el motor asyncio lo ejecuta fuera del event loop)."""
+        return bool(self.retry) and self.spool is not None
+
+    def finish(self) -> FlushResult:
+        """Resultado final: los items que agotaron reintentos van al spool o a failed."""
+        retry, self.retry = self.retry, []
+        if not retry:
+            return self.result
+        if self.spool is not None and self.spool.append_many([self.actions[i] for i, _ in retry]):
+            self.result.ok.extend(self.refs[i] for i, _ in retry)
+            self.result.spooled += len(retry)
+            logger.warning("bulk_items_spooled", extra={"items": len(retry)})
+        else:
+            self.result.failed.extend((self.refs[i], reason) for i, reason in retry)
+            self.result.transient_failures += len(retry)
+        return self.result
+
+
+def parse_bulk_item(item: Dict[str, Any]) -> Tuple[int, Optional[str]]:
+    """(status, motivo de fallo) de un item de la respuesta _bulk; motivo None si se indexó."""
+    op = next(iter(item.values()), {}) if isinstance(item, dict) else {}
+    status = op.get("status", 0)
+    if 200 <= status < 300:
+        return status, None
+    if status == 409 and "create" in item:
+        # _id determinista ya presente: reentrega de un evento indexado, no es un error
+        # (quien liquida el item lo cuenta en BULK_DUPLICATES)
+        return status, None
+    err = op.get("error")
+    if isinstance(err, dict) and err.get("type"):
+        return status, str(err["type"])
+    return status, f"http_{status}"
+
+
+def bulk_item_error(item: Dict[str, Any]) -> Optional[str]:
+    """Motivo de fallo de un item de la respuesta _bulk, o None si se indexó."""
+    return parse_bulk_item(item)[1]
+
+
+def is_retryable_status(status: int) -> bool:
+    # 429 (rechazo por cola llena) y 5xx son transitorios; 4xx (mapping, etc.) permanentes
+    return status == 429 or status >= 500
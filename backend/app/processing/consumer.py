@@ -1,18 +1,35 @@
 from __future__ import annotations
 
+import functools
 import json
 import logging
 import os
 import time
-from typing import TYPE_CHECKING, Any, Dict, Optional
+from time import perf_counter_ns
+from typing import TYPE_CHECKING, Any, Dict, NamedTuple, Optional
 
-from jsonschema import Draft7Validator
-from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from prometheus_client import Counter, Gauge, Histogram
 
+from backend.app.core import json_codec
 from backend.app.core.config import settings
-from backend.app.core.logging import configure_logging
+from backend.app.core.logging import EventLog, configure_logging
 from backend.app.infrastructure.rabbitmq import get_channel
+from backend.app.metrics import profiling, stages
+from backend.app.metrics.counters import INDEX_LATENCY
+from backend.app.metrics.stages import lap as stage_lap
+from backend.app.metrics.stages import observe_ns as stage_observe_ns
+from backend.app.processing.backpressure import BackpressureGate
+from backend.app.processing.bulk_controller import AdaptiveBulkController
+from backend.app.processing.dedup import EVENTS_DEDUPLICATED, RecentIdFilter, event_document_id
 from backend.app.processing.normalizer import normalize
+from backend.app.processing.schema_registry import (
+    SchemaRegistry,
+    Validator,
+    build_schema_validator,
+    validation_errors,
+)
+from backend.app.processing.spool import DiskSpool, SpoolReplayer
+from backend.app.processing.tenant_mapping import get_host_mapper
 from backend.app.processing.tenant_registry import get_registry, is_valid_tenant
 from backend.app.processing.utils import prepare_event, top_validation_errors
 from backend.app.repository.elastic import get_es, index_event
@@ -33,24 +50,20 @@ EVENTS_NACKED_BY_REASON = Counter(
     "events_nacked_by_reason_total", "Eventos rechazados por razón", ["reason"]
 )
 
-INDEX_LATENCY = Histogram(
-    "index_latency_seconds",
-    "Latencia por flush bulk o documento individual",
-    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0),
-)
 EVENT_INDEX_LATENCY = Histogram(
     "event_index_latency_seconds",
     "Latencia de indexación por evento unitario (no bulk)",
     buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
 )
-BUFFER_SIZE = Gauge("consumer_buffer_size", "Número de eventos en buffer bulk")
 
-NORMALIZER_LATENCY = Histogram(
-    "normalizer_latency_seconds",
-    "Tiempo de normalización + mapping por evento",
-    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05),
+# Logs por evento: con LOG_EVENT_MODE=sampled, muestreo + resumen periódico
+INDEXED_LOG = EventLog(logger, "event_indexed")
+HOST_MAPPED_LOG = EventLog(logger, "mapped_host_to_tenant")
+DUPLICATE_LOG = EventLog(logger, "event_duplicate_skipped")
+
+TENANT_REGISTRY_SIZE = Gauge(
+    "tenant_registry_size", "Número de tenants registrados", multiprocess_mode="max"
 )
-TENANT_REGISTRY_SIZE = Gauge("tenant_registry_size", "Número de tenants registrados")
 
 USE_MANUAL_DLX = os.getenv("USE_MANUAL_DLX", "false").lower() == "true"
 MANUAL_DLX_EXCHANGE = os.getenv("RABBITMQ_DLX", "logs_default.dlx")
@@ -58,10 +71,60 @@ MANUAL_DLX_EXCHANGE = os.getenv("RABBITMQ_DLX", "logs_default.dlx")
 USE_BULK = os.getenv("USE_BULK", "false").lower() == "true"
 BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "500"))
 BULK_MAX_INTERVAL_MS = int(os.getenv("BULK_MAX_INTERVAL_MS", "1000"))
+# Límite de tamaño del cuerpo _bulk (NDJSON ya serializado)
+BULK_MAX_BYTES = int(os.getenv("BULK_MAX_BYTES", str(5 * 1024 * 1024)))
+# Reintentos de items _bulk con 429/5xx (backoff exponencial con jitter)
+BULK_RETRY_MAX = int(os.getenv("BULK_RETRY_MAX", "3"))
+BULK_RETRY_BACKOFF_MS = int(os.getenv("BULK_RETRY_BACKOFF_MS", "200"))
+# Control adaptativo (AIMD) de tamaño de batch y concurrencia; BULK_MAX_ITEMS y
+# BULK_MAX_IN_FLIGHT pasan a ser los valores iniciales
+BULK_ADAPTIVE = os.getenv("BULK_ADAPTIVE", "false").lower() == "true"
+BULK_ADAPTIVE_MIN_ITEMS = int(os.getenv("BULK_ADAPTIVE_MIN_ITEMS", "50"))
+BULK_ADAPTIVE_MAX_ITEMS = int(os.getenv("BULK_ADAPTIVE_MAX_ITEMS", "2000"))
+BULK_ADAPTIVE_MAX_IN_FLIGHT = int(os.getenv("BULK_ADAPTIVE_MAX_IN_FLIGHT", "4"))
+BULK_TARGET_LATENCY_MS = float(os.getenv("BULK_TARGET_LATENCY_MS", "500"))
+# Backpressure: se cancela el consumer (basic_cancel) cuando los bytes pendientes del bulk
+# superan HIGH o todos los bulks en vuelo están ocupados; se reanuda al bajar de LOW
+BACKPRESSURE_ENABLED = os.getenv("BACKPRESSURE_ENABLED", "true").lower() == "true"
+BACKPRESSURE_HIGH_BYTES = int(os.getenv("BACKPRESSURE_HIGH_BYTES", str(4 * BULK_MAX_BYTES)))
+BACKPRESSURE_LOW_BYTES = int(os.getenv("BACKPRESSURE_LOW_BYTES", str(BACKPRESSURE_HIGH_BYTES // 2)))
+BACKPRESSURE_POLL_MS = int(os.getenv("BACKPRESSURE_POLL_MS", "100"))
+# Spool local en disco: acciones que no se pudieron indexar por caída de OpenSearch se
+# guardan aquí (en lugar de ir al DLQ) y se reindexan en orden cuando vuelve el cluster
+SPOOL_ENABLED = os.getenv("SPOOL_ENABLED", "false").lower() == "true"
+SPOOL_DIR = os.getenv("SPOOL_DIR", "/var/lib/nubla/spool")
+SPOOL_MAX_BYTES = int(os.getenv("SPOOL_MAX_BYTES", str(1024 * 1024 * 1024)))
+SPOOL_SEGMENT_BYTES = int(os.getenv("SPOOL_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+SPOOL_FSYNC = os.getenv("SPOOL_FSYNC", "true").lower() == "true"
+SPOOL_REPLAY_INTERVAL_MS = int(os.getenv("SPOOL_REPLAY_INTERVAL_MS", "5000"))
 CONSUMER_PREFETCH = int(os.getenv("CONSUMER_PREFETCH", "5"))
+# Máximo de _bulk concurrentes en vuelo
+BULK_MAX_IN_FLIGHT = int(os.getenv("BULK_MAX_IN_FLIGHT", "2"))
+# Flush bulk en hilo worker (doble buffer) en lugar de bloquear el hilo del consumer
+BULK_BACKGROUND_FLUSH = os.getenv("BULK_BACKGROUND_FLUSH", "true").lower() == "true"
+# Ack diferido: el ack (multiple=True) se envía sólo tras un flush bulk correcto
+BULK_DEFERRED_ACK = os.getenv("BULK_DEFERRED_ACK", "false").lower() == "true"
+
+# _id determinista (blake2b de tenant, original.message_raw y @timestamp) con acción create:
+# una reentrega ya indexada devuelve 409 y no duplica el documento
+DETERMINISTIC_IDS = os.getenv("DETERMINISTIC_IDS", "false").lower() == "true"
+# Filtro (Bloom rotativo) de IDs indexados recientemente: descarta reentregas antes de OpenSearch
+DEDUP_FILTER_ENABLED = os.getenv("DEDUP_FILTER_ENABLED", "true").lower() == "true"
+DEDUP_FILTER_CAPACITY = int(os.getenv("DEDUP_FILTER_CAPACITY", "1000000"))
+DEDUP_FILTER_ERROR_RATE = float(os.getenv("DEDUP_FILTER_ERROR_RATE", "0.000001"))
+
+# Validación NCS con código compilado del schema (jsonschema sólo para el informe de errores)
+SCHEMA_COMPILED = os.getenv("SCHEMA_COMPILED", "true").lower() == "true"
+# Directorio con las versiones NCS (ncs_v<versión>.json o ncs_schema_registry.json con
+# {"versions": {...}}); vacío = directorio de NCS_SCHEMA_LOCAL_PATH
+NCS_SCHEMA_DIR = os.getenv("NCS_SCHEMA_DIR", "")
+NCS_SCHEMA_RELOAD_SECONDS = float(os.getenv("NCS_SCHEMA_RELOAD_SECONDS", "30"))
 
 REQUIRE_TENANT = os.getenv("REQUIRE_TENANT", "false").lower() == "true"
 
+# Motor de consumo: "blocking" (pika BlockingConnection) o "asyncio" (processing/async_consumer.py)
+CONSUMER_ENGINE = os.getenv("CONSUMER_ENGINE", "blocking").lower()
+
 SEVERITY_MAP = {
     "error": "critical",
     "alert": "high",
@@ -76,10 +139,23 @@ if TYPE_CHECKING:
 
 try:
     from backend.app.processing.bulk_indexer import BulkIndexer as _BulkIndexer  # type: ignore
+    from backend.app.processing.bulk_indexer import NdjsonEncoder
 except Exception:
     _BulkIndexer = None  # type: ignore
+    NdjsonEncoder = None  # type: ignore
 
 bulk_indexer: Optional["BulkIndexerType"] = None
+recent_ids: Optional[RecentIdFilter] = None
+
+
+class PendingDelivery(NamedTuple):
+    """Mensaje en buffer bulk pendiente de ack (modo BULK_DEFERRED_ACK)."""
+
+    delivery_tag: int
+    body: bytes
+    routing_key: str
+    tenant_id: str
+    doc_id: Optional[str] = None
 
 
 def load_local_schema(path: str) -> Dict[str, Any]:
@@ -87,20 +163,47 @@ def load_local_schema(path: str) -> Dict[str, Any]:
         return json.load(f)
 
 
-def build_validator(local_path: str) -> Optional[Draft7Validator]:
+def _resolve_schema_path(local_path: str) -> str:
     resolved = local_path
     if not os.path.isabs(resolved):
         base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "schema"))
         candidate = os.path.join(base_dir, os.path.basename(local_path))
         if os.path.exists(candidate):
             resolved = candidate
+    return resolved
+
+
+def build_validator(local_path: str) -> Optional[Validator]:
+    resolved = _resolve_schema_path(local_path)
     try:
         schema = load_local_schema(resolved)
         logger.info("schema_loaded_local", extra={"path": resolved})
-        return Draft7Validator(schema)
     except Exception:
         logger.warning("schema_validator_unavailable", extra={"path": resolved}, exc_info=True)
         return None
+    return build_schema_validator(schema, SCHEMA_COMPILED)
+
+
+def build_schema_registry(local_path: str) -> Optional[SchemaRegistry]:
+    """
+    Registry de validadores por schema_version del directorio NCS_SCHEMA_DIR (por defecto
+    el del schema local). El schema local se usa para todas las versiones sólo si el
+    directorio no tiene ninguna versión registrada.
+    """
+    resolved = _resolve_schema_path(local_path)
+    directory = NCS_SCHEMA_DIR or os.path.dirname(os.path.abspath(resolved))
+    registry = SchemaRegistry(
+        directory,
+        compiled=SCHEMA_COMPILED,
+        fallback_path=resolved,
+        reload_seconds=NCS_SCHEMA_RELOAD_SECONDS,
+    )
+    try:
+        registry.load()
+    except Exception:
+        logger.warning("schema_validator_unavailable", extra={"path": resolved}, exc_info=True)
+        return None
+    return registry
 
 
 def publish_to_dlx_with_reason(ch, body_bytes: bytes, routing_key: str, reason: str):
@@ -120,6 +223,57 @@ def publish_to_dlx_with_reason(ch, body_bytes: bytes, routing_key: str, reason:
     EVENTS_NACKED_BY_REASON.labels(reason=reason).inc()
 
 
+def settle_flush(ch, result) -> None:
+    """
+    Liquida en RabbitMQ los mensajes de un flush bulk (modo BULK_DEFERRED_ACK).
+    Fallidos -> DLX por delivery tag; el resto con un único basic_ack(multiple=True).
+    """
+    t = perf_counter_ns()
+    ack_upto = 0
+    for ref, reason in result.failed:
+        EVENTS_INDEX_FAILED.inc()
+        logger.warning(
+            "bulk_item_rejected",
+            extra={"tenant_id": ref.tenant_id, "reject_reason": reason},
+        )
+        if USE_MANUAL_DLX:
+            publish_to_dlx_with_reason(ch, ref.body, ref.routing_key, reason)
+            ack_upto = max(ack_upto, ref.delivery_tag)
+        else:
+            ch.basic_nack(delivery_tag=ref.delivery_tag, requeue=False)
+            EVENTS_NACKED.inc()
+            EVENTS_NACKED_BY_REASON.labels(reason=reason).inc()
+    for ref in result.ok:
+        EVENTS_INDEXED.inc()
+        EVENTS_INDEXED_BY_TENANT.labels(tenant_id=ref.tenant_id).inc()
+        ack_upto = max(ack_upto, ref.delivery_tag)
+        remember_indexed(ref.doc_id)
+    if ack_upto:
+        ch.basic_ack(delivery_tag=ack_upto, multiple=True)
+    stage_lap(stages.ACK, t)
+
+
+def remember_indexed(doc_id: Optional[str]) -> None:
+    if recent_ids is not None and doc_id:
+        recent_ids.add(doc_id)
+
+
+def is_recent_duplicate(doc_id: Optional[str], redelivered: bool, headers: Any) -> bool:
+    """
+    True si el mensaje es una reentrega (redelivered o republicado por reprocess_dlq) de un
+    evento ya indexado por este proceso. Sólo se consulta el filtro en reentregas, así un
+    falso positivo del Bloom filter nunca descarta un evento nuevo.
+    """
+    if recent_ids is None or not doc_id:
+        return False
+    if not redelivered and not (headers and "x-reprocess-reason" in headers):
+        return False
+    if doc_id in recent_ids:
+        EVENTS_DEDUPLICATED.inc()
+        return True
+    return False
+
+
 def _normalize_severity(evt: Dict[str, Any]) -> None:
     sev = evt.get("severity")
     if isinstance(sev, str):
@@ -136,43 +290,279 @@ def validate_tenant(evt: Dict[str, Any]) -> bool:
     return isinstance(t, str) and bool(t.strip())
 
 
-def main() -> None:
+class EventRejected(Exception):
+    """Evento descartado por el pipeline; `reason` se usa como x-reject-reason."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def open_spool() -> Optional[DiskSpool]:
+    # En modo supervisor cada worker tiene su propio directorio (el spool es de un proceso)
+    worker = os.getenv("CONSUMER_WORKER_INDEX")
+    directory = os.path.join(SPOOL_DIR, f"worker-{worker}") if worker else SPOOL_DIR
     try:
-        start_http_server(int(os.getenv("METRICS_PORT", "9109")))
-        logger.info("metrics_server_started", extra={"port": os.getenv("METRICS_PORT", "9109")})
+        spool = DiskSpool(
+            directory,
+            segment_max_bytes=SPOOL_SEGMENT_BYTES,
+            max_bytes=SPOOL_MAX_BYTES,
+            fsync=SPOOL_FSYNC,
+        )
+    except Exception:
+        logger.exception("spool_unavailable", extra={"path": directory})
+        return None
+    logger.info(
+        "spool_enabled",
+        extra={"path": directory, "max_bytes": SPOOL_MAX_BYTES, "pending_bytes": spool.size_bytes},
+    )
+    return spool
+
+
+def build_bulk_controller() -> Optional[AdaptiveBulkController]:
+    """Controlador AIMD de tamaño de batch y bulks en vuelo (BULK_ADAPTIVE=true)."""
+    if not BULK_ADAPTIVE:
+        return None
+    return AdaptiveBulkController(
+        batch_size=BULK_MAX_ITEMS,
+        min_batch_size=BULK_ADAPTIVE_MIN_ITEMS,
+        max_batch_size=BULK_ADAPTIVE_MAX_ITEMS,
+        concurrency=BULK_MAX_IN_FLIGHT,
+        max_concurrency=BULK_ADAPTIVE_MAX_IN_FLIGHT,
+        target_latency_ms=BULK_TARGET_LATENCY_MS,
+    )
+
+
+def start_spool_replayer(spool: DiskSpool, indexer: Any) -> SpoolReplayer:
+    """Hilo que reenvía el spool con indexer.send_raw() cuando vuelve el cluster."""
+    replayer = SpoolReplayer(
+        spool,
+        indexer,
+        interval_seconds=SPOOL_REPLAY_INTERVAL_MS / 1000.0,
+        batch_items=BULK_MAX_ITEMS,
+    )
+    replayer.start()
+    return replayer
+
+
+def start_metrics() -> None:
+    try:
+        profiling.start_metrics_server(int(os.getenv("METRICS_PORT", "9109")))
+        logger.info(
+            "metrics_server_started",
+            extra={
+                "port": os.getenv("METRICS_PORT", "9109"),
+                "profiling": bool(profiling.PROFILING_TOKEN),
+            },
+        )
     except Exception:
         logger.warning("metrics_server_failed", exc_info=True)
 
+
+def init_processing() -> Optional[SchemaRegistry]:
+    """Carga schemas NCS y registry de tenants; común a todos los motores de consumo."""
+    schema_path = os.getenv(
+        "NCS_SCHEMA_LOCAL_PATH",
+        getattr(settings, "ncs_schema_local_path", "backend/app/schema/ncs_v1.0.0.json"),
+    )
+    validators = build_schema_registry(schema_path)
+
+    try:
+        reg = get_registry()
+        reg.on_change = lambda tenants: TENANT_REGISTRY_SIZE.set(len(tenants))
+        reg.load()
+        TENANT_REGISTRY_SIZE.set(len(reg.all()))
+        reg.start()
+        logger.info("tenant_registry_loaded", extra={"source": reg.source})
+    except Exception:
+        logger.warning("tenant_registry_load_failed", exc_info=True)
+
+    try:
+        get_host_mapper().load()
+    except Exception:
+        logger.warning("host_tenant_map_load_failed", exc_info=True)
+    return validators
+
+
+def _apply_host_mapping(normalized: Dict[str, Any]) -> None:
+    # Host→tenant mapping (override si tenant = default)
+    existing_tenant = normalized.get("tenant_id")
+    host_val = (
+        normalized.get("host")
+        or normalized.get("host_name")
+        or normalized.get("original", {}).get("raw_kv", {}).get("devname")
+    )
+    if host_val:
+        mapped = get_host_mapper().resolve(host_val)
+        default_tenant = getattr(settings, "tenant_id", "default")
+        if mapped and (existing_tenant in (None, "", default_tenant)):
+            normalized["tenant_id"] = mapped
+            HOST_MAPPED_LOG.record(
+                tenant_id=mapped,
+                host=host_val,
+                previous_tenant=existing_tenant,
+                tenant_mapped=mapped,
+            )
+
+
+def process_message(body: bytes, validators: Optional[SchemaRegistry]) -> Dict[str, Any]:
+    """
+    Decodifica, normaliza, mapea tenant y valida un mensaje.
+    Devuelve el evento listo para indexar o lanza EventRejected.
+    """
+    t = perf_counter_ns()
+    raw_msg = json_codec.loads(body)
+    t = stage_lap(stages.DECODE, t)
+    normalized = normalize(raw_msg)
+    t_norm = perf_counter_ns()
+    try:
+        if isinstance(normalized, dict):
+            _apply_host_mapping(normalized)
+    except Exception:
+        logger.exception("host_to_tenant_mapping_failed")
+    t_tenant = perf_counter_ns()
+    # normalize y tenant se miden en dos tramos cada uno; una observación por etapa
+    normalize_ns, tenant_ns = t_norm - t, t_tenant - t_norm
+
+    # El evento normalizado es propiedad del pipeline: se modifica en el sitio sin copias
+    # (normalize() devuelve un dict nuevo o el propio dict de json.loads)
+    if isinstance(normalized, dict):
+        evt_dict = normalized
+    else:
+        evt_dict = json_codec.loads(json_codec.dumps(normalized))
+
+    _normalize_severity(evt_dict)
+
+    if REQUIRE_TENANT and not validate_tenant(evt_dict):
+        EVENTS_VALIDATION_FAILED.inc()
+        logger.warning(
+            "missing_tenant_id",
+            extra={
+                "raw_tenant": evt_dict.get("tenant_id"),
+                "reject_reason": "missing_tenant_id",
+            },
+        )
+        raise EventRejected("missing_tenant_id")
+
+    # Sólo tipos JSON (json.loads + normalize): no hay datetimes que convertir
+    evt_dict = prepare_event(evt_dict, coerce=False)
+    t = perf_counter_ns()
+    stage_observe_ns(stages.NORMALIZE, normalize_ns + t - t_tenant, t)
+
+    if not REQUIRE_TENANT and not validate_tenant(evt_dict):
+        EVENTS_VALIDATION_FAILED.inc()
+        logger.warning(
+            "missing_tenant_id_after_prepare",
+            extra={
+                "raw_tenant": evt_dict.get("tenant_id"),
+                "reject_reason": "missing_tenant_id",
+            },
+        )
+        raise EventRejected("missing_tenant_id")
+
+    validator = validators.get(evt_dict.get("schema_version")) if validators is not None else None
+    if validators is not None and validator is None:
+        EVENTS_VALIDATION_FAILED.inc()
+        logger.warning(
+            "unknown_schema_version",
+            extra={
+                "tenant_id": evt_dict.get("tenant_id"),
+                "schema_version": evt_dict.get("schema_version"),
+                "reject_reason": "unknown_schema_version",
+            },
+        )
+        raise EventRejected("unknown_schema_version")
+
+    # Veredicto compilado y, sólo para eventos inválidos, el informe de Draft7Validator
+    if validator is not None:
+        errors = validation_errors(validator, evt_dict)
+        if errors:
+            EVENTS_VALIDATION_FAILED.inc()
+            logger.warning(
+                "validation_failed",
+                extra={
+                    "tenant_id": evt_dict.get("tenant_id"),
+                    "errors": top_validation_errors(errors),
+                },
+            )
+            raise EventRejected("validation_failed")
+    t = stage_lap(stages.VALIDATE, t)
+
+    tenant = evt_dict.get("tenant_id") or "default"
+    evt_dict["tenant_id"] = tenant
+    valid_tenant = is_valid_tenant(tenant)
+    stage_observe_ns(stages.TENANT, tenant_ns + perf_counter_ns() - t)
+    if not valid_tenant:
+        EVENTS_VALIDATION_FAILED.inc()
+        logger.warning(
+            "unknown_tenant_id",
+            extra={"tenant_id": tenant, "reject_reason": "unknown_tenant_id"},
+        )
+        raise EventRejected("unknown_tenant_id")
+    return evt_dict
+
+
+def reject_message(ch, method, body: bytes, reason: str) -> None:
+    if USE_MANUAL_DLX:
+        publish_to_dlx_with_reason(ch, body, method.routing_key, reason)
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+    else:
+        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+        EVENTS_NACKED.inc()
+        EVENTS_NACKED_BY_REASON.labels(reason=reason).inc()
+
+
+def main(start_metrics_server: bool = True) -> None:
+    # En modo supervisor (processing/supervisor.py) las métricas las expone el proceso padre
+    if start_metrics_server:
+        start_metrics()
+
     es = get_es()
 
-    global bulk_indexer
+    global bulk_indexer, recent_ids
+    if DETERMINISTIC_IDS and DEDUP_FILTER_ENABLED:
+        recent_ids = RecentIdFilter(DEDUP_FILTER_CAPACITY, DEDUP_FILTER_ERROR_RATE)
+    controller: Optional[AdaptiveBulkController] = None
+    spool = open_spool() if SPOOL_ENABLED and _BulkIndexer is not None else None
     if USE_BULK and _BulkIndexer is not None:
+        controller = build_bulk_controller()
         bulk_indexer = _BulkIndexer(
             client=es,
             max_items=BULK_MAX_ITEMS,
             max_interval_ms=BULK_MAX_INTERVAL_MS,
             default_pipeline="logs_ingest",
+            background=BULK_BACKGROUND_FLUSH,
+            max_in_flight=BULK_MAX_IN_FLIGHT,
+            max_bytes=BULK_MAX_BYTES,
+            max_retries=BULK_RETRY_MAX,
+            retry_backoff_ms=BULK_RETRY_BACKOFF_MS,
+            controller=controller,
+            spool=spool,
         )
         logger.info(
             "bulk_enabled",
-            extra={"max_items": BULK_MAX_ITEMS, "max_interval_ms": BULK_MAX_INTERVAL_MS},
+            extra={
+                "max_items": BULK_MAX_ITEMS,
+                "max_interval_ms": BULK_MAX_INTERVAL_MS,
+                "max_bytes": BULK_MAX_BYTES,
+                "deferred_ack": BULK_DEFERRED_ACK,
+                "background_flush": BULK_BACKGROUND_FLUSH,
+                "max_in_flight": BULK_MAX_IN_FLIGHT,
+                "adaptive": controller is not None,
+            },
         )
     else:
         logger.info("bulk_disabled")
 
-    schema_path = os.getenv(
-        "NCS_SCHEMA_LOCAL_PATH",
-        getattr(settings, "ncs_schema_local_path", "backend/app/schema/ncs_v1.0.0.json"),
-    )
-    validator = build_validator(schema_path)
+    replayer: Optional[SpoolReplayer] = None
+    if spool is not None:
+        # Sin bulk, un BulkIndexer sólo para replay (no se arranca: send_raw es síncrono)
+        replay_indexer = bulk_indexer or _BulkIndexer(
+            client=es, max_retries=BULK_RETRY_MAX, retry_backoff_ms=BULK_RETRY_BACKOFF_MS
+        )
+        replayer = start_spool_replayer(spool, replay_indexer)
 
-    try:
-        reg = get_registry()
-        reg.load()
-        TENANT_REGISTRY_SIZE.set(len(reg.all()))
-        logger.info("tenant_registry_loaded")
-    except Exception:
-        logger.warning("tenant_registry_load_failed", exc_info=True)
+    validators = init_processing()
 
     try:
         connection, channel, queue_name, exchange = get_channel()
@@ -180,158 +570,106 @@ def main() -> None:
         logger.exception("rabbitmq_connection_failed")
         return
 
+    spool_encoder = NdjsonEncoder() if spool is not None else None
+    gate: Optional[BackpressureGate] = None
+    consumer_tag: Optional[str] = None
+
+    def start_consume() -> None:
+        nonlocal consumer_tag
+        consumer_tag = channel.basic_consume(
+            queue=queue_name, on_message_callback=handle, auto_ack=False
+        )
+
+    def check_backpressure() -> None:
+        change = gate.update(*bulk_indexer.pressure())
+        if change is True:
+            # Los mensajes ya recibidos y sin despachar se devuelven a la cola (requeue)
+            channel.basic_cancel(consumer_tag)
+            connection.call_later(BACKPRESSURE_POLL_MS / 1000.0, poll_backpressure)
+        elif change is False:
+            start_consume()
+
+    def poll_backpressure() -> None:
+        # Sin consumer no llegan mensajes: la reanudación se comprueba con un timer
+        check_backpressure()
+        if gate.paused:
+            connection.call_later(BACKPRESSURE_POLL_MS / 1000.0, poll_backpressure)
+
     def handle(ch, method, properties, body):
         EVENTS_PROCESSED.inc()
         try:
-            start_norm = time.time()
-            raw_msg = json.loads(body)
-            normalized = normalize(raw_msg)
-            # Host→tenant mapping (override si tenant = default)
             try:
-                if isinstance(normalized, dict):
-                    existing_tenant = normalized.get("tenant_id")
-                    host_val = (
-                        normalized.get("host")
-                        or normalized.get("host_name")
-                        or normalized.get("original", {}).get("raw_kv", {}).get("devname")
-                    )
-                    if host_val:
-                        host_norm = str(host_val).strip().lower().replace(" ", "-")
-                        from backend.app.processing.tenant_mapping import map_host_to_tenant
-
-                        mapped = map_host_to_tenant(host_norm)
-                        default_tenant = getattr(settings, "tenant_id", "default")
-                        if mapped and (existing_tenant in (None, "", default_tenant)):
-                            normalized["tenant_id"] = mapped
-                            logger.info(
-                                "mapped_host_to_tenant",
-                                extra={
-                                    "host": host_val,
-                                    "previous_tenant": existing_tenant,
-                                    "tenant_mapped": mapped,
-                                },
-                            )
-            except Exception:
-                logger.exception("host_to_tenant_mapping_failed")
-            finally:
-                NORMALIZER_LATENCY.observe(time.time() - start_norm)
-
-            if isinstance(normalized, dict):
-                evt_dict = dict(normalized)
-            else:
-                evt_dict = json.loads(json.dumps(normalized, default=str))
-
-            _normalize_severity(evt_dict)
-
-            if REQUIRE_TENANT and not validate_tenant(evt_dict):
-                EVENTS_VALIDATION_FAILED.inc()
-                logger.warning(
-                    "missing_tenant_id",
-                    extra={
-                        "raw_tenant": evt_dict.get("tenant_id"),
-                        "reject_reason": "missing_tenant_id",
-                    },
-                )
-                if USE_MANUAL_DLX:
-                    publish_to_dlx_with_reason(ch, body, method.routing_key, "missing_tenant_id")
-                    ch.basic_ack(delivery_tag=method.delivery_tag)
-                else:
-                    ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-                    EVENTS_NACKED.inc()
-                    EVENTS_NACKED_BY_REASON.labels(reason="missing_tenant_id").inc()
+                evt_dict = process_message(body, validators)
+            except EventRejected as rej:
+                reject_message(ch, method, body, rej.reason)
                 return
-
-            evt_dict = prepare_event(evt_dict)
-
-            if not REQUIRE_TENANT and not validate_tenant(evt_dict):
-                EVENTS_VALIDATION_FAILED.inc()
-                logger.warning(
-                    "missing_tenant_id_after_prepare",
-                    extra={
-                        "raw_tenant": evt_dict.get("tenant_id"),
-                        "reject_reason": "missing_tenant_id",
-                    },
-                )
-                if USE_MANUAL_DLX:
-                    publish_to_dlx_with_reason(ch, body, method.routing_key, "missing_tenant_id")
-                    ch.basic_ack(delivery_tag=method.delivery_tag)
-                else:
-                    ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-                    EVENTS_NACKED.inc()
-                    EVENTS_NACKED_BY_REASON.labels(reason="missing_tenant_id").inc()
-                return
-
-            if validator is not None:
-                errors = list(validator.iter_errors(evt_dict))
-                if errors:
-                    EVENTS_VALIDATION_FAILED.inc()
-                    logger.warning(
-                        "validation_failed",
-                        extra={
-                            "tenant_id": evt_dict.get("tenant_id"),
-                            "errors": top_validation_errors(errors),
-                        },
-                    )
-                    if USE_MANUAL_DLX:
-                        publish_to_dlx_with_reason(
-                            ch, body, method.routing_key, "validation_failed"
-                        )
-                        ch.basic_ack(delivery_tag=method.delivery_tag)
-                    else:
-                        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-                        EVENTS_NACKED.inc()
-                        EVENTS_NACKED_BY_REASON.labels(reason="validation_failed").inc()
-                    return
-
-            tenant = evt_dict.get("tenant_id") or "default"
-            evt_dict["tenant_id"] = tenant
-            if not is_valid_tenant(tenant):
-                EVENTS_VALIDATION_FAILED.inc()
-                logger.warning(
-                    "unknown_tenant_id",
-                    extra={"tenant_id": tenant, "reject_reason": "unknown_tenant_id"},
-                )
-                if USE_MANUAL_DLX:
-                    publish_to_dlx_with_reason(ch, body, method.routing_key, "unknown_tenant_id")
-                    ch.basic_ack(delivery_tag=method.delivery_tag)
-                else:
-                    ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-                    EVENTS_NACKED.inc()
-                    EVENTS_NACKED_BY_REASON.labels(reason="unknown_tenant_id").inc()
+            tenant = evt_dict["tenant_id"]
+            doc_id = event_document_id(evt_dict) if DETERMINISTIC_IDS else None
+            if is_recent_duplicate(
+                doc_id, method.redelivered, getattr(properties, "headers", None)
+            ):
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+                DUPLICATE_LOG.record(tenant_id=tenant)
                 return
 
             # Usar alias por tenant para soportar rollover automático
             index_name = f"logs-{tenant}"
 
-            if bulk_indexer:
-                bulk_indexer.add(index=index_name, doc=evt_dict, pipeline="logs_ingest")
+            if bulk_indexer and BULK_DEFERRED_ACK:
+                t = perf_counter_ns()
+                bulk_indexer.add(
+                    index=index_name,
+                    doc=evt_dict,
+                    pipeline="logs_ingest",
+                    ref=PendingDelivery(
+                        method.delivery_tag, body, method.routing_key, tenant, doc_id
+                    ),
+                    doc_id=doc_id,
+                )
+                stage_lap(stages.ENQUEUE, t)
+            elif bulk_indexer:
+                t = perf_counter_ns()
+                bulk_indexer.add(
+                    index=index_name, doc=evt_dict, pipeline="logs_ingest", doc_id=doc_id
+                )
+                t = stage_lap(stages.ENQUEUE, t)
                 ch.basic_ack(delivery_tag=method.delivery_tag)
+                stage_lap(stages.ACK, t)
                 EVENTS_INDEXED.inc()
                 EVENTS_INDEXED_BY_TENANT.labels(tenant_id=tenant).inc()
+                remember_indexed(doc_id)
             else:
                 start_idx = time.time()
                 try:
+                    t = perf_counter_ns()
                     index_event(
                         es,
                         index=index_name,
                         body=evt_dict,
                         pipeline="logs_ingest",
                         ensure_required=False,
+                        doc_id=doc_id,
                     )
+                    t = stage_lap(stages.FLUSH, t)
                     ch.basic_ack(delivery_tag=method.delivery_tag)
+                    stage_lap(stages.ACK, t)
                     EVENTS_INDEXED.inc()
                     EVENTS_INDEXED_BY_TENANT.labels(tenant_id=tenant).inc()
+                    remember_indexed(doc_id)
                     total = time.time() - start_idx
                     INDEX_LATENCY.observe(total)
                     EVENT_INDEX_LATENCY.observe(total)
-                    logger.info(
-                        "event_indexed",
-                        extra={"tenant_id": tenant, "latency_seconds": round(total, 6)},
-                    )
+                    INDEXED_LOG.record(tenant_id=tenant, latency_seconds=total)
                 except Exception:
                     EVENTS_INDEX_FAILED.inc()
-                    EVENTS_NACKED_BY_REASON.labels(reason="index_failed").inc()
                     logger.exception("index_failed")
+                    if spool is not None and spool.append_many(
+                        [spool_encoder.encode(index_name, evt_dict, "logs_ingest", doc_id)]
+                    ):
+                        ch.basic_ack(delivery_tag=method.delivery_tag)
+                        logger.warning("event_spooled", extra={"tenant_id": tenant})
+                        return
+                    EVENTS_NACKED_BY_REASON.labels(reason="index_failed").inc()
                     if USE_MANUAL_DLX:
                         publish_to_dlx_with_reason(ch, body, method.routing_key, "index_failed")
                         ch.basic_ack(delivery_tag=method.delivery_tag)
@@ -354,9 +692,40 @@ def main() -> None:
                     EVENTS_NACKED.inc()
                 except Exception:
                     pass
-
-    channel.basic_qos(prefetch_count=CONSUMER_PREFETCH)
-    channel.basic_consume(queue=queue_name, on_message_callback=handle, auto_ack=False)
+        finally:
+            if gate is not None and not gate.paused:
+                check_backpressure()
+
+    prefetch = CONSUMER_PREFETCH
+    if bulk_indexer:
+
+        def on_flush(result) -> None:
+            # Puede llegar desde el hilo temporizador o un worker: el ack se hace en el
+            # hilo de la conexión pika
+            EVENTS_BULK_FLUSHES.inc()
+            if BULK_DEFERRED_ACK:
+                connection.add_callback_threadsafe(functools.partial(settle_flush, channel, result))
+
+        bulk_indexer.on_flush = on_flush
+        bulk_indexer.start()
+        if BACKPRESSURE_ENABLED:
+            gate = BackpressureGate(BACKPRESSURE_HIGH_BYTES, BACKPRESSURE_LOW_BYTES)
+
+    if bulk_indexer and BULK_DEFERRED_ACK:
+        # Con ack diferido el broker debe poder entregar el batch en buffer más los que
+        # están en vuelo sin recibir acks
+        max_items = controller.max_batch_size if controller else BULK_MAX_ITEMS
+        max_in_flight = controller.max_concurrency if controller else BULK_MAX_IN_FLIGHT
+        batches = max_in_flight + 1 if BULK_BACKGROUND_FLUSH else 1
+        if prefetch < max_items * batches:
+            logger.warning(
+                "prefetch_raised_for_deferred_ack",
+                extra={"prefetch": prefetch, "max_items": max_items},
+            )
+            prefetch = max_items * batches
+
+    channel.basic_qos(prefetch_count=prefetch)
+    start_consume()
     logger.info(
         "consumer_started",
         extra={
@@ -364,26 +733,48 @@ def main() -> None:
             "exchange": exchange,
             "manual_dlx": USE_MANUAL_DLX,
             "bulk": USE_BULK,
-            "prefetch": CONSUMER_PREFETCH,
+            "prefetch": prefetch,
+            "backpressure": gate is not None,
         },
     )
     try:
-        channel.start_consuming()
+        # Bucle propio: start_consuming() termina en cuanto no hay consumers (pausa)
+        while channel.consumer_tags or (gate is not None and gate.paused):
+            connection.process_data_events(time_limit=1)
+            # cProfile pedido por /debug/profile/cprofile (sólo consulta un atributo si no)
+            profiling.poll()
     except KeyboardInterrupt:
         channel.stop_consuming()
     finally:
+        if replayer is not None:
+            replayer.stop(timeout=30.0)
         if bulk_indexer:
             try:
-                bulk_indexer.flush()
-                EVENTS_BULK_FLUSHES.inc()
+                bulk_indexer.close(timeout=30.0)
+                # Ejecuta los acks encolados por on_flush antes de cerrar la conexión
+                connection.process_data_events(time_limit=0)
             except Exception:
                 logger.exception("final_bulk_flush_failed")
+        if spool is not None:
+            spool.close()
+        for event_log in (INDEXED_LOG, HOST_MAPPED_LOG, DUPLICATE_LOG):
+            event_log.flush()
         try:
             connection.close()
         except Exception:
             pass
 
 
+def run(start_metrics_server: bool = True) -> None:
+    """Arranca el motor seleccionado por CONSUMER_ENGINE."""
+    if CONSUMER_ENGINE == "asyncio":
+        from backend.app.processing.async_consumer import main as async_main
+
+        async_main(start_metrics_server=start_metrics_server)
+    else:
+        main(start_metrics_server=start_metrics_server)
+
+
 if __name__ == "__main__":
     configure_logging(level=os.getenv("LOG_LEVEL", "INFO"))
-    main()
+    run()
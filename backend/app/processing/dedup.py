@@ -0,0 +1,74 @@
+import hashlib
+import math
+from typing import Any, Dict, Optional
+
+from prometheus_client import Counter
+
+EVENTS_DEDUPLICATED = Counter(
+    "events_deduplicated_total", "Reentregas descartadas por el filtro de IDs recientes"
+)
+
+# Separador de campos en la entrada del hash (no aparece en texto de log normal)
+_SEP = b"\x1f"
+
+
+def document_id(tenant_id: str, message_raw: str, timestamp: str) -> str:
+    """_id determinista: blake2b-128 de tenant, mensaje original y @timestamp (hex)."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(tenant_id.encode("utf-8"))
+    h.update(_SEP)
+    h.update(message_raw.encode("utf-8", "surrogatepass"))
+    h.update(_SEP)
+    h.update(timestamp.encode("utf-8"))
+    return h.hexdigest()
+
+
+def event_document_id(evt: Dict[str, Any]) -> Optional[str]:
+    """_id del evento normalizado; None si no hay mensaje original (se usa _id automático)."""
+    original = evt.get("original")
+    raw = original.get("message_raw") if isinstance(original, dict) else None
+    if not raw:
+        return None
+    return document_id(str(evt.get("tenant_id", "")), str(raw), str(evt.get("@timestamp", "")))
+
+
+class RecentIdFilter:
+    """
+    Bloom filter rotativo de IDs indexados recientemente (dos generaciones).
+
+    Cada generación admite `capacity` IDs con tasa de falsos positivos `error_rate`; al
+    llenarse la actual pasa a ser la anterior y se descarta la más antigua, de modo que
+    el filtro recuerda entre `capacity` y 2 × `capacity` IDs. No es thread-safe: el
+    consumer lo usa sólo desde el hilo de la conexión.
+    """
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 1e-6):
+        self.capacity = max(1, capacity)
+        self.num_bits = max(8, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self._current = bytearray((self.num_bits + 7) // 8)
+        self._previous = bytearray(len(self._current))
+        self._count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        # Double hashing (Kirsch-Mitzenmacher)
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key: str) -> None:
+        for pos in self._positions(key):
+            self._current[pos >> 3] |= 1 << (pos & 7)
+        self._count += 1
+        if self._count >= self.capacity:
+            self._previous = self._current
+            self._current = bytearray(len(self._previous))
+            self._count = 0
+
+    def __contains__(self, key: str) -> bool:
+        positions = self._positions(key)
+        for bits in (self._current, self._previous):
+            if all(bits[pos >> 3] & (1 << (pos & 7)) for pos in positions):
+                return True
+        return False
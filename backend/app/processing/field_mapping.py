@@ -0,0 +1,155 @@
+"""
+Mapeo declarativo de campos clave=valor a rutas del evento normalizado.
+
+Cada entrada es (clave origen, ruta destino con puntos, cast). El spec se compila una vez
+a una función Python generada (como schema_compiler) con el cast y la ruta en línea: por
+cada clave origen hay una única búsqueda en el kv, y el cast y la asignación sólo se
+ejecutan si la clave está presente. Añadir campos de otro fabricante no requiere tocar
+normalize().
+"""
+import json
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+Cast = Callable[[str], Any]
+MappingSpec = Union[Tuple[str, str], Tuple[str, str, str]]
+
+
+def to_int_safe(v: Optional[str]) -> Optional[int]:
+    if v is None:
+        return None
+    try:
+        return int(v)
+    except Exception:
+        return None
+
+
+def country_code(v: str) -> str:
+    return v.strip().upper().replace(" ", "_")
+
+
+# Un cast que devuelve None deja el campo sin asignar (p.ej. puerto no numérico)
+CASTS: Dict[str, Cast] = {
+    "str": lambda v: v,
+    "int": to_int_safe,
+    "lower": str.lower,
+    "upper": str.upper,
+    "strip": str.strip,
+    "country_code": country_code,
+}
+# Casts que nunca devuelven None, como expresión en línea sobre `v`
+_INLINE_CASTS = {
+    "str": "v",
+    "lower": "v.lower()",
+    "upper": "v.upper()",
+    "strip": "v.strip()",
+    "country_code": "v.strip().upper().replace(' ', '_')",
+}
+
+
+def _target_expr(target: str) -> str:
+    *parents, leaf = target.split(".")
+    expr = "out"
+    for p in parents:
+        expr += f".setdefault({p!r}, {{}})"
+    return f"{expr}[{leaf!r}]"
+
+
+def compile_mapping(
+    spec: Sequence[MappingSpec],
+) -> Callable[[Dict[str, str], Dict[str, Any]], None]:
+    """
+    Genera `apply(kv, out)`: una búsqueda en kv por clave origen y, sólo si está presente,
+    el cast y la asignación en línea (sin llamadas por campo salvo casts no estándar).
+    """
+    by_source: Dict[str, List[Tuple[str, str]]] = {}
+    for entry in spec:
+        by_source.setdefault(entry[0], []).append((entry[1], entry[2] if len(entry) > 2 else "str"))
+    namespace: Dict[str, Any] = {}
+    lines = ["def apply(kv, out):", "    get = kv.get"]
+    for source, targets in by_source.items():
+        lines.append(f"    v = get({source!r})")
+        lines.append("    if v is not None:")
+        for target, cast_name in targets:
+            dest = _target_expr(target)
+            if cast_name in _INLINE_CASTS:
+                lines.append(f"        {dest} = {_INLINE_CASTS[cast_name]}")
+            elif cast_name == "int":
+                lines += [
+                    "        try:",
+                    "            c = int(v)",
+                    "        except Exception:",
+                    "            pass",
+                    "        else:",
+                    f"            {dest} = c",
+                ]
+            else:
+                fn = f"_cast{len(namespace)}"
+                namespace[fn] = CASTS[cast_name]
+                lines += [
+                    f"        c = {fn}(v)",
+                    "        if c is not None:",
+                    f"            {dest} = c",
+                ]
+    source = "\n".join(lines)
+    exec(compile(source, "<field_mapping_compiled>", "exec"), namespace)
+    fn = namespace["apply"]
+    fn.__source__ = source
+    return fn
+
+
+class FieldMapper:
+    """
+    Spec validado y compilado. apply(kv, out) escribe en `out` los destinos de las claves
+    presentes en `kv`. Dos entradas no pueden escribir el mismo destino; sí puede una clave
+    alimentar varios destinos.
+    """
+
+    def __init__(self, spec: Iterable[MappingSpec]):
+        self.spec: Tuple[MappingSpec, ...] = tuple(spec)
+        targets: Dict[str, str] = {}
+        for entry in self.spec:
+            if len(entry) not in (2, 3) or not entry[0] or not entry[1]:
+                raise ValueError(f"mapeo inválido: {entry!r}")
+            source, target = entry[0], entry[1]
+            cast_name = entry[2] if len(entry) > 2 else "str"
+            if cast_name not in CASTS:
+                raise ValueError(f"cast desconocido para {source!r}: {cast_name!r}")
+            if "" in target.split("."):
+                raise ValueError(f"mapeo inválido: {entry!r}")
+            if target in targets:
+                raise ValueError(f"destino {target!r} duplicado ({targets[target]!r} y {source!r})")
+            targets[target] = source
+        for target in targets:
+            # "a" y "a.b" a la vez: el segundo haría setdefault sobre un valor escalar
+            parts = target.split(".")
+            for i in range(1, len(parts)):
+                parent = ".".join(parts[:i])
+                if parent in targets:
+                    raise ValueError(f"destino {target!r} anidado bajo {parent!r}")
+        self._apply = compile_mapping(self.spec)
+
+    @property
+    def sources(self) -> frozenset:
+        return frozenset(e[0] for e in self.spec)
+
+    def apply(self, kv: Dict[str, str], out: Dict[str, Any]) -> Dict[str, Any]:
+        self._apply(kv, out)
+        return out
+
+
+def load_mapping_file(path: str) -> List[MappingSpec]:
+    """
+    Mapeos adicionales desde JSON: lista de {"source", "target", "cast"} (cast opcional)
+    o de listas [source, target, cast].
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("mappings", [])
+    out: List[MappingSpec] = []
+    for item in data:
+        if isinstance(item, dict):
+            out.append((item["source"], item["target"], item.get("cast", "str")))
+        else:
+            out.append(tuple(item))  # type: ignore[arg-type]
+    return out
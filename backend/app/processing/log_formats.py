@@ -0,0 +1,544 @@
+"""
+Detección de formato y parsers de los mensajes syslog que llegan al normalizador.
+
+Dos niveles:
+- Envoltorio: PRI (`<N>`) y, si el mensaje es RFC 5424 (`<N>1 TIMESTAMP HOST APP ...`), la
+  cabecera y los structured data. El resto es el payload.
+- Payload: CEF, LEEF, JSON o el formato por defecto (clave=valor de Fortinet, que también
+  cubre texto libre). Se elige con comprobaciones baratas de prefijo / primeros tokens.
+
+ParserRegistry cachea el formato detectado por host de origen (LRU con TTL), de modo que el
+sniffing se hace una vez por dispositivo; si el parser cacheado rechaza un mensaje se vuelve
+a detectar. Todos los parsers devuelven un ParsedLog con los mismos campos NCS parciales que
+normalize() completa (tenant, dataset, timestamp por defecto) antes de prepare_event.
+"""
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from prometheus_client import Counter
+
+from backend.app.core import json_codec
+from backend.app.processing.field_mapping import FieldMapper
+from backend.app.processing.timestamps import epoch_ms_to_iso
+
+EVENTS_BY_FORMAT = Counter(
+    "normalizer_events_by_format_total", "Eventos normalizados por formato detectado", ["format"]
+)
+
+FORMAT_FORTINET_KV = "fortinet_kv"
+FORMAT_CEF = "cef"
+FORMAT_LEEF = "leef"
+FORMAT_JSON = "json"
+
+
+class ParsedLog(NamedTuple):
+    """
+    kv: pares planos del mensaje (van a original.raw_kv).
+    fields: NCS parcial; las claves especiales "@timestamp", "severity", "host" y "message"
+    se combinan en normalize() con el raw y el envoltorio.
+    """
+
+    kv: Dict[str, str]
+    fields: Dict[str, Any]
+
+
+class Envelope(NamedTuple):
+    payload: str
+    pri: Optional[int] = None
+    # Cabecera RFC 5424 ya en NCS parcial (@timestamp, host, app...) y structured data
+    fields: Optional[Dict[str, Any]] = None
+    structured_data: Optional[Dict[str, Dict[str, str]]] = None
+
+
+# Severidad syslog (PRI % 8) -> NCS
+_SYSLOG_SEVERITY = ("critical", "critical", "critical", "high", "medium", "info", "info", "info")
+
+
+def severity_from_scale(value: Any) -> Optional[str]:
+    """Severidad numérica 0–10 (CEF, LEEF) a NCS; texto (Low, High...) en minúsculas."""
+    try:
+        n = int(str(value).strip())
+    except (TypeError, ValueError):
+        text = str(value).strip().lower()
+        if not text:
+            return None
+        return "critical" if text == "very-high" else text
+    if n <= 3:
+        return "low"
+    if n <= 6:
+        return "medium"
+    if n <= 8:
+        return "high"
+    return "critical"
+
+
+def epoch_or_text_to_iso(value: str, formats: Tuple[str, ...] = ()) -> Optional[str]:
+    """Epoch en ms/s o uno de `formats` (strptime) a ISO 8601 UTC; None si no encaja."""
+    v = value.strip()
+    if v.isdigit():
+        n = int(v)
+        try:
+            return epoch_ms_to_iso(n if n > 10**11 else n * 1000)
+        except (OverflowError, OSError, ValueError):
+            return None
+    for fmt in formats:
+        try:
+            dt = datetime.strptime(v, fmt)
+        except ValueError:
+            continue
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.isoformat()
+    return None
+
+
+# --- Envoltorio (PRI + RFC 5424) ---
+
+_SD_ELEMENT_RE = re.compile(r'\[([^\s\]=]+)((?:\s+[^\s=\]"]+="(?:[^"\\]|\\.)*")*)\s*\]')
+_SD_PARAM_RE = re.compile(r'([^\s=\]"]+)="((?:[^"\\]|\\.)*)"')
+_SD_UNESCAPE_RE = re.compile(r'\\([\\"\]])')
+
+
+def _nil(v: str) -> Optional[str]:
+    return None if v == "-" else v
+
+
+def parse_envelope(msg: str) -> Envelope:
+    s = msg
+    pri = None
+    if s.startswith("<"):
+        end = s.find(">", 1)
+        if end > 1 and s[1:end].isdecimal():
+            pri = int(s[1:end])
+            s = s[end + 1 :]
+    s = s.strip()
+    # RFC 5424: VERSION SP TIMESTAMP SP HOSTNAME SP APP-NAME SP PROCID SP MSGID SP SD [SP MSG]
+    if pri is None or not s.startswith("1 "):
+        return Envelope(s, pri)
+    parts = s.split(" ", 6)
+    if len(parts) < 7:
+        return Envelope(s, pri)
+    _, ts, host, app, procid, msgid, rest = parts
+    if ts != "-" and "T" not in ts:
+        return Envelope(s, pri)
+    sd: Dict[str, Dict[str, str]] = {}
+    if rest.startswith("-"):
+        payload = rest[1:]
+    elif rest.startswith("["):
+        pos = 0
+        while rest.startswith("[", pos):
+            m = _SD_ELEMENT_RE.match(rest, pos)
+            if m is None:
+                return Envelope(s, pri)
+            sd[m.group(1)] = {
+                k: _SD_UNESCAPE_RE.sub(r"\1", v) for k, v in _SD_PARAM_RE.findall(m.group(2))
+            }
+            pos = m.end()
+        payload = rest[pos:]
+    else:
+        return Envelope(s, pri)
+    payload = payload[1:] if payload.startswith(" ") else payload
+    if payload.startswith("\ufeff"):
+        payload = payload[1:]
+    fields: Dict[str, Any] = {"severity": _SYSLOG_SEVERITY[pri % 8]}
+    if _nil(ts):
+        fields["@timestamp"] = ts
+    if _nil(host):
+        fields["host"] = host
+    app_fields = {
+        k: v for k, v in (("name", _nil(app)), ("pid", _nil(procid)), ("msgid", _nil(msgid))) if v
+    }
+    if app_fields:
+        fields["process"] = app_fields
+    return Envelope(payload.strip(), pri, fields, sd or None)
+
+
+# --- CEF ---
+
+_CEF_KEY = r"[\w.\-\[\]]+"
+_CEF_EXT_RE = re.compile(rf"({_CEF_KEY})=((?:[^=\\]|\\.)*?)(?=\s+{_CEF_KEY}=|\s*$)", re.S)
+_CEF_UNESCAPE = {"\\": "\\", "=": "=", "|": "|", "n": "\n", "r": "\r"}
+_CEF_ESCAPE_RE = re.compile(r"\\(.)", re.S)
+# Formato de `rt`/`end` de ArcSight cuando no es epoch
+_CEF_TIME_FORMATS = ("%b %d %Y %H:%M:%S", "%b %d %Y %H:%M:%S.%f", "%b %d %H:%M:%S")
+
+CEF_FIELD_MAPPINGS = [
+    ("src", "source.ip"),
+    ("dst", "destination.ip"),
+    ("spt", "source.port", "int"),
+    ("dpt", "destination.port", "int"),
+    ("shost", "source.host"),
+    ("dhost", "destination.host"),
+    ("proto", "network.protocol", "lower"),
+    ("act", "event.action"),
+    ("cnt", "event.count", "int"),
+    ("suser", "user.name"),
+    ("suid", "user.id"),
+    ("cat", "category"),
+    ("request", "url.original"),
+]
+
+
+def _cef_unescape(v: str) -> str:
+    if "\\" not in v:
+        return v
+    return _CEF_ESCAPE_RE.sub(lambda m: _CEF_UNESCAPE.get(m.group(1), m.group(0)), v)
+
+
+_HEADER_UNESCAPE_RE = re.compile(r"\\([\\|])")
+
+
+def _split_header(s: str, count: int) -> Optional[List[str]]:
+    """Primeros `count` campos separados por `|` no escapado, más el resto."""
+    fields: List[str] = []
+    start = pos = 0
+    while len(fields) < count:
+        bar = s.find("|", pos)
+        if bar == -1:
+            return None
+        # Barras invertidas consecutivas antes del `|`: impares = escapado
+        back = bar
+        while back > start and s[back - 1] == "\\":
+            back -= 1
+        if (bar - back) % 2:
+            pos = bar + 1
+            continue
+        fields.append(_HEADER_UNESCAPE_RE.sub(r"\1", s[start:bar]))
+        start = pos = bar + 1
+    fields.append(s[start:])
+    return fields
+
+
+def _marker_offset(payload: str, marker: str) -> int:
+    # Al principio o tras una cabecera RFC 3164 ("Jan 12 10:00:00 host CEF:0|...")
+    if payload.startswith(marker):
+        return 0
+    i = payload.find(" " + marker, 0, 128)
+    return -1 if i == -1 else i + 1
+
+
+class CefParser:
+    name = FORMAT_CEF
+
+    def __init__(self):
+        self.mapper = FieldMapper(CEF_FIELD_MAPPINGS)
+
+    def sniff(self, payload: str) -> bool:
+        return _marker_offset(payload, "CEF:") != -1
+
+    def parse(self, payload: str) -> Optional[ParsedLog]:
+        i = _marker_offset(payload, "CEF:")
+        if i == -1:
+            return None
+        header = _split_header(payload[i + 4 :], 7)
+        if header is None:
+            return None
+        version, vendor, product, dev_version, signature, name, severity, ext = header
+        kv = {k: _cef_unescape(v) for k, v in _CEF_EXT_RE.findall(ext.strip())}
+        fields: Dict[str, Any] = {}
+        self.mapper.apply(kv, fields)
+        fields["observer"] = {"vendor": vendor, "product": product, "version": dev_version}
+        fields.setdefault("event", {})["id"] = signature
+        fields["message"] = kv.get("msg") or name
+        sev = severity_from_scale(severity)
+        if sev:
+            fields["severity"] = sev
+        ts = kv.get("rt") or kv.get("end")
+        iso = epoch_or_text_to_iso(ts, _CEF_TIME_FORMATS) if ts else None
+        if iso:
+            fields["@timestamp"] = iso
+        host = kv.get("dvchost") or kv.get("dvc")
+        if host:
+            fields["host"] = host
+        kv.setdefault("cef_version", version)
+        return ParsedLog(kv, fields)
+
+
+# --- LEEF ---
+
+LEEF_FIELD_MAPPINGS = [
+    ("src", "source.ip"),
+    ("dst", "destination.ip"),
+    ("srcPort", "source.port", "int"),
+    ("dstPort", "destination.port", "int"),
+    ("proto", "network.protocol", "lower"),
+    ("usrName", "user.name"),
+    ("cat", "category"),
+    ("action", "event.action"),
+    ("url", "url.original"),
+]
+_LEEF_TIME_FORMATS = ("%b %d %Y %H:%M:%S", "%b %d %Y %H:%M:%S.%f")
+
+
+def _leef_delimiter(spec: str) -> str:
+    # LEEF 2.0: carácter literal, "\t" o hexadecimal ("x5E" / "0x5E")
+    spec = spec.strip()
+    if not spec:
+        return "\t"
+    if spec in ("\\t", "tab"):
+        return "\t"
+    hexa = spec[2:] if spec.lower().startswith("0x") else spec[1:] if spec[:1] in "xX" else ""
+    if hexa:
+        try:
+            return chr(int(hexa, 16))
+        except ValueError:
+            pass
+    return spec[0]
+
+
+class LeefParser:
+    name = FORMAT_LEEF
+
+    def __init__(self):
+        self.mapper = FieldMapper(LEEF_FIELD_MAPPINGS)
+
+    def sniff(self, payload: str) -> bool:
+        return _marker_offset(payload, "LEEF:") != -1
+
+    def parse(self, payload: str) -> Optional[ParsedLog]:
+        i = _marker_offset(payload, "LEEF:")
+        if i == -1:
+            return None
+        body = payload[i + 5 :]
+        header = _split_header(body, 5)
+        if header is None:
+            return None
+        version, vendor, product, dev_version, event_id, attrs = header
+        delimiter = "\t"
+        if version.startswith("2"):
+            more = _split_header(attrs, 1)
+            if more is not None:
+                delimiter = _leef_delimiter(more[0])
+                attrs = more[1]
+        kv: Dict[str, str] = {}
+        for pair in attrs.split(delimiter):
+            key, sep, value = pair.partition("=")
+            key = key.strip()
+            if sep and key:
+                kv[key] = value
+        fields: Dict[str, Any] = {}
+        self.mapper.apply(kv, fields)
+        fields["observer"] = {"vendor": vendor, "product": product, "version": dev_version}
+        fields.setdefault("event", {})["id"] = event_id
+        fields["message"] = kv.get("msg") or event_id
+        sev = severity_from_scale(kv["sev"]) if kv.get("sev") else None
+        if sev:
+            fields["severity"] = sev
+        if kv.get("devTime"):
+            iso = epoch_or_text_to_iso(kv["devTime"], _LEEF_TIME_FORMATS)
+            if iso:
+                fields["@timestamp"] = iso
+        host = kv.get("identHostName") or kv.get("devName")
+        if host:
+            fields["host"] = host
+        kv.setdefault("leef_version", version)
+        return ParsedLog(kv, fields)
+
+
+# --- JSON nativo ---
+
+# Objetos NCS que se copian tal cual si vienen en el JSON
+_JSON_NCS_OBJECTS = ("source", "destination", "network", "user", "threat", "rule", "event")
+
+JSON_FIELD_MAPPINGS = [
+    ("src_ip", "source.ip"),
+    ("dst_ip", "destination.ip"),
+    ("src_port", "source.port", "int"),
+    ("dst_port", "destination.port", "int"),
+    ("protocol", "network.protocol", "lower"),
+]
+
+
+def _first_str(obj: Dict[str, Any], keys: Tuple[str, ...]) -> Optional[str]:
+    for k in keys:
+        v = obj.get(k)
+        if isinstance(v, str) and v:
+            return v
+    return None
+
+
+class JsonParser:
+    name = FORMAT_JSON
+
+    def __init__(self):
+        self.mapper = FieldMapper(JSON_FIELD_MAPPINGS)
+
+    def sniff(self, payload: str) -> bool:
+        return payload.startswith("{") and payload.endswith("}")
+
+    def parse(self, payload: str) -> Optional[ParsedLog]:
+        if not self.sniff(payload):
+            return None
+        try:
+            obj = json_codec.loads(payload)
+        except ValueError:
+            return None
+        if not isinstance(obj, dict):
+            return None
+        kv = {
+            k: v if isinstance(v, str) else json.dumps(v)
+            for k, v in obj.items()
+            if v is None or isinstance(v, (str, int, float, bool))
+        }
+        fields: Dict[str, Any] = {}
+        for key in _JSON_NCS_OBJECTS:
+            if isinstance(obj.get(key), dict):
+                fields[key] = dict(obj[key])
+        labels = obj.get("labels")
+        if isinstance(labels, dict) and all(isinstance(v, str) for v in labels.values()):
+            fields["labels"] = dict(labels)
+        # Los campos planos (src_ip...) completan, sin pisar, los objetos copiados
+        flat: Dict[str, Any] = {}
+        self.mapper.apply(kv, flat)
+        for key, value in flat.items():
+            if isinstance(value, dict) and isinstance(fields.get(key), dict):
+                for k, v in value.items():
+                    fields[key].setdefault(k, v)
+            else:
+                fields.setdefault(key, value)
+        message = _first_str(obj, ("message", "msg"))
+        if message:
+            fields["message"] = message
+        ts = _first_str(obj, ("@timestamp", "timestamp", "time"))
+        if ts:
+            fields["@timestamp"] = ts
+        host = obj.get("host")
+        if isinstance(host, dict):
+            host = host.get("name") or host.get("hostname")
+        host = host if isinstance(host, str) and host else _first_str(obj, ("hostname",))
+        if host:
+            fields["host"] = host
+        sev = _first_str(obj, ("severity", "level"))
+        if sev:
+            fields["severity"] = sev
+        category = _first_str(obj, ("category",))
+        if category:
+            fields["category"] = category
+        return ParsedLog(kv, fields)
+
+
+# --- Registro ---
+
+
+class FormatParser(NamedTuple):
+    name: str
+    sniff: Callable[[str], bool]
+    parse: Callable[[str], Optional[ParsedLog]]
+    # Prefijos inequívocos del formato: un host cacheado con el formato por defecto se
+    # vuelve a detectar si el mensaje empieza por uno de ellos
+    prefixes: Tuple[str, ...] = ()
+
+
+class ParserRegistry:
+    """
+    Parsers de payload en orden de prioridad, más uno por defecto que acepta cualquier
+    mensaje. `parse(payload, host)` usa el formato cacheado del host si su parser acepta el
+    mensaje; si no (o no hay host), detecta con los sniffers en orden.
+    """
+
+    def __init__(
+        self,
+        default: FormatParser,
+        cache_size: int = 10_000,
+        cache_ttl_seconds: float = 300.0,
+    ):
+        self.default = default
+        self._parsers: List[FormatParser] = []
+        self._by_name: Dict[str, FormatParser] = {default.name: default}
+        self._counters = {default.name: EVENTS_BY_FORMAT.labels(format=default.name)}
+        self.cache_size = max(0, cache_size)
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self._cache: "OrderedDict[str, Tuple[FormatParser, float]]" = OrderedDict()
+        self._foreign_prefixes: Tuple[str, ...] = ()
+        self._lock = threading.Lock()
+
+    def register(self, parser: FormatParser) -> None:
+        if parser.name in self._by_name:
+            raise ValueError(f"formato ya registrado: {parser.name}")
+        self._parsers.append(parser)
+        self._by_name[parser.name] = parser
+        self._counters[parser.name] = EVENTS_BY_FORMAT.labels(format=parser.name)
+        self._foreign_prefixes = tuple(p for fp in self._parsers for p in fp.prefixes)
+
+    @property
+    def formats(self) -> List[str]:
+        return [p.name for p in self._parsers] + [self.default.name]
+
+    def detect(self, payload: str) -> FormatParser:
+        for parser in self._parsers:
+            if parser.sniff(payload):
+                return parser
+        return self.default
+
+    def _cached(self, host: str) -> Optional[FormatParser]:
+        # Lectura sin lock (operaciones atómicas de OrderedDict); sólo se escribe con lock
+        entry = self._cache.get(host)
+        if entry is None:
+            return None
+        parser, expires = entry
+        if time.monotonic() >= expires:
+            self.invalidate(host)
+            return None
+        try:
+            self._cache.move_to_end(host)
+        except KeyError:
+            pass
+        return parser
+
+    def _remember(self, host: str, parser: FormatParser) -> None:
+        if not self.cache_size:
+            return
+        with self._lock:
+            self._cache[host] = (parser, time.monotonic() + self.cache_ttl_seconds)
+            self._cache.move_to_end(host)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, host: Optional[str] = None) -> None:
+        with self._lock:
+            if host is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(host, None)
+
+    def parse(self, payload: str, host: Optional[str] = None) -> Tuple[str, ParsedLog]:
+        if host:
+            parser = self._cached(host)
+            if parser is self.default and payload.startswith(self._foreign_prefixes):
+                parser = None
+            if parser is not None:
+                result = parser.parse(payload)
+                if result is not None:
+                    self._counters[parser.name].inc()
+                    return parser.name, result
+        parser = self.detect(payload)
+        result = parser.parse(payload)
+        if result is None and parser is not self.default:
+            parser = self.default
+            result = parser.parse(payload)
+        if result is None:
+            # El parser por defecto no debería rechazar; se conserva el texto como mensaje
+            result = ParsedLog({}, {"message": payload})
+        elif host:
+            self._remember(host, parser)
+        self._counters[parser.name].inc()
+        return parser.name, result
+
+
+def _methods(parser: Any) -> Tuple[Callable[[str], bool], Callable[[str], Optional[ParsedLog]]]:
+    return parser.sniff, parser.parse
+
+
+def build_registry(
+    default: FormatParser, cache_size: int = 10_000, cache_ttl_seconds: float = 300.0
+) -> ParserRegistry:
+    registry = ParserRegistry(default, cache_size, cache_ttl_seconds)
+    registry.register(FormatParser(FORMAT_JSON, *_methods(JsonParser()), ("{",)))
+    registry.register(FormatParser(FORMAT_CEF, *_methods(CefParser()), ("CEF:",)))
+    registry.register(FormatParser(FORMAT_LEEF, *_methods(LeefParser()), ("LEEF:",)))
+    return registry
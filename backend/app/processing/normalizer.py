@@ -2,17 +2,76 @@
 """
 Normalizador Fortinet extendido.
 Castea campos numéricos (puertos, count, crscore, pps) a int para cumplir con el schema.
+Otros formatos (RFC 5424, CEF, LEEF, JSON) se detectan y parsean en log_formats.py.
+
+Contrato de salida: normalize() devuelve objetos nuevos (o el propio dict recibido) que pasan
+a ser propiedad del llamante, con sólo tipos JSON y timestamps ya en ISO 8601. El consumer
+los modifica en el sitio y omite coerce_datetimes.
 """
+import functools
 import os
 import re
 from datetime import datetime, timezone
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from backend.app.core.config import settings
+from backend.app.processing.field_mapping import (
+    FieldMapper,
+    MappingSpec,
+    load_mapping_file,
+    to_int_safe,
+)
+from backend.app.processing.log_formats import (
+    FORMAT_CEF,
+    FORMAT_FORTINET_KV,
+    FORMAT_JSON,
+    FORMAT_LEEF,
+    FormatParser,
+    ParsedLog,
+    ParserRegistry,
+    build_registry,
+    parse_envelope,
+)
+from backend.app.processing.timestamps import kv_datetime_to_iso, ns_epoch_to_iso
 
 KV_RE = re.compile(r"(\w+)=(\".*?\"|[^\"\s]+)")
 PRI_RE = re.compile(r"^<\d+>")
 PPS_RE = re.compile(r"pps\s+(\d+)\b")
+# Misma gramática que KV_RE, pero captura el valor entrecomillado sin comillas: un único
+# recorrido del mensaje, sin post-procesado por par
+KV_TOKEN_RE = re.compile(r'(\w+)=(?:"([^"\n]*)"|([^"\s]+))')
+
+# Campos kv que se copian tal cual (o con un cast simple) al evento: (clave, destino, cast).
+# Los que combinan varias fuentes (timestamp, severidad, host) siguen en normalize().
+FORTINET_FIELD_MAPPINGS: List[MappingSpec] = [
+    ("srcip", "source.ip"),
+    ("dstip", "destination.ip"),
+    ("srcport", "source.port", "int"),
+    ("dstport", "destination.port", "int"),
+    ("proto", "network.protocol"),
+    ("attack", "threat.name"),
+    ("attackid", "threat.id"),
+    ("crscore", "threat.score", "int"),
+    ("craction", "threat.action"),
+    ("policyid", "rule.id"),
+    ("count", "event.count", "int"),
+    ("srccountry", "source.geo.country_iso_code", "country_code"),
+    ("dstcountry", "destination.geo.country_iso_code", "country_code"),
+    ("service", "labels.service"),
+    ("proto", "labels.proto"),
+]
+# JSON con mapeos adicionales (p.ej. campos de otro fabricante), ver field_mapping.py
+FIELD_MAPPINGS_PATH = os.getenv("NORMALIZER_FIELD_MAPPINGS", "")
+
+
+def build_field_mapper(extra_path: Optional[str] = None) -> FieldMapper:
+    spec = list(FORTINET_FIELD_MAPPINGS)
+    if extra_path:
+        spec.extend(load_mapping_file(extra_path))
+    return FieldMapper(spec)
+
+
+FIELD_MAPPER = build_field_mapper(FIELD_MAPPINGS_PATH)
 
 
 def parse_kv(s: str) -> Dict[str, str]:
@@ -26,43 +85,131 @@ def parse_kv(s: str) -> Dict[str, str]:
     return out
 
 
-def ns_epoch_to_iso(ns_str: str) -> str:
-    try:
-        ns = int(ns_str)
-        ms = ns // 1_000_000
-        dt = datetime.fromtimestamp(ms / 1000.0, tz=timezone.utc)
-        return dt.isoformat()
-    except Exception:
-        return datetime.now(timezone.utc).isoformat()
+def strip_pri(s: str) -> str:
+    return PRI_RE.sub("", s, count=1)
 
 
-def to_int_safe(v: Optional[str]) -> Optional[int]:
-    if v is None:
-        return None
-    try:
-        return int(v)
-    except Exception:
-        return None
+def kv_pairs(s: str) -> Dict[str, str]:
+    """Pares clave=valor de un mensaje ya sin PRI (misma gramática que parse_kv)."""
+    # Sólo uno de los dos grupos de valor participa en cada match; el otro es ""
+    return {k: quoted or bare for k, quoted, bare in KV_TOKEN_RE.findall(s)}
 
 
-def strip_pri(s: str) -> str:
-    return PRI_RE.sub("", s, count=1)
+def tokenize(msg: str) -> Tuple[str, Dict[str, str]]:
+    """
+    Quita el PRI syslog y extrae los pares clave=valor en una pasada.
+    Equivale a `parse_kv(strip_pri(msg).strip())`; devuelve (mensaje limpio, kv).
+    """
+    s = msg
+    if s.startswith("<"):
+        end = s.find(">", 1)
+        if end > 1 and s[1:end].isdecimal():
+            s = s[end + 1 :]
+    s = s.strip()
+    return s, kv_pairs(s)
+
+
+def parse_fortinet_kv(payload: str, mapper: Optional[FieldMapper] = None) -> ParsedLog:
+    """Parser por defecto: clave=valor de FortiGate (y texto libre sin pares)."""
+    # parse_envelope ya quitó el PRI; tokenize() es el mismo recorrido que cubre el test golden
+    payload, kv = tokenize(payload)
+    fields: Dict[str, Any] = {}
+
+    # Prefijo por segundo y offsets tz cacheados (timestamps.py)
+    if "eventtime" in kv:
+        fields["@timestamp"] = ns_epoch_to_iso(kv["eventtime"])
+    else:
+        date = kv.get("date")
+        timev = kv.get("time")
+        if date and timev:
+            fields["@timestamp"] = kv_datetime_to_iso(date, timev, kv.get("tz"))
+
+    text = kv.get("msg") or payload
+    fields["message"] = text
+
+    sev = kv.get("severity") or kv.get("level") or kv.get("crlevel")
+    if sev:
+        fields["severity"] = sev
+
+    host = kv.get("devname") or kv.get("devid")
+    if host:
+        fields["host"] = host
+
+    # Campos directos (IPs, puertos, protocolo, threat, policy, count)
+    (mapper or FIELD_MAPPER).apply(kv, fields)
 
+    # PPS: sólo en el texto del mensaje (msg), no en todo el payload
+    pps_match = PPS_RE.search(text) if "pps" in text else None
+    if pps_match:
+        pps_val = to_int_safe(pps_match.group(1))
+        if pps_val is not None:
+            fields.setdefault("flow", {})["packets_per_second"] = pps_val
+    return ParsedLog(kv, fields)
+
+
+def build_parser_registry(
+    mapper: Optional[FieldMapper] = None,
+    autodetect: bool = True,
+    cache_size: int = 10_000,
+    cache_ttl_seconds: float = 300.0,
+) -> ParserRegistry:
+    default = FormatParser(
+        FORMAT_FORTINET_KV,
+        lambda payload: True,
+        functools.partial(parse_fortinet_kv, mapper=mapper) if mapper else parse_fortinet_kv,
+    )
+    if not autodetect:
+        return ParserRegistry(default, cache_size=0)
+    return build_registry(default, cache_size, cache_ttl_seconds)
 
-def normalize(raw: Dict[str, Any]) -> Dict[str, Any]:
+
+# Detección de formato (CEF, LEEF, JSON; resto clave=valor) con caché por host de origen
+AUTODETECT = os.getenv("NORMALIZER_AUTODETECT", "true").lower() == "true"
+FORMAT_CACHE_SIZE = int(os.getenv("NORMALIZER_FORMAT_CACHE_SIZE", "10000"))
+FORMAT_CACHE_TTL_SECONDS = float(os.getenv("NORMALIZER_FORMAT_CACHE_TTL_SECONDS", "300"))
+PARSERS = build_parser_registry(
+    autodetect=AUTODETECT,
+    cache_size=FORMAT_CACHE_SIZE,
+    cache_ttl_seconds=FORMAT_CACHE_TTL_SECONDS,
+)
+
+# dataset por defecto según formato (si el raw no trae uno)
+FORMAT_DATASETS = {
+    FORMAT_CEF: "syslog.cef",
+    FORMAT_LEEF: "syslog.leef",
+    FORMAT_JSON: "syslog.json",
+}
+
+
+def normalize(raw: Dict[str, Any], registry: Optional[ParserRegistry] = None) -> Dict[str, Any]:
     if not isinstance(raw, dict):
         return raw
     msg_raw = raw.get("message")
     if not isinstance(msg_raw, str):
         return raw
 
+    envelope = parse_envelope(msg_raw)
+    env_fields = dict(envelope.fields) if envelope.fields else {}
+    raw_host = raw.get("host")
+    source_host = raw_host if isinstance(raw_host, str) and raw_host else env_fields.get("host")
+    fmt, parsed = (registry or PARSERS).parse(envelope.payload, source_host)
+    fields = parsed.fields
+    # Campos que se combinan con el raw y la cabecera RFC 5424; el resto se copia al final
+    parsed_ts = fields.pop("@timestamp", None)
+    parsed_msg = fields.pop("message", None)
+    parsed_sev = fields.pop("severity", None)
+    parsed_host = fields.pop("host", None)
+    env_ts = env_fields.pop("@timestamp", None)
+    env_sev = env_fields.pop("severity", None)
+    env_host = env_fields.pop("host", None)
+
     out: Dict[str, Any] = {}
     out["original"] = out.get("original", {})
     out["original"]["message_raw"] = msg_raw
-
-    cleaned = strip_pri(msg_raw).strip()
-    kv = parse_kv(cleaned)
-    out["original"]["raw_kv"] = kv
+    out["original"]["raw_kv"] = parsed.kv
+    out["original"]["format"] = fmt
+    if envelope.structured_data:
+        out["original"]["structured_data"] = envelope.structured_data
 
     # tenant_id: no autocompletamos "default" siempre. Comportamiento:
     # - Si ya viene en el evento raw, lo usamos.
@@ -82,103 +229,36 @@ def normalize(raw: Dict[str, Any]) -> Dict[str, Any]:
             if default_tenant:
                 out["tenant_id"] = default_tenant
 
-    out["dataset"] = raw.get("dataset", "syslog.generic")
+    out["dataset"] = raw.get("dataset", FORMAT_DATASETS.get(fmt, "syslog.generic"))
     out["schema_version"] = raw.get("schema_version", "1.0.0")
 
-    ts = None
-    if "eventtime" in kv:
-        ts = ns_epoch_to_iso(kv.get("eventtime"))
-    else:
-        date = kv.get("date")
-        timev = kv.get("time")
-        tz = kv.get("tz")
-        if date and timev:
-            try:
-                if tz and re.match(r"^[+-]\d{4}$", tz):
-                    tz = tz[:3] + ":" + tz[3:]
-                ts = f"{date}T{timev}{tz}" if tz else f"{date}T{timev}Z"
-            except Exception:
-                ts = None
+    # Prioridad: payload > cabecera RFC 5424 > raw > hora de proceso
+    ts = parsed_ts or env_ts
     if ts is None:
         ts = raw.get("@timestamp") or raw.get("timestamp") or datetime.now(timezone.utc).isoformat()
     out["@timestamp"] = ts
 
-    out["message"] = kv.get("msg") or cleaned
+    out["message"] = parsed_msg or envelope.payload
 
     # Severidad: conserva original y normaliza a minúsculas para schema/queries
-    sev_in = (
-        raw.get("severity") or kv.get("severity") or kv.get("level") or kv.get("crlevel") or "info"
-    )
+    sev_in = raw.get("severity") or parsed_sev or env_sev or "info"
     sev_str = str(sev_in)
     out["severity_original"] = sev_str
     out["severity"] = sev_str.lower()
 
     # Host
-    host = raw.get("host") or kv.get("devname") or kv.get("devid")
+    host = raw.get("host") or parsed_host or env_host
     if host:
         out["host"] = host
         out["host_name"] = host
 
-    # IPs
-    if "srcip" in kv:
-        out.setdefault("source", {})["ip"] = kv.get("srcip")
-    if "dstip" in kv:
-        out.setdefault("destination", {})["ip"] = kv.get("dstip")
-
-    # Puertos -> int
-    sp = to_int_safe(kv.get("srcport"))
-    if sp is not None:
-        out.setdefault("source", {})["port"] = sp
-    dp = to_int_safe(kv.get("dstport"))
-    if dp is not None:
-        out.setdefault("destination", {})["port"] = dp
-
-    # Protocolo
-    if "proto" in kv:
-        out.setdefault("network", {})["protocol"] = kv.get("proto")
-
-    # Threat / Policy / Score / Action
-    if "attack" in kv:
-        out.setdefault("threat", {})["name"] = kv.get("attack")
-    if "attackid" in kv:
-        out.setdefault("threat", {})["id"] = kv.get("attackid")
-    crscore = to_int_safe(kv.get("crscore"))
-    if crscore is not None:
-        out.setdefault("threat", {})["score"] = crscore
-    if "craction" in kv:
-        out.setdefault("threat", {})["action"] = kv.get("craction")
-
-    if "policyid" in kv:
-        out.setdefault("rule", {})["id"] = kv.get("policyid")
-
-    # Count
-    cnt = to_int_safe(kv.get("count"))
-    if cnt is not None:
-        out.setdefault("event", {})["count"] = cnt
-
-    # PPS (regex sobre mensaje)
-    pps_match = PPS_RE.search(cleaned)
-    if pps_match:
-        pps_val = to_int_safe(pps_match.group(1))
-        if pps_val is not None:
-            out.setdefault("flow", {})["packets_per_second"] = pps_val
-
-    # Countries (simplificación)
-    if "srccountry" in kv:
-        out.setdefault("source", {}).setdefault("geo", {})["country_iso_code"] = (
-            kv.get("srccountry").strip().upper().replace(" ", "_")
-        )
-    if "dstcountry" in kv:
-        out.setdefault("destination", {}).setdefault("geo", {})["country_iso_code"] = (
-            kv.get("dstcountry").strip().upper().replace(" ", "_")
-        )
-
-    # Labels (subset)
-    labels = {}
-    for k in ("service", "proto"):
-        if k in kv:
-            labels[k] = kv.get(k)
-    if labels:
-        out["labels"] = labels
+    # Resto de campos NCS del parser (y de la cabecera RFC 5424, sin pisarlos)
+    for source in (fields, env_fields) if env_fields else (fields,):
+        for key, value in source.items():
+            if key not in out:
+                out[key] = value
+            elif isinstance(value, dict) and isinstance(out[key], dict):
+                for k, v in value.items():
+                    out[key].setdefault(k, v)
 
     return out
@@ -0,0 +1,280 @@
+"""
+Compilador de JSON Schema (Draft 7, subconjunto) a una función Python especializada.
+
+Genera en el arranque el código de validación del schema NCS (estilo fastjsonschema): cada
+keyword se traduce a comprobaciones en línea que cortan en el primer error. Sólo decide
+válido/no válido; el informe de errores completo lo sigue dando jsonschema para los
+eventos que fallan.
+
+`format` se ignora, igual que Draft7Validator sin format_checker (como se construye en
+consumer.build_validator). Un schema con keywords no soportadas lanza UnsupportedSchema y
+el consumer sigue con Draft7Validator.
+"""
+from __future__ import annotations
+
+import re
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from jsonschema import Draft7Validator
+
+# Keywords sin efecto en la validación (anotaciones)
+_ANNOTATIONS = {
+    "$schema",
+    "$id",
+    "$comment",
+    "title",
+    "description",
+    "default",
+    "examples",
+    "format",
+    "readOnly",
+    "writeOnly",
+}
+_SUPPORTED = _ANNOTATIONS | {
+    "type",
+    "required",
+    "properties",
+    "additionalProperties",
+    "enum",
+    "const",
+    "items",
+    "minLength",
+    "maxLength",
+    "minimum",
+    "maximum",
+    "exclusiveMinimum",
+    "exclusiveMaximum",
+    "pattern",
+    "minItems",
+    "maxItems",
+    "minProperties",
+    "maxProperties",
+}
+
+# Semántica de tipos de jsonschema: bool no es número; 1.0 es integer
+_TYPE_CHECKS = {
+    "string": "isinstance({v}, str)",
+    "object": "isinstance({v}, dict)",
+    "array": "isinstance({v}, list)",
+    "boolean": "isinstance({v}, bool)",
+    "null": "{v} is None",
+    "number": "(isinstance({v}, (int, float)) and not isinstance({v}, bool))",
+    "integer": (
+        "((isinstance({v}, int) and not isinstance({v}, bool))"
+        " or (isinstance({v}, float) and {v}.is_integer()))"
+    ),
+}
+_NUMBER = _TYPE_CHECKS["number"]
+
+
+class UnsupportedSchema(ValueError):
+    pass
+
+
+def _equal(a: Any, b: Any) -> bool:
+    # Igualdad JSON: True != 1, comparación recursiva de listas/objetos
+    if isinstance(a, bool) or isinstance(b, bool):
+        return isinstance(a, bool) and isinstance(b, bool) and a == b
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_equal(x, y) for x, y in zip(a, b))
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_equal(a[k], b[k]) for k in a)
+    return a == b
+
+
+class _CodeGen:
+    def __init__(self):
+        self.lines: List[str] = []
+        self.consts: Dict[str, Any] = {"_equal": _equal, "_MISSING": object()}
+        self._n = 0
+
+    def name(self, prefix: str) -> str:
+        self._n += 1
+        return f"{prefix}{self._n}"
+
+    def const(self, value: Any, prefix: str = "_c") -> str:
+        n = self.name(prefix)
+        self.consts[n] = value
+        return n
+
+    def emit(self, indent: int, line: str) -> None:
+        self.lines.append("    " * indent + line)
+
+    def fail_unless(self, indent: int, cond: str) -> None:
+        self.emit(indent, f"if not ({cond}):")
+        self.emit(indent + 1, "return False")
+
+    def block(self, indent: int, headers: List[str], body: Callable[[int], None]) -> None:
+        # Emite las cabeceras anidadas y el cuerpo; si el cuerpo queda vacío no emite nada
+        mark = len(self.lines)
+        for i, header in enumerate(headers):
+            self.emit(indent + i, header)
+        body(indent + len(headers))
+        if len(self.lines) == mark + len(headers):
+            del self.lines[mark:]
+
+    def schema(self, schema: Any, v: str, indent: int, known_type: Optional[str] = None) -> None:
+        if schema is True or schema == {}:
+            return
+        if schema is False:
+            self.emit(indent, "return False")
+            return
+        if not isinstance(schema, dict):
+            raise UnsupportedSchema(f"schema no es objeto: {schema!r}")
+        unknown = set(schema) - _SUPPORTED
+        if unknown:
+            raise UnsupportedSchema(f"keywords no soportadas: {sorted(unknown)}")
+
+        types = schema.get("type")
+        if types is not None:
+            types = [types] if isinstance(types, str) else list(types)
+            if any(t not in _TYPE_CHECKS for t in types):
+                raise UnsupportedSchema(f"type no soportado: {types}")
+            self.fail_unless(indent, " or ".join(_TYPE_CHECKS[t].format(v=v) for t in types))
+            if len(types) == 1:
+                known_type = types[0]
+
+        if "enum" in schema:
+            values = schema["enum"]
+            if all(isinstance(e, str) for e in values):
+                self.fail_unless(
+                    indent,
+                    f"isinstance({v}, str) and {v} in {self.const(frozenset(values), '_enum')}",
+                )
+            else:
+                c = self.const(list(values), "_enum")
+                self.fail_unless(indent, f"any(_equal({v}, e) for e in {c})")
+        if "const" in schema:
+            self.fail_unless(indent, f"_equal({v}, {self.const(schema['const'])})")
+
+        self._string(schema, v, indent, known_type)
+        self._number(schema, v, indent, known_type)
+        self._object(schema, v, indent, known_type)
+        self._array(schema, v, indent, known_type)
+
+    def _guard(self, type_name: str, v: str, known_type: Optional[str]) -> List[str]:
+        # Las keywords de cada tipo sólo aplican si la instancia es de ese tipo
+        if known_type == type_name:
+            return []
+        return [f"if {_TYPE_CHECKS[type_name].format(v=v)}:"]
+
+    def _string(
+        self, schema: Dict[str, Any], v: str, indent: int, known_type: Optional[str]
+    ) -> None:
+        checks = []
+        if "minLength" in schema:
+            checks.append(f"len({v}) >= {int(schema['minLength'])}")
+        if "maxLength" in schema:
+            checks.append(f"len({v}) <= {int(schema['maxLength'])}")
+        if "pattern" in schema:
+            checks.append(f"{self.const(re.compile(schema['pattern']), '_re')}.search({v})")
+        self.block(
+            indent,
+            self._guard("string", v, known_type),
+            lambda i: [self.fail_unless(i, c) for c in checks],
+        )
+
+    def _number(
+        self, schema: Dict[str, Any], v: str, indent: int, known_type: Optional[str]
+    ) -> None:
+        ops = {"minimum": ">=", "maximum": "<=", "exclusiveMinimum": ">", "exclusiveMaximum": "<"}
+        checks = [f"{v} {op} {schema[k]!r}" for k, op in ops.items() if k in schema]
+        guard = [] if known_type in ("number", "integer") else [f"if {_NUMBER.format(v=v)}:"]
+        self.block(indent, guard, lambda i: [self.fail_unless(i, c) for c in checks])
+
+    def _object(
+        self, schema: Dict[str, Any], v: str, indent: int, known_type: Optional[str]
+    ) -> None:
+        self.block(
+            indent, self._guard("object", v, known_type), lambda i: self._object_body(schema, v, i)
+        )
+
+    def _object_body(self, schema: Dict[str, Any], v: str, indent: int) -> None:
+        required = schema.get("required") or []
+        if required:
+            self.fail_unless(indent, " and ".join(f"{r!r} in {v}" for r in required))
+        if "minProperties" in schema:
+            self.fail_unless(indent, f"len({v}) >= {int(schema['minProperties'])}")
+        if "maxProperties" in schema:
+            self.fail_unless(indent, f"len({v}) <= {int(schema['maxProperties'])}")
+        properties = schema.get("properties") or {}
+        for key, sub in properties.items():
+            if sub is True or sub == {}:
+                continue
+            pv = self.name("v")
+            mark = len(self.lines)
+            self.emit(indent, f"{pv} = {v}.get({key!r}, _MISSING)")
+            self.emit(indent, f"if {pv} is not _MISSING:")
+            self.schema(sub, pv, indent + 1)
+            if len(self.lines) == mark + 2:
+                del self.lines[mark:]
+        additional = schema.get("additionalProperties", True)
+        if additional is True or additional == {}:
+            return
+        known = self.const(frozenset(properties), "_props")
+        k, av = self.name("k"), self.name("v")
+        self.emit(indent, f"for {k}, {av} in {v}.items():")
+        self.emit(indent + 1, f"if {k} in {known}:")
+        self.emit(indent + 2, "continue")
+        self.schema(additional, av, indent + 1)
+
+    def _array(
+        self, schema: Dict[str, Any], v: str, indent: int, known_type: Optional[str]
+    ) -> None:
+        items = schema.get("items")
+        if isinstance(items, list):
+            raise UnsupportedSchema("items como tupla no soportado")
+        checks = []
+        if "minItems" in schema:
+            checks.append(f"len({v}) >= {int(schema['minItems'])}")
+        if "maxItems" in schema:
+            checks.append(f"len({v}) <= {int(schema['maxItems'])}")
+
+        def body(i: int) -> None:
+            for c in checks:
+                self.fail_unless(i, c)
+            if items not in (None, True, {}):
+                iv = self.name("v")
+                self.block(i, [f"for {iv} in {v}:"], lambda j: self.schema(items, iv, j))
+
+        self.block(indent, self._guard("array", v, known_type), body)
+
+
+def compile_schema(schema: Dict[str, Any]) -> Callable[[Any], bool]:
+    """Devuelve una función `f(instance) -> bool` equivalente a Draft7Validator.is_valid."""
+    gen = _CodeGen()
+    gen.emit(0, "def validate(data):")
+    gen.schema(schema, "data", 1)
+    gen.emit(1, "return True")
+    source = "\n".join(gen.lines)
+    namespace: Dict[str, Any] = dict(gen.consts)
+    exec(compile(source, "<ncs_schema_compiled>", "exec"), namespace)
+    fn = namespace["validate"]
+    fn.__source__ = source
+    return fn
+
+
+class CompiledValidator:
+    """
+    Mismo interfaz que Draft7Validator para el consumer: is_valid() usa el código
+    compilado; iter_errors() sólo recurre a jsonschema si el evento no es válido.
+    """
+
+    def __init__(self, schema: Dict[str, Any]):
+        self.schema = schema
+        self._is_valid = compile_schema(schema)
+        self._fallback = Draft7Validator(schema)
+
+    def is_valid(self, instance: Any) -> bool:
+        return self._is_valid(instance)
+
+    def iter_errors(self, instance: Any) -> Iterator[Any]:
+        if self._is_valid(instance):
+            return iter(())
+        return self._fallback.iter_errors(instance)
+
+    def errors(self, instance: Any) -> List[Any]:
+        """Errores de jsonschema (vacío si es válido) con una sola pasada del código compilado."""
+        if self._is_valid(instance):
+            return []
+        return list(self._fallback.iter_errors(instance))
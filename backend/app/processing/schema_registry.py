@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from jsonschema import Draft7Validator
+from prometheus_client import Gauge
+
+from backend.app.processing.schema_compiler import CompiledValidator, UnsupportedSchema
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSIONS_LOADED = Gauge(
+    "schema_versions_loaded", "Versiones NCS con validador cargado", multiprocess_mode="max"
+)
+
+Validator = Union[Draft7Validator, CompiledValidator]
+
+REGISTRY_FILE = "ncs_schema_registry.json"
+_VERSION_FILE_RE = re.compile(r"^ncs_v(?P<version>\d[\w.\-]*)\.json$")
+
+
+def build_schema_validator(schema: Dict[str, Any], compiled: bool = True) -> Validator:
+    """Validador compilado si el schema lo permite; si no, Draft7Validator."""
+    if compiled:
+        try:
+            return CompiledValidator(schema)
+        except UnsupportedSchema as e:
+            logger.warning(
+                "schema_compile_unsupported",
+                extra={"schema_id": schema.get("$id"), "error": str(e)},
+            )
+    return Draft7Validator(schema)
+
+
+def validation_errors(validator: Validator, instance: Any) -> List[Any]:
+    """Errores del evento (vacío si es válido); el compilado sólo se ejecuta una vez."""
+    if isinstance(validator, CompiledValidator):
+        return validator.errors(instance)
+    return list(validator.iter_errors(instance))
+
+
+class SchemaRegistry:
+    """
+    Validadores NCS por `schema_version`, construidos una vez al cargar.
+
+    Versiones: si `ncs_schema_registry.json` contiene `{"versions": {"1.0.0": "ncs_v1.0.0.json"}}`
+    se usa ese mapa; si no (p.ej. es una copia del schema para el Schema Registry externo),
+    se descubren los ficheros `ncs_v<versión>.json` del directorio. `fallback_path` se usa
+    para cualquier versión si no se encuentra ninguna (configuración con un único schema).
+
+    Los cambios en el directorio (versión nueva, schema editado) se recargan sin reiniciar:
+    get() comprueba mtimes como mucho cada `reload_seconds`.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        compiled: bool = True,
+        fallback_path: Optional[str] = None,
+        reload_seconds: float = 30.0,
+    ):
+        self.directory = directory
+        self.compiled = compiled
+        self.fallback_path = fallback_path
+        self.reload_seconds = reload_seconds
+        self._validators: Dict[str, Validator] = {}
+        self._fallback: Optional[Validator] = None
+        self._signature: Tuple[Tuple[str, float], ...] = ()
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def _files(self) -> Dict[str, str]:
+        """versión -> ruta del schema."""
+        registry_path = os.path.join(self.directory, REGISTRY_FILE)
+        try:
+            with open(registry_path, "r", encoding="utf-8") as f:
+                registry = json.load(f)
+            versions = registry.get("versions") if isinstance(registry, dict) else None
+            if isinstance(versions, dict):
+                return {str(v): os.path.join(self.directory, p) for v, p in versions.items()}
+        except (OSError, ValueError):
+            pass
+        out: Dict[str, str] = {}
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return out
+        for name in names:
+            m = _VERSION_FILE_RE.match(name)
+            if m:
+                out[m.group("version")] = os.path.join(self.directory, name)
+        return out
+
+    def _current_signature(self) -> Tuple[Tuple[str, float], ...]:
+        paths = list(self._files().values()) + [os.path.join(self.directory, REGISTRY_FILE)]
+        sig = []
+        for p in sorted(set(paths)):
+            try:
+                sig.append((p, os.path.getmtime(p)))
+            except OSError:
+                continue
+        return tuple(sig)
+
+    def load(self) -> None:
+        validators: Dict[str, Validator] = {}
+        for version, path in sorted(self._files().items()):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    validators[version] = build_schema_validator(json.load(f), self.compiled)
+            except Exception:
+                logger.warning(
+                    "schema_version_load_failed",
+                    extra={"schema_version": version, "path": path},
+                    exc_info=True,
+                )
+        fallback = None
+        if not validators and self.fallback_path:
+            with open(self.fallback_path, "r", encoding="utf-8") as f:
+                fallback = build_schema_validator(json.load(f), self.compiled)
+        with self._lock:
+            self._validators = validators
+            self._fallback = fallback
+            self._signature = self._current_signature()
+            self._next_check = time.monotonic() + self.reload_seconds
+        SCHEMA_VERSIONS_LOADED.set(len(validators))
+        logger.info(
+            "schema_registry_loaded",
+            extra={
+                "versions": sorted(validators),
+                "fallback": self.fallback_path if fallback is not None else None,
+            },
+        )
+
+    def maybe_reload(self) -> None:
+        if self.reload_seconds <= 0 or time.monotonic() < self._next_check:
+            return
+        with self._lock:
+            if time.monotonic() < self._next_check:
+                return
+            self._next_check = time.monotonic() + self.reload_seconds
+            changed = self._current_signature() != self._signature
+        if changed:
+            try:
+                self.load()
+            except Exception:
+                # Se mantienen los validadores anteriores
+                logger.exception("schema_registry_reload_failed")
+
+    def versions(self):
+        return sorted(self._validators)
+
+    def get(self, version: Optional[str]) -> Optional[Validator]:
+        """Validador de la versión, o None si no está registrada."""
+        self.maybe_reload()
+        validator = self._validators.get(version) if version is not None else None
+        return validator if validator is not None else self._fallback
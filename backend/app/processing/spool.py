@@ -0,0 +1,352 @@
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+SPOOL_BYTES = Gauge("spool_bytes", "Bytes en el spool local en disco", multiprocess_mode="livesum")
+SPOOL_SEGMENTS = Gauge(
+    "spool_segments", "Segmentos en el spool local en disco", multiprocess_mode="livesum"
+)
+SPOOL_WRITTEN = Counter("spool_records_written_total", "Acciones _bulk escritas en el spool")
+SPOOL_REPLAYED = Counter("spool_records_replayed_total", "Acciones del spool reindexadas")
+SPOOL_REJECTED = Counter("spool_records_rejected_total", "Acciones no escritas por spool lleno")
+SPOOL_REPLAY_FAILED = Counter(
+    "spool_replay_failed_total", "Acciones del spool con error permanente al reindexar", ["reason"]
+)
+
+# Cabecera de registro: longitud + crc32 del payload (big endian)
+_RECORD = struct.Struct(">II")
+_SEGMENT_SUFFIX = ".seg"
+_OFFSET_SUFFIX = ".offset"
+_REJECTED_SUFFIX = ".rejected"
+
+
+class DiskSpool:
+    """
+    Spool append-only en disco para acciones _bulk ya serializadas (NDJSON).
+
+    Segmentos `<seq>.seg` con registros [longitud][crc32][payload]; la lectura usa mmap.
+    El progreso de replay de cada segmento se guarda en `<seq>.offset` y el segmento se borra
+    al terminar. Un registro truncado o con crc incorrecto (caída a mitad de escritura)
+    marca el final del segmento. `max_bytes` limita el tamaño total: si se alcanza, o si la
+    escritura falla (disco lleno, EIO), append_many() devuelve False y el llamante mantiene
+    su camino de error (DLQ).
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_max_bytes: int = 64 * 1024 * 1024,
+        max_bytes: int = 1024 * 1024 * 1024,
+        fsync: bool = True,
+    ):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        # Un único proceso por directorio (en supervisor cada worker usa el suyo)
+        self._lock_file = open(os.path.join(directory, ".lock"), "a+")
+        try:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            raise RuntimeError(f"spool directory in use: {directory}")
+        self._lock = threading.Lock()
+        self._sizes: Dict[int, int] = {}
+        for name in os.listdir(directory):
+            if name.endswith(_SEGMENT_SUFFIX):
+                seq = int(name[: -len(_SEGMENT_SUFFIX)])
+                self._sizes[seq] = os.path.getsize(self._path(seq))
+        self._next_seq = max(self._sizes, default=-1) + 1
+        self._active: Optional[Any] = None
+        self._active_seq: Optional[int] = None
+        self._export()
+
+    def _path(self, seq: int, suffix: str = _SEGMENT_SUFFIX) -> str:
+        return os.path.join(self.directory, f"{seq:012d}{suffix}")
+
+    def _export(self) -> None:
+        SPOOL_BYTES.set(sum(self._sizes.values()))
+        SPOOL_SEGMENTS.set(len(self._sizes))
+
+    @property
+    def size_bytes(self) -> int:
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def empty(self) -> bool:
+        with self._lock:
+            return not self._sizes
+
+    def append_many(self, records: Sequence[bytes]) -> bool:
+        """Añade registros al segmento activo. False si no caben o no se pueden escribir."""
+        size = sum(_RECORD.size + len(r) for r in records)
+        with self._lock:
+            if sum(self._sizes.values()) + size > self.max_bytes:
+                SPOOL_REJECTED.inc(len(records))
+                logger.error(
+                    "spool_full", extra={"records": len(records), "max_bytes": self.max_bytes}
+                )
+                return False
+            if self._active is not None and (
+                self._sizes[self._active_seq] + size > self.segment_max_bytes
+            ):
+                self._close_active()
+            if self._active is None:
+                self._active_seq = self._next_seq
+                self._next_seq += 1
+                self._active = open(self._path(self._active_seq), "ab")
+                self._sizes[self._active_seq] = 0
+            start = self._sizes[self._active_seq]
+            try:
+                for r in records:
+                    self._active.write(_RECORD.pack(len(r), zlib.crc32(r)))
+                    self._active.write(r)
+                self._active.flush()
+                if self.fsync:
+                    os.fsync(self._active.fileno())
+            except OSError:
+                SPOOL_REJECTED.inc(len(records))
+                logger.exception(
+                    "spool_write_failed",
+                    extra={"records": len(records), "segment": self._active_seq},
+                )
+                self._discard_partial(start)
+                return False
+            self._sizes[self._active_seq] += size
+            self._export()
+        SPOOL_WRITTEN.inc(len(records))
+        return True
+
+    def _discard_partial(self, size: int) -> None:
+        # Llamar con self._lock tomado. Recorta el segmento activo a `size` para no dejar un
+        # registro a medias; si tampoco se puede, el segmento se cierra y el siguiente append
+        # abre otro (la lectura se detiene en el primer registro incompleto).
+        seq = self._active_seq
+        try:
+            self._active.truncate(size)
+        except (OSError, ValueError):
+            logger.warning("spool_truncate_failed", extra={"segment": seq})
+        try:
+            self._active.close()
+        except OSError:
+            pass
+        self._active = None
+        self._active_seq = None
+        try:
+            self._sizes[seq] = os.path.getsize(self._path(seq))
+        except OSError:
+            pass
+        self._export()
+
+    def _close_active(self) -> None:
+        # Llamar con self._lock tomado
+        if self._active is not None:
+            self._active.close()
+            self._active = None
+            self._active_seq = None
+
+    def oldest(self) -> Optional[int]:
+        """
+        Segmento más antiguo listo para replay. Si es el activo se cierra, y las nuevas
+        escrituras van a un segmento nuevo.
+        """
+        with self._lock:
+            if not self._sizes:
+                return None
+            seq = min(self._sizes)
+            if seq == self._active_seq:
+                self._close_active()
+            return seq
+
+    def read(self, seq: int) -> Iterator[Tuple[int, bytes]]:
+        """(offset tras el registro, payload) desde el último offset confirmado."""
+        start = self._committed(seq)
+        with open(self._path(seq), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= start:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                pos = start
+                while pos + _RECORD.size <= size:
+                    length, crc = _RECORD.unpack_from(mm, pos)
+                    end = pos + _RECORD.size + length
+                    if end > size:
+                        logger.warning("spool_truncated_record", extra={"segment": seq})
+                        return
+                    payload = mm[pos + _RECORD.size : end]
+                    if zlib.crc32(payload) != crc:
+                        logger.warning("spool_corrupt_record", extra={"segment": seq})
+                        return
+                    yield end, payload
+                    pos = end
+
+    def _committed(self, seq: int) -> int:
+        try:
+            with open(self._path(seq, _OFFSET_SUFFIX), "r") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def commit(self, seq: int, offset: int) -> None:
+        """Guarda el progreso de replay del segmento (escritura atómica)."""
+        tmp = self._path(seq, _OFFSET_SUFFIX + ".tmp")
+        with open(tmp, "w") as f:
+            f.write(str(offset))
+        os.replace(tmp, self._path(seq, _OFFSET_SUFFIX))
+
+    def reject(self, seq: int, records: Sequence[bytes]) -> None:
+        """
+        Guarda en `<seq>.rejected` (NDJSON _bulk tal cual, reenviable a mano) acciones que el
+        cluster rechazó de forma permanente al reindexar. No cuenta para max_bytes ni se
+        borra con el segmento. Lanza OSError si no se puede escribir.
+        """
+        with open(self._path(seq, _REJECTED_SUFFIX), "ab") as f:
+            for r in records:
+                f.write(r)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def remove(self, seq: int) -> None:
+        with self._lock:
+            if seq == self._active_seq:
+                self._close_active()
+            for suffix in (_SEGMENT_SUFFIX, _OFFSET_SUFFIX):
+                try:
+                    os.remove(self._path(seq, suffix))
+                except FileNotFoundError:
+                    pass
+            self._sizes.pop(seq, None)
+            self._export()
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_active()
+        self._lock_file.close()
+
+
+class SpoolReplayer:
+    """
+    Hilo que reindexa el spool en orden (segmento a segmento) vía BulkIndexer.send_raw()
+    cuando el cluster responde a ping. Si un batch vuelve a fallar por error transitorio
+    se deja el offset sin avanzar y se reintenta en la siguiente vuelta. Las acciones con
+    error permanente se guardan en `<seq>.rejected` (DiskSpool.reject) antes de avanzarlo.
+    """
+
+    def __init__(
+        self,
+        spool: DiskSpool,
+        indexer: Any,
+        interval_seconds: float = 5.0,
+        batch_items: int = 500,
+    ):
+        self.spool = spool
+        self.indexer = indexer
+        self.interval_seconds = interval_seconds
+        self.batch_items = max(1, batch_items)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="spool-replay", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("spool_replay_failed")
+
+    def _healthy(self) -> bool:
+        try:
+            return bool(self.indexer.client.ping())
+        except Exception:
+            return False
+
+    def run_once(self) -> int:
+        """Reindexa todo lo posible; devuelve el número de acciones enviadas con éxito."""
+        if self.spool.empty() or not self._healthy():
+            return 0
+        replayed = 0
+        while not self._stop.is_set():
+            seq = self.spool.oldest()
+            if seq is None:
+                break
+            done, sent = self._replay_segment(seq)
+            replayed += sent
+            if not done:
+                break
+            self.spool.remove(seq)
+        if replayed:
+            logger.info(
+                "spool_replayed",
+                extra={"records": replayed, "remaining_bytes": self.spool.size_bytes},
+            )
+        return replayed
+
+    def _replay_segment(self, seq: int) -> Tuple[bool, int]:
+        sent = 0
+        batch: List[bytes] = []
+        end = 0
+        for offset, payload in self.spool.read(seq):
+            batch.append(payload)
+            end = offset
+            if len(batch) >= self.batch_items:
+                if not self._send(seq, batch, end):
+                    return False, sent
+                sent += len(batch)
+                batch = []
+        if batch:
+            if not self._send(seq, batch, end):
+                return False, sent
+            sent += len(batch)
+        return True, sent
+
+    def _send(self, seq: int, batch: List[bytes], end: int) -> bool:
+        result = self.indexer.send_raw(batch)
+        if result.transient_failures:
+            logger.warning(
+                "spool_replay_deferred",
+                extra={"segment": seq, "transient_failures": result.transient_failures},
+            )
+            return False
+        if result.failed:
+            # El mensaje original ya se confirmó al escribir en el spool: antes de avanzar el
+            # offset las acciones rechazadas se guardan para poder reenviarlas
+            try:
+                self.spool.reject(seq, [batch[i] for i, _ in result.failed])
+            except OSError:
+                logger.exception(
+                    "spool_reject_write_failed", extra={"segment": seq, "items": len(result.failed)}
+                )
+                return False
+            reasons: Dict[str, int] = {}
+            for _, reason in result.failed:
+                SPOOL_REPLAY_FAILED.labels(reason=reason).inc()
+                reasons[reason] = reasons.get(reason, 0) + 1
+            logger.error(
+                "spool_replay_items_rejected",
+                extra={"segment": seq, "items": len(result.failed), "reasons": reasons},
+            )
+        SPOOL_REPLAYED.inc(len(result.ok))
+        self.spool.commit(seq, end)
+        return True
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Supervisor multi-proceso del consumer.
+Lanza CONSUMER_WORKERS procesos (fork); cada worker ejecuta consumer.run() con su propia
+conexión, canal y BulkIndexer. Reinicia workers caídos y expone las métricas Prometheus
+agregadas de todos los procesos (modo multiprocess de prometheus_client).
+
+Uso:
+    CONSUMER_WORKERS=4 python -m backend.app.processing.supervisor
+"""
+
+from __future__ import annotations
+
+import glob
+import logging
+import multiprocessing
+import os
+import signal
+import tempfile
+import time
+from typing import Callable, Dict, Optional
+
+from backend.app.core.logging import configure_logging, stop_queue_logging
+
+logger = logging.getLogger(__name__)
+
+CONSUMER_WORKERS = int(os.getenv("CONSUMER_WORKERS", "0")) or (os.cpu_count() or 1)
+RESTART_BACKOFF_SECONDS = float(os.getenv("CONSUMER_RESTART_BACKOFF_SECONDS", "1.0"))
+RESTART_BACKOFF_MAX_SECONDS = float(os.getenv("CONSUMER_RESTART_BACKOFF_MAX_SECONDS", "30.0"))
+# Un worker que aguanta este tiempo vivo resetea su backoff de reinicio
+WORKER_STABLE_SECONDS = 60.0
+DEFAULT_MULTIPROC_DIR = os.path.join(tempfile.gettempdir(), "nubla_consumer_metrics")
+
+
+def _raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def run_worker(index: int) -> None:
+    # SIGTERM -> KeyboardInterrupt para que consumer.main haga el flush final y cierre limpio
+    signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    # Índice estable entre reinicios (p.ej. directorio de spool propio del worker)
+    os.environ["CONSUMER_WORKER_INDEX"] = str(index)
+    from backend.app.processing import consumer
+
+    logger.info("consumer_worker_started", extra={"worker": index, "pid": os.getpid()})
+    try:
+        consumer.run(start_metrics_server=False)
+    finally:
+        # Tiempos por etapa aún acumulados en los hilos del worker
+        from backend.app.metrics import stages
+
+        stages.flush()
+        # multiprocessing termina el hijo con os._exit (sin atexit): vaciar la cola de logs
+        stop_queue_logging()
+
+
+def prepare_multiproc_dir(path: Optional[str] = None) -> str:
+    """
+    Fija PROMETHEUS_MULTIPROC_DIR y limpia ficheros de ejecuciones previas.
+    Debe llamarse antes de importar prometheus_client.
+    """
+    path = path or os.getenv("PROMETHEUS_MULTIPROC_DIR") or DEFAULT_MULTIPROC_DIR
+    os.makedirs(path, exist_ok=True)
+    for f in glob.glob(os.path.join(path, "*.db")):
+        try:
+            os.remove(f)
+        except OSError:
+            pass
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+    return path
+
+
+def _mark_process_dead(pid: Optional[int]) -> None:
+    if pid is None or not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return
+    try:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(pid)
+    except Exception:
+        logger.warning("metrics_mark_dead_failed", extra={"pid": pid}, exc_info=True)
+
+
+class ConsumerSupervisor:
+    """
+    Mantiene N workers vivos; reinicio con backoff exponencial por slot.
+    """
+
+    def __init__(
+        self,
+        workers: int = CONSUMER_WORKERS,
+        target: Callable[[int], None] = run_worker,
+        backoff_seconds: float = RESTART_BACKOFF_SECONDS,
+        max_backoff_seconds: float = RESTART_BACKOFF_MAX_SECONDS,
+    ):
+        self.workers = max(1, workers)
+        self.target = target
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self._ctx = multiprocessing.get_context("fork")
+        self._procs: Dict[int, multiprocessing.process.BaseProcess] = {}
+        self._started_at: Dict[int, float] = {}
+        self._backoff: Dict[int, float] = {}
+        self._restart_at: Dict[int, float] = {}
+        self._stopping = False
+        self.restarts = 0
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            self._spawn(i)
+
+    def _spawn(self, index: int) -> None:
+        proc = self._ctx.Process(
+            target=self.target, args=(index,), name=f"consumer-worker-{index}", daemon=False
+        )
+        proc.start()
+        self._procs[index] = proc
+        self._started_at[index] = time.monotonic()
+        logger.info("consumer_worker_spawned", extra={"worker": index, "pid": proc.pid})
+
+    def check(self) -> None:
+        """Recoge workers muertos y relanza los que ya cumplieron su backoff."""
+        now = time.monotonic()
+        for index, proc in list(self._procs.items()):
+            if proc.is_alive():
+                continue
+            proc.join(timeout=0)
+            _mark_process_dead(proc.pid)
+            del self._procs[index]
+            if self._stopping:
+                continue
+            uptime = now - self._started_at.get(index, now)
+            if uptime >= WORKER_STABLE_SECONDS:
+                delay = self.backoff_seconds
+            else:
+                prev = self._backoff.get(index)
+                delay = (
+                    self.backoff_seconds
+                    if prev is None
+                    else min(prev * 2, self.max_backoff_seconds)
+                )
+            self._backoff[index] = delay
+            self._restart_at[index] = now + delay
+            logger.warning(
+                "consumer_worker_exited",
+                extra={
+                    "worker": index,
+                    "pid": proc.pid,
+                    "exitcode": proc.exitcode,
+                    "restart_in_seconds": delay,
+                },
+            )
+        for index, due in list(self._restart_at.items()):
+            if self._stopping or index in self._procs or due > now:
+                continue
+            del self._restart_at[index]
+            self.restarts += 1
+            self._spawn(index)
+
+    def alive(self) -> int:
+        return sum(1 for p in self._procs.values() if p.is_alive())
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stopping = True
+        for proc in self._procs.values():
+            if proc.is_alive():
+                proc.terminate()
+        deadline = time.monotonic() + timeout
+        for proc in self._procs.values():
+            proc.join(timeout=max(0.0, deadline - time.monotonic()))
+            if proc.is_alive():
+                logger.warning("consumer_worker_kill", extra={"pid": proc.pid})
+                proc.kill()
+                proc.join(timeout=1.0)
+        self.check()
+
+    def run(self, poll_interval: float = 0.5) -> None:
+        def _request_stop(signum, frame):
+            self._stopping = True
+
+        signal.signal(signal.SIGTERM, _request_stop)
+        signal.signal(signal.SIGINT, _request_stop)
+        self.start()
+        logger.info("consumer_supervisor_started", extra={"workers": self.workers})
+        try:
+            while not self._stopping:
+                self.check()
+                time.sleep(poll_interval)
+        finally:
+            self.stop()
+            logger.info("consumer_supervisor_stopped", extra={"restarts": self.restarts})
+
+
+def main() -> None:
+    prepare_multiproc_dir()
+    # Import diferido: prometheus_client debe ver PROMETHEUS_MULTIPROC_DIR al importarse
+    from prometheus_client import CollectorRegistry, multiprocess, start_http_server
+
+    from backend.app.metrics.stages import StageHistogramCollector
+
+    try:
+        registry = CollectorRegistry()
+        # Los workers publican los tiempos por etapa como Counters por cubeta
+        registry.register(StageHistogramCollector(multiprocess.MultiProcessCollector(None)))
+        start_http_server(int(os.getenv("METRICS_PORT", "9109")), registry=registry)
+        logger.info(
+            "metrics_server_started",
+            extra={"port": os.getenv("METRICS_PORT", "9109"), "multiprocess": True},
+        )
+    except Exception:
+        logger.warning("metrics_server_failed", exc_info=True)
+
+    ConsumerSupervisor(workers=CONSUMER_WORKERS).run()
+
+
+if __name__ == "__main__":
+    configure_logging(level=os.getenv("LOG_LEVEL", "INFO"))
+    main()
@@ -1,26 +1,242 @@
+"""
+Mapeo host -> tenant desde `config/host_tenant_map.json` (objeto {patrón: tenant}).
+
+Tipos de patrón, por orden de prioridad:
+- exacto: `fw-madrid-01`
+- CIDR: `10.20.0.0/16`, `2001:db8::/32` (gana el prefijo más largo; sólo hosts que son IP)
+- comodín al final o al principio: `fw-mad-*`, `*.acme.local` (gana el literal más largo)
+
+Los patrones se compilan a un índice inmutable (dict de exactos, tries de prefijos y de
+sufijos invertidos, redes por longitud de prefijo): la búsqueda es O(longitud del host) con
+miles de reglas. HostTenantMapper recarga el fichero si cambia su mtime (comprobado como
+mucho cada `reload_seconds`) y sustituye índice y caché LRU de hosts resueltos en una sola
+asignación, sin bloquear las lecturas. Alta de un dispositivo nuevo sin reiniciar el
+consumer.
+"""
+import ipaddress
 import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from prometheus_client import Gauge
+
+logger = logging.getLogger(__name__)
+
+HOST_TENANT_RULES = Gauge(
+    "host_tenant_map_rules", "Reglas host->tenant cargadas", multiprocess_mode="max"
+)
+
+DEFAULT_MAP_PATH = Path(os.getenv("HOST_TENANT_MAP_PATH", "config/host_tenant_map.json"))
+HOST_TENANT_MAP_RELOAD_SECONDS = float(os.getenv("HOST_TENANT_MAP_RELOAD_SECONDS", "5"))
+HOST_TENANT_MAP_CACHE_SIZE = int(os.getenv("HOST_TENANT_MAP_CACHE_SIZE", "10000"))
+
+_END = None  # clave del tenant en un nodo del trie (los hijos se indexan por carácter)
+_MISSING = object()
 
-DEFAULT_MAP_PATH = Path("config/host_tenant_map.json")
 
+def normalize_host(host: Any) -> str:
+    """Forma canónica del host para el mapeo: sin espacios extremos, minúsculas, ' ' -> '-'."""
+    return str(host).strip().lower().replace(" ", "-")
 
-def load_mapping(path: Path = DEFAULT_MAP_PATH) -> dict:
+
+def load_mapping(path: Path = DEFAULT_MAP_PATH) -> Dict[str, str]:
+    """{patrón normalizado: tenant}; {} si el fichero no existe. Lanza ValueError si es inválido."""
     if not path.exists():
         return {}
-    try:
-        data = json.loads(path.read_text(encoding="utf-8"))
-        if isinstance(data, dict):
-            return {k.lower(): v for k, v in data.items()}
-    except Exception:
-        return {}
-    return {}
+    data = json.loads(path.read_text(encoding="utf-8"))
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: se esperaba un objeto {{patrón: tenant}}")
+    return {normalize_host(k): str(v) for k, v in data.items() if k and v}
+
+
+def _trie_insert(trie: Dict[Any, Any], key: str, tenant: str) -> None:
+    node = trie
+    for ch in key:
+        node = node.setdefault(ch, {})
+    node[_END] = tenant
 
 
-HOST_TENANT_MAP = load_mapping()
+def _trie_longest(trie: Dict[Any, Any], text: str) -> Tuple[Optional[str], int]:
+    """Tenant del patrón más largo que es prefijo de `text` y su longitud."""
+    node = trie
+    best, best_len = node.get(_END), 0
+    for depth, ch in enumerate(text, 1):
+        node = node.get(ch)
+        if node is None:
+            break
+        tenant = node.get(_END)
+        if tenant is not None:
+            best, best_len = tenant, depth
+    return best, best_len
 
 
-def map_host_to_tenant(host: str) -> str | None:
-    if not host:
+class HostTenantIndex:
+    """Índice inmutable de patrones host -> tenant; lookup() recibe el host normalizado."""
+
+    def __init__(self, mapping: Dict[str, str]):
+        self.exact: Dict[str, str] = {}
+        self._prefixes: Dict[Any, Any] = {}
+        self._suffixes: Dict[Any, Any] = {}
+        # versión IP -> [(longitud de prefijo, {red >> bits libres: tenant})], de mayor a menor
+        self._networks: Dict[int, List[Tuple[int, Dict[int, str]]]] = {}
+        self.rules = 0
+        networks: Dict[int, Dict[int, Dict[int, str]]] = {}
+        for raw_pattern, tenant in mapping.items():
+            pattern = normalize_host(raw_pattern)
+            stars = pattern.count("*")
+            if stars == 0 and "/" in pattern:
+                try:
+                    net = ipaddress.ip_network(pattern, strict=False)
+                except ValueError:
+                    logger.warning("host_tenant_rule_invalid", extra={"pattern": pattern})
+                    continue
+                free_bits = net.max_prefixlen - net.prefixlen
+                by_len = networks.setdefault(net.version, {}).setdefault(net.prefixlen, {})
+                by_len[int(net.network_address) >> free_bits] = tenant
+            elif stars == 0:
+                self.exact[pattern] = tenant
+            elif stars == 1 and pattern.endswith("*"):
+                _trie_insert(self._prefixes, pattern[:-1], tenant)
+            elif stars == 1 and pattern.startswith("*"):
+                _trie_insert(self._suffixes, pattern[:0:-1], tenant)
+            else:
+                # Comodín en medio o varios comodines: no admitido
+                logger.warning("host_tenant_rule_invalid", extra={"pattern": pattern})
+                continue
+            self.rules += 1
+        for version, by_len in networks.items():
+            self._networks[version] = sorted(by_len.items(), reverse=True)
+
+    def _network_lookup(self, host: str) -> Optional[str]:
+        try:
+            ip = ipaddress.ip_address(host)
+        except ValueError:
+            return None
+        table = self._networks.get(ip.version)
+        if not table:
+            return None
+        n, max_bits = int(ip), ip.max_prefixlen
+        for prefixlen, nets in table:
+            tenant = nets.get(n >> (max_bits - prefixlen))
+            if tenant is not None:
+                return tenant
         return None
-    key = host.strip().lower().replace(" ", "-")
-    return HOST_TENANT_MAP.get(key)
+
+    def lookup(self, host: str) -> Optional[str]:
+        """Tenant del host ya normalizado, o None."""
+        tenant = self.exact.get(host)
+        if tenant is not None:
+            return tenant
+        if self._networks and (host[:1].isdigit() or ":" in host):
+            tenant = self._network_lookup(host)
+            if tenant is not None:
+                return tenant
+        prefix, prefix_len = _trie_longest(self._prefixes, host)
+        suffix, suffix_len = _trie_longest(self._suffixes, host[::-1])
+        if suffix is not None and (prefix is None or suffix_len > prefix_len):
+            return suffix
+        return prefix
+
+
+class HostTenantMapper:
+    """
+    Resolución host -> tenant con recarga en caliente del fichero de mapeo.
+
+    El índice y la caché LRU de hosts resueltos (también los no mapeados) forman un único
+    estado que se sustituye entero al recargar: una lectura concurrente ve el mapa anterior
+    o el nuevo, nunca una mezcla. Si el fichero nuevo es inválido se mantiene el anterior.
+    """
+
+    def __init__(
+        self,
+        path: Path = DEFAULT_MAP_PATH,
+        reload_seconds: float = HOST_TENANT_MAP_RELOAD_SECONDS,
+        cache_size: int = HOST_TENANT_MAP_CACHE_SIZE,
+    ):
+        self.path = Path(path)
+        self.reload_seconds = reload_seconds
+        self.cache_size = max(0, cache_size)
+        self._state: Tuple[HostTenantIndex, "OrderedDict[str, Optional[str]]"] = (
+            HostTenantIndex({}),
+            OrderedDict(),
+        )
+        self._mtime: Optional[float] = None
+        self._loaded = False
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def _current_mtime(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def load(self) -> None:
+        mtime = self._current_mtime()
+        index = HostTenantIndex(load_mapping(self.path))
+        with self._lock:
+            self._state = (index, OrderedDict())
+            self._mtime = mtime
+            self._loaded = True
+            self._next_check = time.monotonic() + self.reload_seconds
+        HOST_TENANT_RULES.set(index.rules)
+        logger.info("host_tenant_map_loaded", extra={"path": str(self.path), "rules": index.rules})
+
+    def maybe_reload(self) -> None:
+        if self._loaded and (self.reload_seconds <= 0 or time.monotonic() < self._next_check):
+            return
+        with self._lock:
+            if self._loaded and time.monotonic() < self._next_check:
+                return
+            self._next_check = time.monotonic() + self.reload_seconds
+            mtime = self._current_mtime()
+            changed = not self._loaded or mtime != self._mtime
+        if changed:
+            try:
+                self.load()
+            except Exception:
+                # Se mantiene el mapa anterior hasta que el fichero vuelva a cambiar
+                logger.exception("host_tenant_map_reload_failed", extra={"path": str(self.path)})
+                with self._lock:
+                    self._loaded = True
+                    self._mtime = mtime
+
+    def resolve(self, host: Any) -> Optional[str]:
+        """Tenant del host (sin normalizar), o None si ninguna regla lo cubre."""
+        if not host:
+            return None
+        self.maybe_reload()
+        key = normalize_host(host)
+        index, cache = self._state
+        # Lectura sin lock (operaciones atómicas de OrderedDict); sólo se escribe con lock
+        tenant = cache.get(key, _MISSING)
+        if tenant is not _MISSING:
+            try:
+                cache.move_to_end(key)
+            except KeyError:
+                pass
+            return tenant  # type: ignore[return-value]
+        tenant = index.lookup(key) if key else None
+        if self.cache_size:
+            with self._lock:
+                cache[key] = tenant
+                while len(cache) > self.cache_size:
+                    cache.popitem(last=False)
+        return tenant
+
+
+# Singleton-ish instance for simple imports
+_mapper = HostTenantMapper()
+
+
+def get_host_mapper() -> HostTenantMapper:
+    return _mapper
+
+
+def map_host_to_tenant(host: str) -> Optional[str]:
+    return get_host_mapper().resolve(host)
@@ -1,71 +1,231 @@
+"""
+Registro de tenants válidos para el consumer.
+
+Fuente (TENANTS_REGISTRY_SOURCE):
+- `file`: `config/tenants.json`, lista de ids u objetos con `id`, o `{"tenants": [...]}`.
+- `db`: tabla `tenants` (sólo activos), la misma que usa la API.
+
+El conjunto vigente es un frozenset inmutable que se sustituye entero al recargar, así que
+is_valid() es un `in` sin copias ni locks. Con `db`, start() arranca un hilo que cada
+`poll_seconds` consulta una huella barata de la tabla (número de activos, suma de longitudes
+de id y último created_at) y sólo la relee si cambia; como la tabla no tiene updated_at,
+cada `full_refresh_seconds` se relee igualmente. Un tenant dado de alta por la API es válido
+en los consumers en segundos, sin reiniciar.
+"""
 import json
+import logging
 import os
+import threading
+import time
 from pathlib import Path
-from typing import Any, Dict, Set
+from typing import Any, Callable, Dict, FrozenSet, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
 
 # Ruta por defecto relativa al repo; permite override por env
 DEFAULT_TENANTS_PATH = os.getenv("TENANTS_REGISTRY_PATH", "config/tenants.json")
+TENANTS_REGISTRY_SOURCE = os.getenv("TENANTS_REGISTRY_SOURCE", "file").lower()
+TENANTS_REGISTRY_POLL_SECONDS = float(os.getenv("TENANTS_REGISTRY_POLL_SECONDS", "5"))
+TENANTS_REGISTRY_FULL_REFRESH_SECONDS = float(
+    os.getenv("TENANTS_REGISTRY_FULL_REFRESH_SECONDS", "300")
+)
+
+
+class TenantSnapshot(NamedTuple):
+    tenants: FrozenSet[str]
+    meta: Dict[str, Dict[str, Any]]
+
+
+_EMPTY = TenantSnapshot(frozenset(), {})
+
+
+def parse_tenants(data: Any) -> TenantSnapshot:
+    """Lista de ids u objetos con `id` (o `{"tenants": [...]}`); omite los `active: false`."""
+    if isinstance(data, dict):
+        data = data.get("tenants", [])
+    if not isinstance(data, list):
+        return _EMPTY
+    tenants = set()
+    meta: Dict[str, Dict[str, Any]] = {}
+    for item in data:
+        if isinstance(item, str):
+            tid = item.strip()
+            if tid:
+                tenants.add(tid)
+        elif isinstance(item, dict) and "id" in item and item.get("active", True) is not False:
+            tid = str(item["id"]).strip()
+            if tid:
+                tenants.add(tid)
+                meta[tid] = item
+    return TenantSnapshot(frozenset(tenants), meta)
 
 
 class TenantRegistry:
-    def __init__(self, path: str = DEFAULT_TENANTS_PATH):
+    def __init__(
+        self,
+        path: str = DEFAULT_TENANTS_PATH,
+        source: str = TENANTS_REGISTRY_SOURCE,
+        session_factory: Optional[Callable[[], Any]] = None,
+        poll_seconds: float = TENANTS_REGISTRY_POLL_SECONDS,
+        full_refresh_seconds: float = TENANTS_REGISTRY_FULL_REFRESH_SECONDS,
+    ):
+        if source not in ("file", "db"):
+            raise ValueError(f"TENANTS_REGISTRY_SOURCE desconocido: {source!r}")
         self.path = Path(path)
-        self._tenants: Set[str] = set()
-        self._meta: Dict[str, Dict[str, Any]] = {}
+        self.source = source
+        self.session_factory = session_factory
+        self.poll_seconds = poll_seconds
+        self.full_refresh_seconds = full_refresh_seconds
+        # Se invoca con el conjunto nuevo cada vez que cambia (p.ej. para una métrica)
+        self.on_change: Optional[Callable[[FrozenSet[str]], None]] = None
+        self._snapshot = _EMPTY
         self._loaded = False
+        self._fingerprint: Optional[Tuple[Any, ...]] = None
+        self._next_full = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
 
-    def load(self) -> None:
+    def _swap(self, snapshot: TenantSnapshot) -> None:
+        changed = snapshot.tenants != self._snapshot.tenants
+        self._snapshot = snapshot
+        self._loaded = True
+        if changed and self.on_change is not None:
+            self.on_change(snapshot.tenants)
+
+    def _load_file(self) -> TenantSnapshot:
         if not self.path.exists():
-            self._tenants = set()
-            self._meta = {}
-            self._loaded = True
-            return
+            return _EMPTY
         try:
             with self.path.open("r", encoding="utf-8") as fh:
-                data = json.load(fh)
-            if isinstance(data, list):
-                parsed_set: Set[str] = set()
-                meta: Dict[str, Dict[str, Any]] = {}
-                for item in data:
-                    if isinstance(item, str):
-                        tid = item.strip()
-                        if tid:
-                            parsed_set.add(tid)
-                    elif isinstance(item, dict) and "id" in item:
-                        tid = str(item["id"]).strip()
-                        if tid:
-                            parsed_set.add(tid)
-                            meta[tid] = item
-                self._tenants = parsed_set
-                self._meta = meta
-            else:
-                self._tenants = set()
-                self._meta = {}
+                return parse_tenants(json.load(fh))
         except Exception:
-            self._tenants = set()
-            self._meta = {}
-        self._loaded = True
+            logger.warning("tenant_registry_file_invalid", extra={"path": str(self.path)})
+            return _EMPTY
+
+    def _session(self) -> Any:
+        if self.session_factory is None:
+            # Import perezoso: sólo con source=db se necesita SQLAlchemy/driver
+            from backend.app.db.session import SessionLocal
+
+            self.session_factory = SessionLocal
+        return self.session_factory()
+
+    @staticmethod
+    def _db_fingerprint(db: Any) -> Tuple[Any, ...]:
+        from sqlalchemy import func, select
+
+        from backend.app.db.models import Tenant
+
+        query = select(
+            func.count(Tenant.id), func.sum(func.length(Tenant.id)), func.max(Tenant.created_at)
+        ).where(Tenant.active.is_(True))
+        return tuple(db.execute(query).one())
+
+    @staticmethod
+    def _db_snapshot(db: Any) -> TenantSnapshot:
+        from sqlalchemy import select
+
+        from backend.app.db.models import Tenant
+
+        query = select(Tenant.id, Tenant.display_name, Tenant.policy_id).where(
+            Tenant.active.is_(True)
+        )
+        meta = {
+            row.id: {
+                "id": row.id,
+                "display_name": row.display_name,
+                "policy_id": row.policy_id,
+                "active": True,
+            }
+            for row in db.execute(query)
+        }
+        return TenantSnapshot(frozenset(meta), meta)
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Relee la tabla si cambió la huella (o toca el refresco completo); True si se releyó.
+        Lanza la excepción de la base de datos si no se puede consultar.
+        """
+        with self._session() as db:
+            fingerprint = self._db_fingerprint(db)
+            if (
+                not force
+                and fingerprint == self._fingerprint
+                and time.monotonic() < self._next_full
+            ):
+                return False
+            snapshot = self._db_snapshot(db)
+        previous = self._snapshot.tenants
+        self._fingerprint = fingerprint
+        self._next_full = time.monotonic() + self.full_refresh_seconds
+        self._swap(snapshot)
+        if snapshot.tenants != previous:
+            logger.info(
+                "tenant_registry_refreshed",
+                extra={
+                    "tenants": len(snapshot.tenants),
+                    "added": len(snapshot.tenants - previous),
+                    "removed": len(previous - snapshot.tenants),
+                },
+            )
+        return True
+
+    def load(self) -> None:
+        if self.source == "db":
+            try:
+                self.refresh(force=True)
+                return
+            except Exception:
+                logger.warning("tenant_registry_db_unavailable", exc_info=True)
+                if self._loaded:
+                    return
+                # Arranque sin base de datos: el fichero hasta que el poll consiga leer la tabla
+                self._fingerprint = None
+        self._swap(self._load_file())
 
     def reload(self) -> None:
         self._loaded = False
         self.load()
 
-    def all(self) -> Set[str]:
+    def start(self) -> None:
+        """Hilo de poll de la tabla (sólo con source=db)."""
+        if self.source != "db" or self.poll_seconds <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._poll_loop, name="tenant-registry-poll", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _poll_loop(self) -> None:
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.refresh()
+            except Exception:
+                logger.warning("tenant_registry_refresh_failed", exc_info=True)
+
+    def all(self) -> FrozenSet[str]:
         if not self._loaded:
             self.load()
-        return set(self._tenants)
+        return self._snapshot.tenants
 
     def metadata(self, tenant_id: str) -> Dict[str, Any]:
         if not self._loaded:
             self.load()
-        return dict(self._meta.get(tenant_id, {}))
+        return dict(self._snapshot.meta.get(tenant_id, {}))
 
     def is_valid(self, tenant_id: str) -> bool:
         if not tenant_id or not isinstance(tenant_id, str):
             return False
         if not self._loaded:
             self.load()
-        return tenant_id in self._tenants
+        return tenant_id in self._snapshot.tenants
 
 
 # Singleton-ish instance for simple imports
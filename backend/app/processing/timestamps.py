@@ -0,0 +1,53 @@
+"""
+Formateo de timestamps con caché.
+
+Las ráfagas de un mismo firewall comparten segundo: el prefijo "YYYY-MM-DDTHH:MM:SS" se
+calcula una vez por segundo epoch (lru_cache) y a cada evento sólo se le añaden los
+milisegundos. La salida es idéntica a `datetime.fromtimestamp(ms / 1000, tz=utc).isoformat()`
+(sin fracción si los milisegundos son 0). La normalización del offset `tz=+0100` ->
+`+01:00` también se cachea por valor.
+"""
+import re
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Optional
+
+TZ_OFFSET_RE = re.compile(r"^[+-]\d{4}$")
+_UTC_SUFFIX = "+00:00"
+# Fracciones ".mmm000" precalculadas (índice = milisegundos; 0 = sin fracción)
+_MILLIS = [""] + [f".{ms:03d}000" for ms in range(1, 1000)]
+
+
+@lru_cache(maxsize=4096)
+def second_prefix(epoch_seconds: int) -> str:
+    """'YYYY-MM-DDTHH:MM:SS' (UTC) del segundo epoch."""
+    return datetime.fromtimestamp(epoch_seconds, tz=timezone.utc).isoformat()[:-6]
+
+
+def epoch_ms_to_iso(ms: int) -> str:
+    """Epoch en milisegundos a ISO 8601 UTC. Lanza OverflowError/OSError/ValueError si no cabe."""
+    seconds, millis = divmod(ms, 1000)
+    return second_prefix(seconds) + _MILLIS[millis] + _UTC_SUFFIX
+
+
+def ns_epoch_to_iso(ns_str: str) -> str:
+    """`eventtime` de FortiGate (ns) a ISO 8601 con precisión de ms; ahora si no es válido."""
+    try:
+        return epoch_ms_to_iso(int(ns_str) // 1_000_000)
+    except Exception:
+        return datetime.now(timezone.utc).isoformat()
+
+
+@lru_cache(maxsize=256)
+def normalize_tz_offset(tz: str) -> str:
+    """'+0100' -> '+01:00'; cualquier otro valor se devuelve igual."""
+    if TZ_OFFSET_RE.match(tz):
+        return tz[:3] + ":" + tz[3:]
+    return tz
+
+
+def kv_datetime_to_iso(date: str, timev: str, tz: Optional[str]) -> str:
+    """Campos `date`, `time` y `tz` de FortiGate a ISO 8601 (Z si no hay tz)."""
+    if tz:
+        return f"{date}T{timev}{normalize_tz_offset(tz)}"
+    return f"{date}T{timev}Z"
@@ -20,11 +20,33 @@ def coerce_datetimes(obj: Any) -> Any:
     return to_iso8601(obj)
 
 
-def prepare_event(evt: Dict[str, Any]) -> Dict[str, Any]:
-    # Garantiza mínimos, normaliza datetimes y rellena tenant_id desde settings si falta
+def coerce_datetimes_inplace(obj: Any) -> Any:
+    # Como coerce_datetimes, pero sólo reescribe los valores datetime (sin copiar el resto)
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            if isinstance(v, datetime):
+                obj[k] = to_iso8601(v)
+            elif isinstance(v, (dict, list)):
+                coerce_datetimes_inplace(v)
+    elif isinstance(obj, list):
+        for i, v in enumerate(obj):
+            if isinstance(v, datetime):
+                obj[i] = to_iso8601(v)
+            elif isinstance(v, (dict, list)):
+                coerce_datetimes_inplace(v)
+    return obj
+
+
+def prepare_event(evt: Dict[str, Any], coerce: bool = True) -> Dict[str, Any]:
+    """
+    Garantiza mínimos, normaliza datetimes y rellena tenant_id desde settings si falta.
+    Modifica `evt` en el sitio y lo devuelve. coerce=False omite la búsqueda de datetimes:
+    para eventos que sólo contienen tipos JSON (salida de normalize() o de json.loads).
+    """
     if "@timestamp" not in evt:
         evt["@timestamp"] = evt.get("timestamp", datetime.now(timezone.utc).isoformat())
-    evt = coerce_datetimes(evt)
+    if coerce:
+        coerce_datetimes_inplace(evt)
     # set dataset/schema only if missing (idempotent)
     if "dataset" not in evt:
         evt["dataset"] = "syslog.generic"
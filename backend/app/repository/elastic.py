@@ -2,6 +2,8 @@ import logging
 import time
 from typing import Any, Dict, Optional
 
+from opensearchpy.exceptions import ConflictError
+
 from backend.app.core.opensearch_client import get_client
 from backend.app.metrics.counters import INDEX_RETRIES
 
@@ -21,6 +23,7 @@ def index_event(
     ensure_required: bool = True,
     retries: int = 3,
     backoff_seconds: float = 0.5,
+    doc_id: Optional[str] = None,
 ) -> Dict[str, Any]:
     if ensure_required:
         body.setdefault("schema_version", "1.0.0")
@@ -33,12 +36,20 @@ def index_event(
         params["refresh"] = refresh
     if pipeline:
         params["pipeline"] = pipeline
+    if doc_id is not None:
+        # _id determinista: create falla con 409 si el evento ya estaba indexado
+        params["op_type"] = "create"
 
     attempt = 0
     last_err: Optional[Exception] = None
     while attempt <= retries:
         try:
+            if doc_id is not None:
+                return es_client.index(index=index, body=body, id=doc_id, params=params)
             return es_client.index(index=index, body=body, params=params)
+        except ConflictError:
+            logger.info("os_index_duplicate", extra={"index": index, "doc_id": doc_id})
+            return {"_index": index, "_id": doc_id, "result": "duplicate"}
         except Exception as e:
             last_err = e
             logger.warning(
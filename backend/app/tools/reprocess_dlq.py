@@ -3,6 +3,7 @@
 Reprocess DLQ with normalization and optional reject reason annotation.
 Defaults updated to nubla_logs_default.dlq.
 """
+
 from __future__ import annotations
 
 import argparse
@@ -25,6 +26,17 @@ except Exception:
             return x
 
 
+# Codec JSON del pipeline (orjson si está instalado); fallback json estándar
+try:
+    from backend.app.core.json_codec import dumps as json_dumps  # type: ignore
+    from backend.app.core.json_codec import loads as json_loads  # type: ignore
+except Exception:
+    json_loads = json.loads
+
+    def json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
 def fix_event(evt: Dict[str, Any], severity_default: str) -> Dict[str, Any]:
     out = dict(evt)
     if out.get("severity") in (None, "", "null"):
@@ -48,7 +60,7 @@ def publish_event(
     ch.basic_publish(
         exchange=exchange,
         routing_key=routing_key,
-        body=json.dumps(body, ensure_ascii=False).encode("utf-8"),
+        body=json_dumps(body),
         properties=props,
     )
 
@@ -101,7 +113,7 @@ def main() -> None:
         raw = body.decode("utf-8", errors="replace")
         evt: Optional[Dict[str, Any]] = None
         try:
-            evt = json.loads(raw)
+            evt = json_loads(raw)
         except Exception:
             invalid_json += 1
             if args.quarantine:
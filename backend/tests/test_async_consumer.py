@@ -0,0 +1,166 @@
+import asyncio
+
+from backend.app.processing.async_consumer import AsyncBulkPipeline
+from backend.app.processing.bulk_controller import AdaptiveBulkController
+from backend.app.processing.spool import DiskSpool
+
+
+class SlowFirstClient:
+    """El primer _bulk tarda más que el segundo: fuerza finalización fuera de orden."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def bulk(self, body, refresh=False):
+        self.calls += 1
+        await asyncio.sleep(0.05 if self.calls == 1 else 0.0)
+        return {"errors": False, "items": []}
+
+
+def test_async_pipeline_settles_in_flush_order():
+    settled = []
+
+    async def settle(ok, failed):
+        settled.append(list(ok))
+
+    async def scenario():
+        client = SlowFirstClient()
+        pipe = AsyncBulkPipeline(client, settle, max_items=2, max_in_flight=2)
+        for i in range(4):
+            await pipe.add("logs-default", {"message": str(i)}, ref=i)
+        await pipe.close()
+        return client.calls
+
+    calls = asyncio.run(scenario())
+    assert calls == 2
+    assert settled == [[0, 1], [2, 3]]
+
+
+def test_async_pipeline_settles_in_cut_order_when_slot_is_taken_first():
+    settled = []
+
+    class GatedClient:
+        def __init__(self):
+            self.gate = asyncio.Event()
+
+        async def bulk(self, body, refresh=False):
+            await self.gate.wait()
+            return {"errors": False, "items": []}
+
+    async def settle(ok, failed):
+        settled.append(list(ok))
+
+    async def scenario():
+        client = GatedClient()
+        pipe = AsyncBulkPipeline(client, settle, max_items=1, max_in_flight=1)
+        await pipe.add("logs-default", {"message": "a"}, ref="a")
+        # "b" se corta y espera slot; "c" lo consigue antes (el límite sube sin notificar,
+        # como al aplicar un setpoint del controlador)
+        waiting = asyncio.create_task(pipe.add("logs-default", {"message": "b"}, ref="b"))
+        await asyncio.sleep(0)
+        pipe.max_in_flight = 2
+        await pipe.add("logs-default", {"message": "c"}, ref="c")
+        client.gate.set()
+        await waiting
+        await pipe.close()
+
+    asyncio.run(scenario())
+    assert settled == [["a"], ["b"], ["c"]]
+
+
+def test_async_pipeline_failed_bulk_reports_all_refs():
+    settled = []
+
+    class DownClient:
+        async def bulk(self, body, refresh=False):
+            raise ConnectionError("down")
+
+    async def settle(ok, failed):
+        settled.append((ok, failed))
+
+    async def scenario():
+        pipe = AsyncBulkPipeline(DownClient(), settle, max_items=10, retry_backoff_ms=1)
+        await pipe.add("logs-default", {"message": "x"}, ref="a")
+        await pipe.close()
+
+    asyncio.run(scenario())
+    assert settled == [([], [("a", "bulk_failed")])]
+
+
+def _item(status, etype=None):
+    op = {"status": status}
+    if etype:
+        op["error"] = {"type": etype}
+    return {"index": op}
+
+
+class ScriptedClient:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.bodies = []
+
+    async def bulk(self, body, refresh=False):
+        self.bodies.append(body)
+        resp = self.responses.pop(0)
+        if isinstance(resp, Exception):
+            raise resp
+        return resp
+
+
+def _run(client, refs, **kwargs):
+    settled = []
+
+    async def settle(ok, failed):
+        settled.append((sorted(ok), failed))
+
+    async def scenario():
+        pipe = AsyncBulkPipeline(client, settle, max_items=10, retry_backoff_ms=1, **kwargs)
+        for ref in refs:
+            await pipe.add("logs-default", {"message": ref}, ref=ref)
+        await pipe.close()
+        return pipe
+
+    return asyncio.run(scenario()), settled
+
+
+def test_async_pipeline_retries_only_transient_items():
+    client = ScriptedClient(
+        [
+            {
+                "errors": True,
+                "items": [
+                    _item(201),
+                    _item(429, "es_rejected_execution_exception"),
+                    _item(400, "mapper_parsing_exception"),
+                ],
+            },
+            ConnectionError("reset"),
+            {"errors": False, "items": [_item(201)]},
+        ]
+    )
+    _, settled = _run(client, ["a", "b", "c"])
+    assert len(client.bodies) == 3
+    assert client.bodies[1] == client.bodies[2] and b'"b"' in client.bodies[1]
+    assert client.bodies[1].count(b"\n") == 2
+    assert settled == [(["a", "b"], [("c", "mapper_parsing_exception")])]
+
+
+def test_async_pipeline_spools_exhausted_items(tmp_path):
+    spool = DiskSpool(str(tmp_path))
+    rejected = {"errors": True, "items": [_item(503, "unavailable_shards_exception")]}
+    client = ScriptedClient([rejected, rejected])
+    _, settled = _run(client, ["a"], max_retries=1, spool=spool)
+    assert settled == [(["a"], [])]
+    seq = spool.oldest()
+    assert seq is not None and b'"a"' in b"".join(line for _, line in spool.read(seq))
+    spool.close()
+
+
+def test_async_pipeline_applies_controller_setpoints():
+    ctrl = AdaptiveBulkController(
+        batch_size=2, min_batch_size=1, max_batch_size=10, additive_step=3, cooldown=1
+    )
+    client = ScriptedClient([{"errors": False, "items": [], "took": 3}])
+    pipe, settled = _run(client, ["a", "b"], controller=ctrl)
+    assert settled == [(["a", "b"], [])]
+    assert pipe.max_items == ctrl.batch_size == 5
@@ -0,0 +1,38 @@
+from backend.app.processing.backpressure import CONSUMER_PAUSED, BackpressureGate
+
+
+def test_gate_pauses_on_high_bytes_and_resumes_below_low():
+    gate = BackpressureGate(high_bytes=1000, low_bytes=400)
+    assert gate.update(999, 0, 2) is None
+    assert gate.update(1000, 0, 2) is True
+    assert CONSUMER_PAUSED._value.get() == 1
+    # Histéresis: entre low y high sigue pausado
+    assert gate.update(600, 0, 2) is None
+    assert gate.paused
+    assert gate.update(400, 0, 2) is False
+    assert CONSUMER_PAUSED._value.get() == 0
+
+
+def test_gate_ignores_busy_in_flight_slots_by_default():
+    gate = BackpressureGate(high_bytes=10_000)
+    # Todos los slots ocupados es el estado estable con flush en segundo plano
+    assert gate.update(0, 2, 2) is None
+    assert not gate.paused
+
+
+def test_gate_pauses_when_all_in_flight_slots_busy():
+    gate = BackpressureGate(high_bytes=10_000, use_in_flight=True)
+    assert gate.update(0, 1, 2) is None
+    assert gate.update(0, 2, 2) is True
+    # Liberar un solo slot no reanuda: evita un cancel/consume por cada flush
+    assert gate.update(0, 1, 2) is None
+    assert gate.update(0, 0, 2) is False
+    assert gate.update(0, 4, 4) is True
+    assert gate.update(0, 2, 4) is None
+    assert gate.update(0, 1, 4) is False
+
+
+def test_gate_ignores_in_flight_without_background_flush():
+    gate = BackpressureGate(high_bytes=10_000, use_in_flight=True)
+    assert gate.update(0, 0, 0) is None
+    assert not gate.paused
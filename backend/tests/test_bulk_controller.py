@@ -0,0 +1,44 @@
+from backend.app.processing.bulk_controller import AdaptiveBulkController
+
+
+def _ctrl(**kw):
+    params = dict(
+        batch_size=100,
+        min_batch_size=10,
+        max_batch_size=200,
+        concurrency=1,
+        max_concurrency=3,
+        target_latency_ms=100,
+        additive_step=50,
+        cooldown=1,
+    )
+    params.update(kw)
+    return AdaptiveBulkController(**params)
+
+
+def test_additive_increase_then_concurrency_when_healthy():
+    c = _ctrl()
+    c.observe(0.01, took_ms=5)
+    assert c.batch_size == 150
+    c.observe(0.01)
+    assert c.batch_size == 200
+    c.observe(0.01)
+    assert (c.batch_size, c.concurrency) == (200, 2)
+
+
+def test_rejections_cut_concurrency_before_batch():
+    c = _ctrl(batch_size=200, concurrency=3)
+    c.observe(0.01, rejected=5)
+    assert (c.batch_size, c.concurrency) == (200, 1)
+    c.observe(0.01, rejected=1)
+    assert c.batch_size == 100
+    for _ in range(10):
+        c.observe(0.01, failed=True)
+    assert c.batch_size == c.min_batch_size
+
+
+def test_high_latency_shrinks_batch():
+    c = _ctrl(batch_size=200, ewma_alpha=1.0)
+    c.observe(0.5)
+    assert c.batch_size == 160
+    assert c.concurrency == 1
@@ -0,0 +1,233 @@
+from backend.app.processing.bulk_indexer import BulkIndexer
+
+
+class FakeClient:
+    def __init__(self, resp=None, exc=None):
+        self.resp = resp or {"errors": False, "items": []}
+        self.exc = exc
+        self.bodies = []
+
+    def bulk(self, body, refresh=False):
+        self.bodies.append(body)
+        if self.exc:
+            raise self.exc
+        return self.resp
+
+
+def test_flush_reports_refs_and_calls_on_flush():
+    results = []
+    client = FakeClient()
+    bi = BulkIndexer(client, max_items=2, max_interval_ms=60_000, on_flush=results.append)
+    bi.add("logs-a", {"message": "1"}, ref=1)
+    assert not client.bodies
+    bi.add("logs-a", {"message": "2"}, ref=2)
+    assert len(client.bodies) == 1
+    assert results[0].ok == [1, 2]
+    assert results[0].failed == []
+
+
+def test_flush_partial_errors_by_item():
+    resp = {
+        "errors": True,
+        "items": [
+            {"index": {"status": 201}},
+            {"index": {"status": 400, "error": {"type": "mapper_parsing_exception"}}},
+        ],
+    }
+    bi = BulkIndexer(FakeClient(resp=resp), max_items=10)
+    bi.add("logs-a", {"message": "1"}, ref="a")
+    bi.add("logs-a", {"message": "2"}, ref="b")
+    result = bi.flush()
+    assert result.ok == ["a"]
+    assert result.failed == [("b", "mapper_parsing_exception")]
+
+
+def test_flush_request_failure_fails_all_items():
+    client = FakeClient(exc=ConnectionError("down"))
+    bi = BulkIndexer(client, max_items=10, max_retries=1, retry_backoff_ms=1)
+    bi.add("logs-a", {"message": "1"}, ref=1)
+    result = bi.flush()
+    assert len(client.bodies) == 2
+    assert result.failed == [(1, "bulk_failed")]
+    assert bi.flush().items == 0
+
+
+class GatedClient(FakeClient):
+    """bulk() bloquea hasta que el test abre la puerta (simula OpenSearch lento)."""
+
+    def __init__(self):
+        super().__init__()
+        import threading
+
+        self.gate = threading.Event()
+
+    def bulk(self, body, refresh=False):
+        self.gate.wait(5)
+        return super().bulk(body, refresh)
+
+
+def test_timer_flushes_idle_buffer():
+    import time
+
+    results = []
+    client = FakeClient()
+    bi = BulkIndexer(client, max_items=100, max_interval_ms=20, on_flush=results.append)
+    bi.start()
+    try:
+        bi.add("logs-a", {"message": "quiet"}, ref=1)
+        deadline = time.time() + 2
+        while not results and time.time() < deadline:
+            time.sleep(0.01)
+        assert results and results[0].ok == [1]
+    finally:
+        bi.close(timeout=2)
+
+
+def test_background_flush_does_not_block_add_and_keeps_order():
+    results = []
+    client = GatedClient()
+    bi = BulkIndexer(
+        client,
+        max_items=1,
+        max_interval_ms=60_000,
+        on_flush=results.append,
+        background=True,
+        max_in_flight=2,
+    )
+    bi.start()
+    try:
+        bi.add("logs-a", {"message": "1"}, ref=1)
+        bi.add("logs-a", {"message": "2"}, ref=2)
+        # Ambos bulks en vuelo; add() ha retornado sin esperar a OpenSearch
+        assert results == []
+        pending_bytes, in_flight, limit = bi.pressure()
+        assert (in_flight, limit) == (2, 2) and pending_bytes > 0
+        client.gate.set()
+        assert bi.wait_idle(timeout=2)
+        assert bi.pressure() == (0, 0, 2)
+        assert [r.ok for r in results] == [[1], [2]]
+    finally:
+        client.gate.set()
+        bi.close(timeout=2)
+
+
+def test_send_exception_fails_batch_and_keeps_delivering():
+    results = []
+    bi = BulkIndexer(FakeClient(), max_items=1, max_interval_ms=60_000, on_flush=results.append)
+    send = bi._send
+    calls = []
+
+    def flaky_send(actions, refs):
+        calls.append(refs)
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+        return send(actions, refs)
+
+    bi._send = flaky_send
+    bi.add("logs-a", {"message": "1"}, ref=1)
+    bi.add("logs-a", {"message": "2"}, ref=2)
+    assert [r.failed for r in results] == [[(1, "bulk_failed")], []]
+    assert [r.ok for r in results] == [[], [2]]
+
+
+def test_body_is_prebuilt_ndjson():
+    import json
+
+    client = FakeClient()
+    bi = BulkIndexer(client, max_items=10, default_pipeline="logs_ingest")
+    bi.add("logs-a", {"message": "ñ", "n": 1})
+    bi.flush()
+    body = client.bodies[0]
+    assert isinstance(body, bytes) and body.endswith(b"\n")
+    header, doc = [json.loads(line) for line in body.splitlines()]
+    assert header == {"index": {"_index": "logs-a", "pipeline": "logs_ingest"}}
+    assert doc == {"message": "ñ", "n": 1}
+
+
+def test_flush_on_byte_limit_before_exceeding():
+    client = FakeClient()
+    bi = BulkIndexer(client, max_items=1000, max_interval_ms=60_000, max_bytes=200)
+    big = {"message": "x" * 80}
+    bi.add("logs-a", big, ref=1)
+    assert not client.bodies
+    bi.add("logs-a", big, ref=2)
+    # El segundo evento no cabe: se envía el primero solo
+    assert len(client.bodies) == 1
+    assert all(len(b) <= 200 for b in client.bodies)
+
+
+class ScriptedClient(FakeClient):
+    """Devuelve respuestas _bulk predefinidas, una por llamada."""
+
+    def __init__(self, responses):
+        super().__init__()
+        self.responses = list(responses)
+
+    def bulk(self, body, refresh=False):
+        self.bodies.append(body)
+        return self.responses.pop(0)
+
+
+def _item(status, etype=None):
+    op = {"status": status}
+    if etype:
+        op["error"] = {"type": etype}
+    return {"index": op}
+
+
+def test_retryable_items_resent_alone_and_permanent_failures_reported():
+    client = ScriptedClient(
+        [
+            {
+                "errors": True,
+                "items": [
+                    _item(201),
+                    _item(429, "es_rejected_execution_exception"),
+                    _item(400, "mapper_parsing_exception"),
+                ],
+            },
+            {"errors": False, "items": [_item(201)]},
+        ]
+    )
+    bi = BulkIndexer(client, max_items=10, retry_backoff_ms=1)
+    for ref in ("a", "b", "c"):
+        bi.add("logs-a", {"message": ref}, ref=ref)
+    result = bi.flush()
+    assert len(client.bodies) == 2
+    assert client.bodies[1].count(b"\n") == 2  # sólo el item 429 (cabecera + doc)
+    assert b'"b"' in client.bodies[1]
+    assert sorted(result.ok) == ["a", "b"]
+    assert result.failed == [("c", "mapper_parsing_exception")]
+
+
+def test_retryable_items_exhausted_go_to_failed():
+    rejected = {"errors": True, "items": [_item(503, "unavailable_shards_exception")]}
+    client = ScriptedClient([rejected, rejected, rejected])
+    bi = BulkIndexer(client, max_items=10, max_retries=2, retry_backoff_ms=1)
+    bi.add("logs-a", {"message": "x"}, ref=1)
+    result = bi.flush()
+    assert len(client.bodies) == 3
+    assert result.failed == [(1, "unavailable_shards_exception")]
+
+
+def test_retry_backoff_uses_full_jitter(monkeypatch):
+    bi = BulkIndexer(FakeClient(), retry_backoff_ms=100)
+    monkeypatch.setattr("random.uniform", lambda a, b: a)
+    assert bi._backoff_seconds(3) == 0
+    monkeypatch.setattr("random.uniform", lambda a, b: b)
+    assert bi._backoff_seconds(1) == 0.1 and bi._backoff_seconds(3) == 0.4
+
+
+def test_controller_setpoints_applied_to_indexer():
+    from backend.app.processing.bulk_controller import AdaptiveBulkController
+
+    ctrl = AdaptiveBulkController(
+        batch_size=2, min_batch_size=1, max_batch_size=10, additive_step=3, cooldown=1
+    )
+    client = FakeClient(resp={"errors": False, "items": [], "took": 3})
+    bi = BulkIndexer(client, max_items=999, controller=ctrl)
+    assert bi.max_items == 2
+    bi.add("logs-a", {"message": "1"})
+    bi.add("logs-a", {"message": "2"})
+    assert len(client.bodies) == 1
+    assert bi.max_items == 5
@@ -0,0 +1,45 @@
+from backend.app.processing import consumer
+from backend.app.processing.bulk_indexer import FlushResult
+from backend.app.processing.consumer import PendingDelivery, settle_flush
+
+
+class FakeChannel:
+    def __init__(self):
+        self.calls = []
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.calls.append(("ack", delivery_tag, multiple))
+
+    def basic_nack(self, delivery_tag, requeue=True, multiple=False):
+        self.calls.append(("nack", delivery_tag, requeue))
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self.calls.append(("publish", exchange, properties.headers["x-reject-reason"]))
+
+
+def _pd(tag):
+    return PendingDelivery(tag, b"{}", "nubla.log.default", "default")
+
+
+def test_settle_flush_single_multi_ack(monkeypatch):
+    monkeypatch.setattr(consumer, "USE_MANUAL_DLX", False)
+    ch = FakeChannel()
+    settle_flush(ch, FlushResult(items=3, ok=[_pd(1), _pd(2), _pd(3)]))
+    assert ch.calls == [("ack", 3, True)]
+
+
+def test_settle_flush_failed_items_to_dlx(monkeypatch):
+    monkeypatch.setattr(consumer, "USE_MANUAL_DLX", False)
+    ch = FakeChannel()
+    settle_flush(ch, FlushResult(items=3, ok=[_pd(1), _pd(3)], failed=[(_pd(2), "bulk_failed")]))
+    assert ch.calls == [("nack", 2, False), ("ack", 3, True)]
+
+
+def test_settle_flush_manual_dlx_publishes_with_reason(monkeypatch):
+    monkeypatch.setattr(consumer, "USE_MANUAL_DLX", True)
+    ch = FakeChannel()
+    settle_flush(ch, FlushResult(items=1, failed=[(_pd(7), "mapper_parsing_exception")]))
+    assert ch.calls == [
+        ("publish", consumer.MANUAL_DLX_EXCHANGE, "mapper_parsing_exception"),
+        ("ack", 7, True),
+    ]
@@ -0,0 +1,64 @@
+from prometheus_client import REGISTRY
+
+from backend.app.processing import consumer
+from backend.app.processing.bulk_indexer import BulkIndexer, parse_bulk_item
+from backend.app.processing.dedup import RecentIdFilter, document_id, event_document_id
+
+
+def test_document_id_is_deterministic_per_event():
+    evt = {
+        "tenant_id": "acme",
+        "@timestamp": "2024-05-01T10:00:00Z",
+        "original": {"message_raw": "date=2024-05-01 srcip=1.2.3.4"},
+    }
+    assert event_document_id(evt) == event_document_id(dict(evt))
+    assert event_document_id(evt) == document_id(
+        "acme", "date=2024-05-01 srcip=1.2.3.4", "2024-05-01T10:00:00Z"
+    )
+    assert event_document_id({**evt, "tenant_id": "other"}) != event_document_id(evt)
+    assert event_document_id({"tenant_id": "acme"}) is None
+
+
+def test_recent_id_filter_rotates_generations():
+    f = RecentIdFilter(capacity=2, error_rate=0.001)
+    f.add("a")
+    f.add("b")  # llena la generación: pasa a ser la anterior
+    f.add("c")
+    assert "a" in f and "c" in f
+    f.add("d")  # segunda rotación: "a" y "b" se olvidan
+    assert "c" in f and "d" in f
+    assert "a" not in f
+
+
+def test_only_redeliveries_are_filtered(monkeypatch):
+    monkeypatch.setattr(consumer, "recent_ids", RecentIdFilter(capacity=100))
+    consumer.remember_indexed("id-1")
+    assert not consumer.is_recent_duplicate("id-1", False, None)
+    assert consumer.is_recent_duplicate("id-1", True, None)
+    assert consumer.is_recent_duplicate("id-1", False, {"x-reprocess-reason": "dlq_reprocess"})
+    assert not consumer.is_recent_duplicate("id-2", True, None)
+
+
+def test_create_conflict_counts_as_indexed():
+    class Client:
+        def __init__(self):
+            self.bodies = []
+
+        def bulk(self, body, refresh=False):
+            self.bodies.append(body)
+            return {"errors": True, "items": [{"create": {"status": 409}}]}
+
+    def duplicates():
+        return REGISTRY.get_sample_value("bulk_item_duplicates_total")
+
+    client = Client()
+    bi = BulkIndexer(client, max_items=10)
+    bi.add("logs-a", {"message": "1"}, ref=1, doc_id="abc")
+    before = duplicates()
+    result = bi.flush()
+    assert client.bodies[0].startswith(b'{"create":{"_index":"logs-a","_id":"abc"}}\n')
+    assert result.ok == [1] and not result.failed
+    assert duplicates() == before + 1
+    # Volver a parsear el item no cuenta otra vez
+    assert parse_bulk_item({"create": {"status": 409}}) == (409, None)
+    assert duplicates() == before + 1
@@ -0,0 +1,44 @@
+import json
+from datetime import datetime, timezone
+
+from backend.app.processing import consumer
+from backend.app.processing.utils import coerce_datetimes, prepare_event
+
+
+def test_prepare_event_mutates_in_place():
+    nested = {"first_seen": datetime(2025, 1, 1, tzinfo=timezone.utc), "n": 1}
+    items = [datetime(2025, 1, 2), "x"]
+    evt = {"tenant_id": "t", "ts": datetime(2025, 1, 3), "source": nested, "items": items}
+    out = prepare_event(evt)
+    assert out is evt and out["source"] is nested and out["items"] is items
+    assert nested["first_seen"] == "2025-01-01T00:00:00+00:00"
+    assert items == ["2025-01-02T00:00:00+00:00", "x"]
+    assert out["ts"] == "2025-01-03T00:00:00+00:00"
+
+    # Mismo resultado que la versión que copia
+    def make():
+        return {"@timestamp": datetime(2025, 1, 3), "items": [{"at": datetime(2025, 1, 2)}]}
+
+    assert prepare_event(make()) == coerce_datetimes(prepare_event(make(), coerce=False))
+
+
+def test_prepare_event_without_coercion_keeps_values():
+    when = datetime(2025, 1, 1)
+    evt = prepare_event({"tenant_id": "t", "@timestamp": "2025-01-01T00:00:00Z", "x": when}, False)
+    assert evt["x"] is when
+    assert evt["dataset"] == "syslog.generic"
+
+
+def test_process_message_does_not_copy_normalized_event(monkeypatch):
+    produced = []
+
+    def fake_normalize(raw):
+        evt = {"tenant_id": "t1", "message": "m", "@timestamp": "2025-01-01T00:00:00Z"}
+        produced.append(evt)
+        return evt
+
+    monkeypatch.setattr(consumer, "normalize", fake_normalize)
+    monkeypatch.setattr(consumer, "is_valid_tenant", lambda t: True)
+    out = consumer.process_message(json.dumps({"message": "m"}).encode(), None)
+    assert out is produced[0]
+    assert out["schema_version"] == "1.0.0"
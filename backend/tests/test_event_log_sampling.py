@@ -0,0 +1,128 @@
+import json
+import logging
+import queue
+import time
+
+from backend.app.core import logging as app_logging
+from backend.app.core.logging import EventLog, NonBlockingQueueHandler
+
+
+class _Capture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def _logger(name):
+    capture = _Capture()
+    log = logging.getLogger(f"test_event_log.{name}")
+    log.handlers = [capture]
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    return log, capture.records
+
+
+def test_all_mode_logs_every_event_unchanged():
+    log, records = _logger("all")
+    events = EventLog(log, "event_indexed", mode="all")
+    for i in range(5):
+        events.record(tenant_id="acme", latency_seconds=0.0012345678)
+    assert len(records) == 5
+    assert records[0].getMessage() == "event_indexed"
+    assert records[0].tenant_id == "acme" and records[0].latency_seconds == 0.001235
+    events.flush()
+    assert len(records) == 5
+
+
+def test_sampled_mode_samples_and_summarizes():
+    log, records = _logger("sampled")
+    events = EventLog(log, "event_indexed", mode="sampled", sample_rate=0.01, summary_seconds=3600)
+    for i in range(1000):
+        events.record(tenant_id="acme" if i % 4 else "globex", latency_seconds=(i + 1) / 1000)
+    sampled = [r for r in records if r.getMessage() == "event_indexed"]
+    assert len(sampled) == 10 and all(r.sampled for r in sampled)
+    assert not [r for r in records if r.getMessage() == "event_indexed_summary"]
+
+    events.flush()
+    (summary,) = [r for r in records if r.getMessage() == "event_indexed_summary"]
+    assert summary.count == 1000 and summary.sampled == 10
+    assert summary.by_tenant == {"acme": 750, "globex": 250}
+    assert summary.latency_p50 == 0.501
+    assert summary.latency_p99 == 0.991
+    assert summary.latency_max == 1.0
+    # La ventana se reinicia: un flush sin eventos no escribe nada
+    events.flush()
+    assert len([r for r in records if r.getMessage() == "event_indexed_summary"]) == 1
+
+
+def test_summary_emitted_when_window_elapses():
+    log, records = _logger("window")
+    events = EventLog(
+        log, "mapped_host_to_tenant", mode="sampled", sample_rate=0, summary_seconds=0
+    )
+    events.record(tenant_id="acme", host="fw01")
+    messages = [r.getMessage() for r in records]
+    assert messages == ["mapped_host_to_tenant_summary"]
+    assert records[0].by_tenant == {"acme": 1} and records[0].sampled == 0
+    assert not hasattr(records[0], "latency_p50")
+
+
+def test_summary_written_by_timer_when_events_stop():
+    log, records = _logger("idle")
+    events = EventLog(log, "event_indexed", mode="sampled", sample_rate=0, summary_seconds=0.1)
+    events.record(tenant_id="acme", latency_seconds=0.2)
+    deadline = time.monotonic() + 5
+    while not records and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert [r.getMessage() for r in records] == ["event_indexed_summary"]
+    assert records[0].count == 1 and records[0].latency_max == 0.2
+
+
+def test_latency_max_is_exact_beyond_reservoir():
+    log, records = _logger("max")
+    events = EventLog(
+        log,
+        "event_indexed",
+        mode="sampled",
+        sample_rate=0,
+        summary_seconds=3600,
+        max_latency_samples=10,
+    )
+    for i in range(1000):
+        events.record(latency_seconds=0.001)
+    events.record(latency_seconds=5.0)
+    for i in range(1000):
+        events.record(latency_seconds=0.001)
+    events.flush()
+    assert records[-1].latency_max == 5.0
+
+
+def test_queue_handler_drops_when_full():
+    before = app_logging.records_dropped_counter()._value.get()
+    handler = NonBlockingQueueHandler(queue.Queue(1))
+    record = logging.LogRecord("x", logging.INFO, __file__, 1, "n=%d", (1,), None)
+    handler.handle(record)
+    handler.handle(logging.LogRecord("x", logging.INFO, __file__, 1, "n=%d", (2,), None))
+    assert app_logging.records_dropped_counter()._value.get() == before + 1
+    queued = handler.queue.get_nowait()
+    assert queued.getMessage() == "n=1" and queued.args is None
+
+
+def test_configure_logging_queue_writes_json_to_stdout(capsys):
+    root = logging.getLogger()
+    saved = root.handlers[:], root.level
+    try:
+        app_logging.configure_logging(level="INFO", use_queue=True)
+        assert isinstance(root.handlers[0], NonBlockingQueueHandler)
+        logging.getLogger("test_queue").info("hello", extra={"tenant_id": "acme"})
+        app_logging.stop_queue_logging()
+        line = capsys.readouterr().out.strip().splitlines()[-1]
+        data = json.loads(line)
+        assert data["message"] == "hello" and data["tenant_id"] == "acme"
+    finally:
+        app_logging.stop_queue_logging()
+        root.handlers, level = saved
+        root.setLevel(level)
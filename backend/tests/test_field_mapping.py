@@ -0,0 +1,125 @@
+import json
+import os
+
+import pytest
+
+from backend.app.processing.field_mapping import FieldMapper, load_mapping_file, to_int_safe
+from backend.app.processing.normalizer import (
+    FORTINET_FIELD_MAPPINGS,
+    build_field_mapper,
+    build_parser_registry,
+    normalize,
+    tokenize,
+)
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "fortigate_kv.log")
+
+
+def _legacy_fields(kv):
+    # Cadena de ifs que sustituye el mapeo declarativo (referencia de equivalencia)
+    out = {}
+    if "srcip" in kv:
+        out.setdefault("source", {})["ip"] = kv.get("srcip")
+    if "dstip" in kv:
+        out.setdefault("destination", {})["ip"] = kv.get("dstip")
+    sp = to_int_safe(kv.get("srcport"))
+    if sp is not None:
+        out.setdefault("source", {})["port"] = sp
+    dp = to_int_safe(kv.get("dstport"))
+    if dp is not None:
+        out.setdefault("destination", {})["port"] = dp
+    if "proto" in kv:
+        out.setdefault("network", {})["protocol"] = kv.get("proto")
+    if "attack" in kv:
+        out.setdefault("threat", {})["name"] = kv.get("attack")
+    if "attackid" in kv:
+        out.setdefault("threat", {})["id"] = kv.get("attackid")
+    crscore = to_int_safe(kv.get("crscore"))
+    if crscore is not None:
+        out.setdefault("threat", {})["score"] = crscore
+    if "craction" in kv:
+        out.setdefault("threat", {})["action"] = kv.get("craction")
+    if "policyid" in kv:
+        out.setdefault("rule", {})["id"] = kv.get("policyid")
+    cnt = to_int_safe(kv.get("count"))
+    if cnt is not None:
+        out.setdefault("event", {})["count"] = cnt
+    if "srccountry" in kv:
+        out.setdefault("source", {}).setdefault("geo", {})["country_iso_code"] = (
+            kv.get("srccountry").strip().upper().replace(" ", "_")
+        )
+    if "dstcountry" in kv:
+        out.setdefault("destination", {}).setdefault("geo", {})["country_iso_code"] = (
+            kv.get("dstcountry").strip().upper().replace(" ", "_")
+        )
+    labels = {}
+    for k in ("service", "proto"):
+        if k in kv:
+            labels[k] = kv.get(k)
+    if labels:
+        out["labels"] = labels
+    return out
+
+
+def _fixture_lines():
+    with open(FIXTURE, "r", encoding="utf-8") as f:
+        return [line.rstrip("\n") for line in f]
+
+
+@pytest.mark.parametrize("line", _fixture_lines())
+def test_fortinet_mapping_matches_legacy_chain(line):
+    _, kv = tokenize(line)
+    mapper = FieldMapper(FORTINET_FIELD_MAPPINGS)
+    assert mapper.apply(kv, {}) == _legacy_fields(kv)
+
+
+def test_invalid_cast_skips_field():
+    mapper = FieldMapper([("srcport", "source.port", "int"), ("srcip", "source.ip")])
+    assert mapper.apply({"srcport": "abc"}, {}) == {}
+    assert mapper.apply({"srcport": "80", "srcip": "1.1.1.1", "x": "y"}, {}) == {
+        "source": {"port": 80, "ip": "1.1.1.1"}
+    }
+
+
+def test_spec_errors():
+    with pytest.raises(ValueError):
+        FieldMapper([("a", "x", "nope")])
+    with pytest.raises(ValueError):
+        FieldMapper([("a", "x.y"), ("b", "x.y")])
+    with pytest.raises(ValueError):
+        FieldMapper([("a", "x"), ("b", "x.y.z")])
+    with pytest.raises(ValueError):
+        FieldMapper([("a", "x..y")])
+
+
+def test_extra_mappings_file(tmp_path):
+    path = tmp_path / "mappings.json"
+    path.write_text(
+        json.dumps(
+            {
+                "mappings": [
+                    {"source": "user", "target": "user.name", "cast": "lower"},
+                    {"source": "sentbyte", "target": "network.bytes_out", "cast": "int"},
+                ]
+            }
+        )
+    )
+    assert load_mapping_file(str(path))[0] == ("user", "user.name", "lower")
+    registry = build_parser_registry(mapper=build_field_mapper(str(path)))
+    out = normalize(
+        {"message": 'devname=H user="ADMIN" sentbyte=120 proto=6 srcport=x'}, registry=registry
+    )
+    assert out["user"]["name"] == "admin"
+    assert out["network"] == {"protocol": "6", "bytes_out": 120}
+    assert "source" not in out
+
+
+def test_custom_cast_and_generated_source(monkeypatch):
+    from backend.app.processing import field_mapping
+
+    monkeypatch.setitem(field_mapping.CASTS, "port_or_none", lambda v: int(v) if v else None)
+    mapper = FieldMapper([("dport", "destination.port", "port_or_none"), ("a", "top")])
+    assert mapper.apply({"dport": "", "a": "x"}, {}) == {"top": "x"}
+    assert mapper.apply({"dport": "22"}, {}) == {"destination": {"port": 22}}
+    # Una búsqueda por clave origen; sin llamadas para casts en línea
+    assert mapper._apply.__source__.count("get(") == 2
@@ -0,0 +1,141 @@
+import ipaddress
+import json
+import os
+import random
+
+from backend.app.processing import consumer
+from backend.app.processing.tenant_mapping import HostTenantIndex, HostTenantMapper
+
+
+def _write(path, mapping, mtime=None):
+    path.write_text(json.dumps(mapping), encoding="utf-8")
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def test_rule_types_and_precedence():
+    index = HostTenantIndex(
+        {
+            "FW-Madrid-01": "exact",
+            "fw-*": "prefix",
+            "fw-madrid-*": "longer-prefix",
+            "*.acme.local": "suffix",
+            "*.eu.acme.local": "longer-suffix",
+            "10.0.0.0/8": "net8",
+            "10.20.0.0/16": "net16",
+            "10.20.30.40": "exact-ip",
+            "2001:db8::/32": "net6",
+            "fw-*-bad": "x",
+            "300.0.0.0/8": "x",
+        }
+    )
+    assert index.rules == 9
+    assert index.lookup("fw-madrid-01") == "exact"
+    assert index.lookup("fw-madrid-02") == "longer-prefix"
+    assert index.lookup("fw-bcn") == "prefix"
+    assert index.lookup("ap1.acme.local") == "suffix"
+    assert index.lookup("ap1.eu.acme.local") == "longer-suffix"
+    assert index.lookup("10.1.2.3") == "net8"
+    assert index.lookup("10.20.1.1") == "net16"
+    assert index.lookup("10.20.30.40") == "exact-ip"
+    assert index.lookup("2001:db8::1") == "net6"
+    assert index.lookup("11.0.0.1") is None
+    assert index.lookup("fw-x-bad") == "prefix"
+    assert index.lookup("other") is None
+
+
+def _naive(rules, host):
+    if host in rules:
+        return rules[host]
+    try:
+        ip = ipaddress.ip_address(host)
+    except ValueError:
+        ip = None
+    best = None
+    if ip is not None:
+        for pattern, tenant in rules.items():
+            if "/" in pattern:
+                net = ipaddress.ip_network(pattern)
+                if ip.version == net.version and ip in net:
+                    if best is None or net.prefixlen > best[0]:
+                        best = (net.prefixlen, tenant)
+        if best:
+            return best[1]
+    for pattern, tenant in rules.items():
+        if pattern.endswith("*") and host.startswith(pattern[:-1]):
+            if best is None or len(pattern) > best[0]:
+                best = (len(pattern), tenant)
+    for pattern, tenant in rules.items():
+        if pattern.startswith("*") and host.endswith(pattern[1:]):
+            if best is None or len(pattern) > best[0]:
+                best = (len(pattern), tenant)
+    return best[1] if best else None
+
+
+def test_index_matches_linear_scan_with_thousands_of_rules():
+    r = random.Random(3)
+    rules = {}
+    for i in range(3000):
+        kind = i % 4
+        if kind == 0:
+            rules[f"fw-{r.randrange(500)}-{r.randrange(50)}"] = f"t{i}"
+        elif kind == 1:
+            rules[f"fw-{r.randrange(500)}-*"] = f"t{i}"
+        elif kind == 2:
+            rules[f"*.site{r.randrange(500)}.acme.local"] = f"t{i}"
+        else:
+            plen = r.choice((8, 16, 24))
+            net = ipaddress.ip_network(f"10.{r.randrange(256)}.{r.randrange(256)}.0/{plen}", False)
+            rules[str(net)] = f"t{i}"
+    index = HostTenantIndex(rules)
+    hosts = [f"fw-{r.randrange(600)}-{r.randrange(60)}" for _ in range(500)]
+    hosts += [f"ap.site{r.randrange(600)}.acme.local" for _ in range(500)]
+    hosts += [f"10.{r.randrange(256)}.{r.randrange(256)}.{r.randrange(256)}" for _ in range(500)]
+    for host in hosts:
+        assert index.lookup(host) == _naive(rules, host), host
+
+
+def test_resolve_normalizes_host_once_and_caches(tmp_path):
+    path = tmp_path / "map.json"
+    _write(path, {"Delaware Hotel": "delaware"})
+    mapper = HostTenantMapper(path, reload_seconds=0, cache_size=2)
+    assert mapper.resolve("  DELAWARE hotel ") == "delaware"
+    assert mapper.resolve("unknown") is None
+    assert mapper.resolve("") is None
+    assert mapper.resolve("a") is None
+    assert len(mapper._state[1]) == 2
+
+
+def test_hot_reload_on_mtime_change(tmp_path):
+    path = tmp_path / "map.json"
+    _write(path, {"fw-1": "acme"}, mtime=1000)
+    mapper = HostTenantMapper(path, reload_seconds=0.01)
+    assert mapper.resolve("fw-2") is None
+
+    _write(path, {"fw-1": "acme", "fw-*": "globex"}, mtime=2000)
+    mapper._next_check = 0
+    assert mapper.resolve("fw-2") == "globex"
+    assert mapper.resolve("fw-1") == "acme"
+
+    # Fichero inválido: se mantiene el mapa anterior
+    path.write_text("{not json", encoding="utf-8")
+    os.utime(path, (3000, 3000))
+    mapper._next_check = 0
+    assert mapper.resolve("fw-2") == "globex"
+
+    path.unlink()
+    mapper._next_check = 0
+    assert mapper.resolve("fw-2") is None
+
+
+def test_consumer_maps_default_tenant_by_host(tmp_path, monkeypatch):
+    path = tmp_path / "map.json"
+    _write(path, {"*.acme.local": "acme"})
+    mapper = HostTenantMapper(path, reload_seconds=0)
+    monkeypatch.setattr(consumer, "get_host_mapper", lambda: mapper)
+    evt = {"tenant_id": "default", "host": "FW1.acme.local"}
+    consumer._apply_host_mapping(evt)
+    assert evt["tenant_id"] == "acme"
+    evt = {"tenant_id": "other", "host": "fw1.acme.local"}
+    consumer._apply_host_mapping(evt)
+    assert evt["tenant_id"] == "other"
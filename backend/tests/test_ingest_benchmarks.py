@@ -0,0 +1,57 @@
+import json
+from collections import Counter
+
+from backend.app.processing.normalizer import normalize
+from scripts.benchmarks.corpus import KINDS, build_bodies, build_messages
+from scripts.benchmarks.ingest_suite import compare, run_suite
+
+
+def test_corpus_is_deterministic_and_follows_distribution():
+    assert build_bodies(200, seed=7) == build_bodies(200, seed=7)
+    assert build_bodies(200, seed=7) != build_bodies(200, seed=8)
+    messages = build_messages(4000)
+    counts = Counter(kind for kind, _ in messages)
+    for kind, weight in KINDS:
+        assert abs(counts[kind] / len(messages) - weight) < 0.03, kind
+    traffic = [len(m) for kind, m in messages if kind == "forti_traffic"]
+    assert 600 <= min(traffic) and max(traffic) <= 1500
+
+
+def test_corpus_events_normalize():
+    kinds = [kind for kind, _ in build_messages(300)]
+    for kind, body in zip(kinds, build_bodies(300)):
+        evt = normalize(json.loads(body))
+        assert evt["tenant_id"] and evt["message"]
+        if kind.startswith("forti_"):
+            assert evt["original"]["raw_kv"]["devname"].startswith("FGT-")
+
+
+def test_run_suite_reports_every_stage():
+    out = run_suite(50, rounds=1)
+    assert out["meta"]["events"] == 50
+    assert list(out["stages"]) == [
+        "parse_kv",
+        "tokenize",
+        "normalize",
+        "normalize_severity",
+        "prepare_event",
+        "validate_draft7",
+        "validate_compiled",
+        "bulk_build",
+    ]
+    for result in out["stages"].values():
+        assert result["eps"] > 0 and result["alloc_bytes_per_event"] >= 0
+    assert list(run_suite(20, rounds=1, only=["normalize"])["stages"]) == ["normalize"]
+
+
+def test_compare_flags_throughput_and_allocation_regressions():
+    def result(eps, size):
+        return {"eps": eps, "alloc_bytes_per_event": size}
+
+    base = {"stages": {"a": result(1000, 100), "b": result(1000, 100), "c": result(1000, 0)}}
+    new = {"stages": {"a": result(850, 100), "b": result(1000, 130), "c": result(950, 10)}}
+    out = compare(base, new, max_regression=0.1)
+    assert out["regressions"] == ["a", "b"]
+    assert out["stages"]["a"]["eps_change_pct"] == -15.0
+    assert out["stages"]["b"]["alloc_bytes_change_pct"] == 30.0
+    assert compare(base, new, max_regression=0.5)["regressions"] == []
@@ -0,0 +1,127 @@
+import json
+import uuid
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from pathlib import Path
+
+import pytest
+from opensearchpy.exceptions import SerializationError
+from opensearchpy.serializer import JSONSerializer
+
+from backend.app.core import json_codec
+from backend.app.core.opensearch_client import CodecJSONSerializer, client_serializer
+from backend.app.processing.bulk_indexer import NdjsonEncoder
+from backend.app.processing.normalizer import normalize
+
+FIXTURE = Path(__file__).parent / "fixtures" / "fortigate_kv.log"
+
+requires_orjson = pytest.mark.skipif(json_codec.orjson is None, reason="orjson no instalado")
+
+
+def _events():
+    out = []
+    for line in FIXTURE.read_text(encoding="utf-8").splitlines():
+        out.append(normalize({"message": line, "host": "fw01", "tenant_id": "acme"}))
+    out.append({"msg": "ñandú €  ", "n": [1, 2.5, None, True], "nested": {"a": {"b": -3}}})
+    return out
+
+
+def _fast():
+    return json_codec.build_codec("orjson")
+
+
+def test_stdlib_codec_keeps_previous_output():
+    evt = {"a": 1, "b": "ñ", "when": datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc)}
+    assert json_codec.STDLIB.dumps(evt) == json.dumps(
+        evt, separators=(",", ":"), default=str
+    ).encode("utf-8")
+    assert json_codec.STDLIB.loads(memoryview(b'{"a":1}')) == {"a": 1}
+
+
+@requires_orjson
+def test_orjson_backend_roundtrips_like_stdlib():
+    fast = _fast()
+    assert fast.name == "orjson"
+    for evt in _events():
+        encoded = fast.dumps(evt)
+        assert isinstance(encoded, bytes)
+        assert fast.loads(encoded) == json.loads(json_codec.STDLIB.dumps(evt)) == evt
+        assert fast.loads(encoded.decode("utf-8")) == evt
+
+
+@requires_orjson
+def test_orjson_non_json_types_match_stdlib_default_str():
+    fast = _fast()
+    obj = {
+        "when": datetime(2025, 1, 2, 3, 4, 5, 123000, tzinfo=timezone.utc),
+        "day": date(2025, 1, 2),
+        "id": uuid.UUID(int=7),
+        "price": Decimal("1.50"),
+        1: "int key",
+    }
+    assert fast.dumps(obj) == json_codec.STDLIB.dumps(obj)
+
+
+@requires_orjson
+def test_orjson_edge_cases_fall_back_to_stdlib():
+    fast = _fast()
+    big = {"n": 2**70}
+    assert fast.dumps(big) == json_codec.STDLIB.dumps(big)
+    assert fast.dumps({"s": "\ud800"}) == json_codec.STDLIB.dumps({"s": "\ud800"})
+    nan = fast.loads(b'{"x": NaN}')["x"]
+    assert nan != nan
+    with pytest.raises(ValueError):
+        fast.loads(b"{not json")
+    cyclic: dict = {}
+    cyclic["self"] = cyclic
+    with pytest.raises(ValueError):
+        fast.dumps(cyclic)
+
+
+@requires_orjson
+def test_bulk_action_bytes_identical_across_backends(monkeypatch):
+    from backend.app.processing import bulk_indexer
+
+    evt = _events()[0]
+    fast = bulk_indexer.NdjsonEncoder().encode("logs-acme", evt, "p", doc_id="abc")
+    monkeypatch.setattr(bulk_indexer, "_dumps", json_codec.STDLIB.dumps)
+    slow = NdjsonEncoder().encode("logs-acme", evt, "p", doc_id="abc")
+    header, doc = fast.split(b"\n")[:2]
+    assert header == slow.split(b"\n")[0]
+    assert json.loads(doc) == json.loads(slow.split(b"\n")[1]) == evt
+
+
+def test_missing_orjson_falls_back_to_stdlib(monkeypatch):
+    monkeypatch.setattr(json_codec, "orjson", None)
+    assert json_codec.build_codec("auto") is json_codec.STDLIB
+    assert json_codec.build_codec("orjson") is json_codec.STDLIB
+
+
+def test_unknown_codec_name_rejected():
+    with pytest.raises(ValueError):
+        json_codec.build_codec("ujson")
+
+
+@requires_orjson
+def test_opensearch_serializer_matches_client_default(monkeypatch):
+    ser = CodecJSONSerializer()
+    ref = JSONSerializer()
+    body = {
+        "query": {"range": {"@timestamp": {"gte": datetime(2025, 1, 2, tzinfo=timezone.utc)}}},
+        "d": date(2025, 1, 2),
+        "naive": datetime(2025, 1, 2, 3, 4, 5, 6),
+        "id": uuid.UUID(int=7),
+        "price": Decimal("1.5"),
+        "big": 2**70,
+        "txt": "ñ",
+    }
+    assert ser.dumps(body) == ref.dumps(body)
+    assert ser.dumps('{"raw":1}') == '{"raw":1}'
+    assert ser.loads(b'{"took":3,"errors":false}') == {"took": 3, "errors": False}
+    with pytest.raises(SerializationError):
+        ser.loads("{not json")
+    with pytest.raises(SerializationError):
+        ser.dumps({"x": object()})
+
+    monkeypatch.setattr(json_codec, "BACKEND", "stdlib")
+    assert client_serializer() is None
@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from backend.app.processing import normalizer
+from backend.app.processing.normalizer import normalize, parse_kv, strip_pri, tokenize
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "fortigate_kv.log")
+
+
+def _reference(msg):
+    cleaned = strip_pri(msg).strip()
+    return cleaned, parse_kv(cleaned)
+
+
+def _fixture_lines():
+    with open(FIXTURE, "r", encoding="utf-8") as f:
+        return [line.rstrip("\n") for line in f]
+
+
+def _corpus():
+    # Casos con saltos de línea y espacios que no caben en un fichero de una línea por evento
+    return _fixture_lines() + [
+        '<189>devname=A msg="dos\nlineas" b=1',
+        'devname=A msg="cierra\n" b="x"',
+        "<13>\n\tdevname=A\r\nb=2\x0bc=3\x1cd=4 e=5 ",
+        "<1>",
+        "",
+        "   ",
+    ]
+
+
+@pytest.mark.parametrize("msg", _corpus())
+def test_tokenize_matches_regex_parser(msg):
+    assert tokenize(msg) == _reference(msg)
+
+
+def test_tokenize_golden_values():
+    lines = _fixture_lines()
+    cleaned, kv = tokenize(lines[0])
+    assert cleaned.startswith("date=2025-11-21 ")
+    assert kv["devname"] == "DelawareHotel"
+    assert kv["policyname"] == "LAN to WAN"
+    assert kv["dstcountry"] == "United States"
+    assert kv["srcserver"] == "0"
+    assert len(kv) == 48
+
+    _, kv = tokenize(lines[4])
+    assert kv["devname"] == "Hotel Ñandú"
+    assert kv["url"] == "http://example.com/descarga?id=1&name=a=b"
+    assert kv["agent"] == "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
+
+    _, kv = tokenize(lines[5])
+    assert kv["msg"] == ""
+    assert "empty" not in kv
+
+
+@pytest.mark.parametrize("msg", _fixture_lines())
+def test_normalize_uses_tokenizer(msg, monkeypatch):
+    calls = []
+    original = normalizer.tokenize
+    monkeypatch.setattr(normalizer, "tokenize", lambda s: calls.append(s) or original(s))
+    out = normalize({"message": msg}, registry=normalizer.build_parser_registry())
+    assert calls and out["original"]["raw_kv"] == tokenize(msg)[1]
+
+
+def test_normalize_pps_from_tokenized_message():
+    line = _fixture_lines()[2]
+    out = normalize({"message": line})
+    assert out["flow"]["packets_per_second"] == 48211
+    assert out["threat"]["name"] == "tcp_syn_flood"
+    assert out["original"]["raw_kv"] == _reference(line)[1]
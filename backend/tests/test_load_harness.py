@@ -0,0 +1,71 @@
+import time
+
+import pytest
+
+from backend.app.processing import consumer
+from scripts.integration.load_harness import FakeChannel, OpenSearchStub, run_load
+
+
+@pytest.fixture
+def stub():
+    server = OpenSearchStub(item_error_rate=0.05, permanent_error_rate=0.05, seed=1).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(autouse=True)
+def _consumer_config(monkeypatch):
+    monkeypatch.setattr(consumer, "is_valid_tenant", lambda t: True)
+    monkeypatch.setattr(consumer, "_normalize_severity", lambda evt: evt.update(severity="low"))
+    monkeypatch.setattr(consumer, "bulk_indexer", None)
+    monkeypatch.setattr(consumer, "BULK_RETRY_BACKOFF_MS", 1)
+
+
+def test_fake_channel_respects_prefetch_and_measures_acks():
+    delivered = []
+    channel = FakeChannel([b"a", b"b"], events=5)
+    channel.basic_qos(prefetch_count=3)
+    channel.basic_consume("q", lambda ch, method, props, body: delivered.append(body))
+    channel.deliver_ready(time.perf_counter())
+    assert delivered == [b"a", b"b", b"a"]
+    channel.basic_ack(2, multiple=True)
+    channel.deliver_ready(time.perf_counter())
+    assert len(delivered) == 5 and channel.acked == 2
+    channel.basic_nack(5, requeue=False)
+    channel.basic_ack(4, multiple=True)
+    assert channel.done and (channel.acked, channel.nacked) == (4, 1)
+    assert len(channel.ack_latencies) == 5
+
+
+def test_paced_delivery_waits_for_schedule():
+    channel = FakeChannel([b"x"], events=3, rate=10)
+    channel.basic_consume("q", lambda ch, method, props, body: None)
+    now = time.perf_counter()
+    next_due = channel.deliver_ready(now)
+    assert channel.unsettled == 3 and next_due == pytest.approx(now + 0.1)
+
+
+def test_unitary_path_against_stub(monkeypatch):
+    # Sin errores: index_event reintenta con esperas de 0,5 s
+    stub = OpenSearchStub(latency_ms=1).start()
+    monkeypatch.setattr(consumer, "USE_BULK", False)
+    try:
+        out = run_load(stub, 200, corpus_size=50)
+    finally:
+        stub.stop()
+    assert out["unsettled"] == 0 and not out["timed_out"]
+    assert out["acked"] == stub.stats["indexed"] == 200
+    assert stub.stats["doc_requests"] == 200 and out["consumer"]["bulk"] is False
+    assert out["ack_latency_ms"]["p50"] > 0
+
+
+def test_bulk_deferred_ack_against_stub(stub, monkeypatch):
+    monkeypatch.setattr(consumer, "USE_BULK", True)
+    monkeypatch.setattr(consumer, "BULK_DEFERRED_ACK", True)
+    monkeypatch.setattr(consumer, "BULK_MAX_ITEMS", 50)
+    out = run_load(stub, 500, corpus_size=100)
+    assert out["unsettled"] == 0
+    assert out["acked"] == stub.stats["indexed"]
+    assert out["nacked"] == stub.stats["item_errors_400"] > 0
+    assert stub.stats["item_errors_429"] > 0 and stub.stats["bulk_requests"] >= 10
+    assert out["prefetch"] >= 50
@@ -0,0 +1,190 @@
+import json
+
+import pytest
+from jsonschema import Draft7Validator
+
+from backend.app.processing.consumer import _normalize_severity
+from backend.app.processing.log_formats import (
+    FormatParser,
+    ParsedLog,
+    ParserRegistry,
+    build_registry,
+    parse_envelope,
+)
+from backend.app.processing.normalizer import build_parser_registry, normalize
+from backend.app.processing.utils import prepare_event
+
+with open("backend/app/schema/ncs_v1.0.0.json", "r", encoding="utf-8") as f:
+    VALIDATOR = Draft7Validator(json.load(f))
+
+RFC5424_FORTINET = (
+    '<189>1 2025-11-21T07:29:29+01:00 FGT-HQ - - - [meta sequenceId="42" note="a\\"b\\]c"] '
+    'devname="FGT-HQ" srcip=10.0.0.1 dstip=8.8.8.8 dstport=53 msg="dns query" level=warning'
+)
+CEF = (
+    "<134>Nov 21 07:29:29 fw01 CEF:0|Check Point|VPN-1 \\| FireWall-1|R81|100|Drop|7|"
+    "src=10.0.0.1 dst=203.0.113.9 spt=51234 dpt=443 proto=TCP act=drop "
+    "msg=blocked a\\=b by policy rt=1763706569000 dvchost=cp-gw suser=alice"
+)
+LEEF1 = (
+    "LEEF:1.0|Microsoft|MSExchange|2016|15345|src=10.50.1.1\tdst=2.10.20.20\t"
+    "srcPort=1234\tdstPort=25\tsev=5\tusrName=bob\tdevTime=1763706569000"
+)
+LEEF2 = "LEEF:2.0|Lancope|StealthWatch|1.0|41|^|src=192.0.2.1^dst=172.50.123.1^sev=9^cat=Alarm"
+JSON_NATIVE = json.dumps(
+    {
+        "@timestamp": "2025-11-21T07:29:29Z",
+        "host": {"name": "app01"},
+        "message": "login failed",
+        "level": "WARNING",
+        "src_ip": "10.1.1.1",
+        "src_port": "5555",
+        "user": {"name": "carol"},
+        "labels": {"env": "prod"},
+    }
+)
+
+
+def _ncs(raw):
+    # Mismo orden que process_message: normalize -> severidad NCS -> prepare_event
+    evt = normalize(raw, registry=build_parser_registry(cache_size=0))
+    _normalize_severity(evt)
+    evt = prepare_event(evt)
+    errors = [e.message for e in VALIDATOR.iter_errors(evt)]
+    assert not errors, errors
+    return evt
+
+
+def test_rfc5424_envelope_with_fortinet_body():
+    env = parse_envelope(RFC5424_FORTINET)
+    assert env.pri == 189
+    assert env.fields["host"] == "FGT-HQ"
+    assert env.structured_data == {"meta": {"sequenceId": "42", "note": 'a"b]c'}}
+    assert env.payload.startswith('devname="FGT-HQ"')
+
+    evt = _ncs({"message": RFC5424_FORTINET})
+    assert evt["original"]["format"] == "fortinet_kv"
+    assert evt["@timestamp"] == "2025-11-21T07:29:29+01:00"
+    assert evt["host"] == "FGT-HQ"
+    assert evt["destination"] == {"ip": "8.8.8.8", "port": 53}
+    assert evt["message"] == "dns query"
+    assert evt["severity"] == "medium"
+    assert evt["original"]["structured_data"]["meta"]["sequenceId"] == "42"
+
+
+def test_rfc5424_plain_text_uses_header_fields():
+    evt = _ncs({"message": "<11>1 2025-11-21T07:00:00Z web01 nginx 812 - - upstream timed out"})
+    assert evt["message"] == "upstream timed out"
+    assert evt["host"] == "web01"
+    assert evt["severity"] == "high"
+    assert evt["process"] == {"name": "nginx", "pid": "812"}
+    assert evt["@timestamp"] == "2025-11-21T07:00:00Z"
+
+
+def test_cef_over_rfc3164():
+    evt = _ncs({"message": CEF})
+    assert evt["original"]["format"] == "cef"
+    assert evt["dataset"] == "syslog.cef"
+    assert evt["observer"]["product"] == "VPN-1 | FireWall-1"
+    assert evt["source"] == {"ip": "10.0.0.1", "port": 51234}
+    assert evt["destination"] == {"ip": "203.0.113.9", "port": 443}
+    assert evt["network"]["protocol"] == "tcp"
+    assert evt["message"] == "blocked a=b by policy"
+    assert evt["severity"] == "high"
+    assert evt["host"] == "cp-gw"
+    assert evt["user"]["name"] == "alice"
+    assert evt["event"] == {"action": "drop", "id": "100"}
+    assert evt["@timestamp"].startswith("2025-11-21T06:29:29")
+
+
+def test_leef_v1_and_v2():
+    evt = _ncs({"message": LEEF1})
+    assert evt["original"]["format"] == "leef"
+    assert evt["source"] == {"ip": "10.50.1.1", "port": 1234}
+    assert evt["destination"]["port"] == 25
+    assert evt["severity"] == "medium"
+    assert evt["user"]["name"] == "bob"
+    assert evt["message"] == "15345"
+
+    evt = _ncs({"message": "<14>" + LEEF2})
+    assert evt["destination"]["ip"] == "172.50.123.1"
+    assert evt["severity"] == "critical"
+    assert evt["category"] == "Alarm"
+
+
+def test_json_native():
+    evt = _ncs({"message": JSON_NATIVE})
+    assert evt["original"]["format"] == "json"
+    assert evt["host"] == "app01"
+    assert evt["message"] == "login failed"
+    assert evt["severity"] == "medium"
+    assert evt["source"] == {"ip": "10.1.1.1", "port": 5555}
+    assert evt["labels"] == {"env": "prod"}
+    assert evt["@timestamp"] == "2025-11-21T07:29:29Z"
+
+
+def test_invalid_json_falls_back_to_kv():
+    evt = _ncs({"message": '{"broken": devname=H msg=x}'})
+    assert evt["original"]["format"] == "fortinet_kv"
+    assert evt["host"] == "H"
+
+
+def _counting_registry(calls):
+    def sniff(name, marker):
+        def f(payload):
+            calls.append(name)
+            return payload.startswith(marker)
+
+        return f
+
+    default = FormatParser("kv", lambda p: True, lambda p: ParsedLog({}, {"message": p}))
+    registry = ParserRegistry(default, cache_size=2)
+    registry.register(
+        FormatParser("cef", sniff("cef", "CEF:"), lambda p: ParsedLog({}, {}), ("CEF:",))
+    )
+    registry.register(
+        FormatParser(
+            "json",
+            sniff("json", "{"),
+            lambda p: ParsedLog({}, {}) if p.endswith("}") else None,
+            ("{",),
+        )
+    )
+    return registry
+
+
+def test_format_cached_per_host():
+    calls = []
+    registry = _counting_registry(calls)
+    for _ in range(3):
+        assert registry.parse("a=b", "fw01")[0] == "kv"
+    assert calls == ["cef", "json"]
+
+    # Un host cacheado con el formato por defecto que pasa a enviar CEF se redetecta
+    assert registry.parse("CEF:0|x", "fw01")[0] == "cef"
+    # Si el parser cacheado rechaza el mensaje también se redetecta
+    calls.clear()
+    assert registry.parse("{}", "app")[0] == "json"
+    assert registry.parse("{not-json", "app")[0] == "kv"
+
+    # Sin host no se cachea
+    calls.clear()
+    registry.parse("a=b")
+    registry.parse("a=b")
+    assert calls == ["cef", "json", "cef", "json"]
+
+
+def test_cache_is_bounded_lru():
+    registry = _counting_registry([])
+    for host in ("a", "b", "c"):
+        registry.parse("x=1", host)
+    assert list(registry._cache) == ["b", "c"]
+    registry.invalidate("b")
+    assert list(registry._cache) == ["c"]
+
+
+def test_registry_rejects_duplicate_format():
+    registry = build_registry(FormatParser("kv", lambda p: True, lambda p: None))
+    assert registry.formats == ["json", "cef", "leef", "kv"]
+    with pytest.raises(ValueError):
+        registry.register(FormatParser("cef", lambda p: True, lambda p: None))
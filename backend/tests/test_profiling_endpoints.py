@@ -0,0 +1,121 @@
+import marshal
+import threading
+import time
+import urllib.request
+from wsgiref.util import setup_testing_defaults
+
+import pytest
+
+from backend.app.metrics.profiling import (
+    CooperativeProfiler,
+    ProfilingApp,
+    start_metrics_server,
+)
+
+TOKEN = "s3cret"
+
+
+def _get(app, path, query="", token=TOKEN):
+    environ = {"PATH_INFO": path, "QUERY_STRING": query}
+    if token:
+        environ["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+    setup_testing_defaults(environ)
+    status = []
+    body = b"".join(app(environ, lambda s, headers: status.append(s)))
+    return int(status[0].split()[0]), body
+
+
+def busy_consumer_loop(stop, profiler):
+    while not stop.is_set():
+        profiler.poll()
+        sum(i * i for i in range(2000))
+
+
+@pytest.fixture
+def worker():
+    stop = threading.Event()
+    profiler = CooperativeProfiler()
+    thread = threading.Thread(target=busy_consumer_loop, args=(stop, profiler), name="consumer")
+    thread.start()
+    yield profiler
+    stop.set()
+    thread.join()
+
+
+def test_disabled_without_token_and_metrics_still_served():
+    app = ProfilingApp(token="")
+    assert _get(app, "/debug/profile/sample", "seconds=0.1")[0] == 404
+    status, body = _get(app, "/metrics", token=None)
+    assert status == 200 and b"# HELP" in body
+
+
+def test_token_required_and_params_validated():
+    app = ProfilingApp(token=TOKEN, max_seconds=5)
+    assert _get(app, "/debug/profile/sample", "seconds=0.1", token=None)[0] == 403
+    assert _get(app, "/debug/profile/sample", "seconds=0.1", token="wrong")[0] == 403
+    assert _get(app, "/debug/profile/sample", "seconds=60")[0] == 400
+    assert _get(app, "/debug/profile/sample", "seconds=abc")[0] == 400
+    assert _get(app, "/debug/profile/cprofile", "seconds=0.1&sort=bogus")[0] == 400
+    assert _get(app, "/debug/profile/unknown")[0] == 404
+    app._busy.acquire()
+    try:
+        assert _get(app, "/debug/profile/sample", "seconds=0.1")[0] == 409
+    finally:
+        app._busy.release()
+
+
+def test_sample_returns_collapsed_stacks(worker):
+    app = ProfilingApp(token=TOKEN)
+    status, body = _get(app, "/debug/profile/sample", "seconds=0.3&interval_ms=5")
+    assert status == 200
+    lines = body.decode().splitlines()
+    consumer = [line for line in lines if line.startswith("consumer;")]
+    assert consumer and all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert any("busy_consumer_loop (test_profiling_endpoints.py" in line for line in consumer)
+
+
+def test_cprofile_runs_in_polling_thread(worker):
+    app = ProfilingApp(token=TOKEN, profiler=worker)
+    status, body = _get(app, "/debug/profile/cprofile", "seconds=0.2&sort=tottime&limit=10")
+    assert status == 200 and b"<genexpr>" in body
+    status, body = _get(app, "/debug/profile/cprofile", "seconds=0.1&format=pstats")
+    stats = marshal.loads(body)
+    assert any(func[2] == "<genexpr>" for func in stats)
+
+
+def test_cprofile_times_out_without_poll():
+    app = ProfilingApp(token=TOKEN, profiler=CooperativeProfiler())
+    app.profiler.request = lambda seconds, timeout: None
+    assert _get(app, "/debug/profile/cprofile", "seconds=0.1")[0] == 503
+
+
+def test_tracemalloc_reports_live_allocations():
+    app = ProfilingApp(token=TOKEN)
+    kept = []
+
+    def allocate():
+        time.sleep(0.05)
+        kept.extend(bytearray(1024) for _ in range(500))
+
+    thread = threading.Thread(target=allocate)
+    thread.start()
+    status, body = _get(app, "/debug/profile/tracemalloc", "seconds=0.3&top=5")
+    thread.join()
+    assert status == 200
+    assert b"test_profiling_endpoints.py" in body
+
+
+def test_metrics_server_serves_http():
+    server = start_metrics_server(0, "127.0.0.1", ProfilingApp(token=TOKEN))
+    try:
+        url = f"http://127.0.0.1:{server.server_port}"
+        with urllib.request.urlopen(f"{url}/metrics") as resp:
+            assert resp.status == 200
+        req = urllib.request.Request(
+            f"{url}/debug/profile/sample?seconds=0.05", headers={"X-Profiling-Token": TOKEN}
+        )
+        with urllib.request.urlopen(req) as resp:
+            assert resp.status == 200
+    finally:
+        server.shutdown()
+        server.server_close()
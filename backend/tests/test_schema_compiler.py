@@ -0,0 +1,84 @@
+import json
+import os
+
+import pytest
+from jsonschema import Draft7Validator
+
+from backend.app.processing.schema_compiler import (
+    CompiledValidator,
+    UnsupportedSchema,
+    compile_schema,
+)
+from scripts.benchmarks.bench_schema_validation import build_corpus
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "..", "app", "schema", "ncs_v1.0.0.json")
+
+
+def test_ncs_verdicts_match_draft7():
+    with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
+        schema = json.load(f)
+    generic = Draft7Validator(schema)
+    compiled = CompiledValidator(schema)
+    corpus = build_corpus(2000)
+    assert any(not generic.is_valid(e) for e in corpus)
+    for evt in corpus:
+        assert compiled.is_valid(evt) == generic.is_valid(evt), evt
+        assert bool(list(compiled.iter_errors(evt))) == (not generic.is_valid(evt))
+
+
+@pytest.mark.parametrize(
+    "instance",
+    [
+        {"n": 3, "tags": ["a"], "flag": True, "kind": "x"},
+        {"n": 3.0, "tags": [], "kind": "x"},
+        {"n": 0},
+        {"n": 11},
+        {"n": True},
+        {"n": 5, "tags": ["a", 1]},
+        {"n": 5, "tags": ["a"] * 4},
+        {"n": 5, "kind": "xyz"},
+        {"n": 5, "extra": 1},
+        {"n": 5, "flag": 1},
+        {"n": 5, "code": "AB12"},
+        {"n": 5, "code": "ab12"},
+        {"n": 5, "mode": 1},
+        {"n": 5, "mode": True},
+        [],
+    ],
+)
+def test_generic_keywords_match_draft7(instance):
+    schema = {
+        "type": "object",
+        "required": ["n"],
+        "properties": {
+            "n": {"type": "integer", "minimum": 1, "exclusiveMaximum": 10},
+            "tags": {"type": "array", "items": {"type": "string"}, "maxItems": 3},
+            "flag": {"type": "boolean"},
+            "kind": {"type": "string", "maxLength": 2},
+            "code": {"type": "string", "pattern": "^[A-Z]{2}[0-9]+$"},
+            "mode": {"enum": [1, "a", None]},
+        },
+        "additionalProperties": False,
+    }
+    assert compile_schema(schema)(instance) == Draft7Validator(schema).is_valid(instance)
+
+
+def test_unsupported_keywords_are_rejected():
+    with pytest.raises(UnsupportedSchema):
+        compile_schema({"anyOf": [{"type": "string"}]})
+
+
+def test_invalid_event_runs_compiled_check_once(monkeypatch):
+    from backend.app.processing import consumer
+
+    with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
+        validator = CompiledValidator(json.load(f))
+    calls = []
+    compiled = validator._is_valid
+    validator._is_valid = lambda instance: calls.append(1) or compiled(instance)
+    monkeypatch.setattr(consumer, "is_valid_tenant", lambda t: True)
+    evt = {"tenant_id": "default", "message": "hi", "@timestamp": "2024-01-01T00:00:00Z"}
+    evt["severity"] = "not-a-severity"
+    with pytest.raises(consumer.EventRejected) as rejected:
+        consumer.process_message(json.dumps(evt).encode(), {"1.0.0": validator})
+    assert rejected.value.reason == "validation_failed" and len(calls) == 1
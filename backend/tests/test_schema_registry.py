@@ -0,0 +1,63 @@
+import json
+import os
+
+import pytest
+
+from backend.app.processing import consumer
+from backend.app.processing.schema_registry import SchemaRegistry
+
+V1 = {"type": "object", "required": ["message"], "properties": {"message": {"type": "string"}}}
+V2 = {"type": "object", "required": ["message", "category"]}
+
+
+def _write(path, obj):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+
+
+def test_discovers_versions_and_routes_by_schema_version(tmp_path):
+    _write(tmp_path / "ncs_v1.0.0.json", V1)
+    _write(tmp_path / "ncs_v2.0.0.json", V2)
+    _write(tmp_path / "ncs_schema_registry.json", V1)  # copia para registry externo: se ignora
+    reg = SchemaRegistry(str(tmp_path), reload_seconds=0)
+    reg.load()
+    assert reg.versions() == ["1.0.0", "2.0.0"]
+    assert reg.get("1.0.0").is_valid({"message": "x"})
+    assert not reg.get("2.0.0").is_valid({"message": "x"})
+    assert reg.get("3.0.0") is None
+
+
+def test_registry_file_versions_map_and_hot_reload(tmp_path):
+    _write(tmp_path / "v1.json", V1)
+    _write(tmp_path / "ncs_schema_registry.json", {"versions": {"1.0.0": "v1.json"}})
+    reg = SchemaRegistry(str(tmp_path), reload_seconds=0.01)
+    reg.load()
+    assert reg.versions() == ["1.0.0"]
+
+    _write(tmp_path / "v2.json", V2)
+    _write(
+        tmp_path / "ncs_schema_registry.json", {"versions": {"1.0.0": "v1.json", "2": "v2.json"}}
+    )
+    os.utime(tmp_path / "ncs_schema_registry.json", (1, 1))
+    reg._next_check = 0
+    assert reg.get("2") is not None
+
+
+def test_fallback_schema_applies_to_any_version(tmp_path):
+    fallback = tmp_path / "custom.json"
+    _write(fallback, V1)
+    reg = SchemaRegistry(str(tmp_path), fallback_path=str(fallback), reload_seconds=0)
+    reg.load()
+    assert reg.get("whatever") is not None
+
+
+def test_process_message_rejects_unknown_schema_version(tmp_path, monkeypatch):
+    _write(tmp_path / "ncs_v1.0.0.json", V1)
+    reg = SchemaRegistry(str(tmp_path), reload_seconds=0)
+    reg.load()
+    monkeypatch.setattr(consumer, "is_valid_tenant", lambda t: True)
+    evt = {"tenant_id": "default", "message": "hi", "@timestamp": "2024-01-01T00:00:00Z"}
+    assert consumer.process_message(json.dumps(evt).encode(), reg)["schema_version"] == "1.0.0"
+    with pytest.raises(consumer.EventRejected) as exc:
+        consumer.process_message(json.dumps({**evt, "schema_version": "9.9.9"}).encode(), reg)
+    assert exc.value.reason == "unknown_schema_version"
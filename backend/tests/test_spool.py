@@ -0,0 +1,141 @@
+import os
+
+import pytest
+
+from backend.app.processing.bulk_indexer import BulkIndexer
+from backend.app.processing.spool import DiskSpool, SpoolReplayer
+
+
+class OutageClient:
+    """Cluster caído hasta que el test pone `up = True`."""
+
+    def __init__(self):
+        self.up = False
+        self.bodies = []
+
+    def ping(self):
+        return self.up
+
+    def bulk(self, body, refresh=False):
+        if not self.up:
+            raise ConnectionError("down")
+        self.bodies.append(body)
+        return {"errors": False, "items": []}
+
+
+def test_spool_roundtrip_across_segments_and_reopen(tmp_path):
+    spool = DiskSpool(str(tmp_path), segment_max_bytes=40, fsync=False)
+    assert spool.append_many([b"a" * 10, b"b" * 10])
+    assert spool.append_many([b"c" * 10])  # no cabe en el segmento: rota
+    spool.close()
+
+    spool = DiskSpool(str(tmp_path), segment_max_bytes=40, fsync=False)
+    records = []
+    while True:
+        seq = spool.oldest()
+        if seq is None:
+            break
+        records.extend(payload for _, payload in spool.read(seq))
+        spool.remove(seq)
+    assert records == [b"a" * 10, b"b" * 10, b"c" * 10]
+    assert spool.empty() and spool.size_bytes == 0
+    spool.close()
+
+
+def test_spool_rejects_when_full_and_locks_directory(tmp_path):
+    spool = DiskSpool(str(tmp_path), max_bytes=30, fsync=False)
+    assert spool.append_many([b"x" * 10])
+    assert not spool.append_many([b"y" * 10])
+    with pytest.raises(RuntimeError):
+        DiskSpool(str(tmp_path))
+    spool.close()
+
+
+def test_spool_stops_at_truncated_record(tmp_path):
+    spool = DiskSpool(str(tmp_path), fsync=False)
+    spool.append_many([b"ok", b"torn"])
+    seq = spool.oldest()
+    path = os.path.join(str(tmp_path), f"{seq:012d}.seg")
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 2)
+    assert [p for _, p in spool.read(seq)] == [b"ok"]
+    spool.close()
+
+
+def test_write_error_rejects_batch_and_leaves_no_partial_record(tmp_path, monkeypatch):
+    client = OutageClient()
+    spool = DiskSpool(str(tmp_path), fsync=True)
+    assert spool.append_many([b"ok"])
+
+    def fail(fd):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(os, "fsync", fail)
+    bi = BulkIndexer(client, max_items=10, max_retries=0, retry_backoff_ms=1, spool=spool)
+    bi.add("logs-a", {"message": "1"}, ref=1)
+    result = bi.flush()
+    assert [r for r, _ in result.failed] == [1] and not result.ok and not result.spooled
+
+    monkeypatch.undo()
+    seq = spool.oldest()
+    assert [p for _, p in spool.read(seq)] == [b"ok"]
+    assert spool.size_bytes == os.path.getsize(os.path.join(str(tmp_path), f"{seq:012d}.seg"))
+    spool.close()
+
+
+def test_outage_spools_batch_and_replays_in_order(tmp_path):
+    client = OutageClient()
+    spool = DiskSpool(str(tmp_path), fsync=False)
+    bi = BulkIndexer(client, max_items=10, max_retries=1, retry_backoff_ms=1, spool=spool)
+    for ref in (1, 2, 3):
+        bi.add("logs-a", {"message": str(ref)}, ref=ref)
+    result = bi.flush()
+    assert result.ok == [1, 2, 3] and result.spooled == 3 and not result.failed
+
+    replayer = SpoolReplayer(spool, bi, batch_items=2)
+    assert replayer.run_once() == 0  # sin ping no se reintenta
+    client.up = True
+    assert replayer.run_once() == 3
+    assert len(client.bodies) == 2
+    body = b"".join(client.bodies)
+    assert body.index(b'"1"') < body.index(b'"2"') < body.index(b'"3"')
+    assert spool.empty()
+    spool.close()
+
+
+def test_replay_keeps_offset_when_cluster_fails_again(tmp_path):
+    client = OutageClient()
+    spool = DiskSpool(str(tmp_path), fsync=False)
+    bi = BulkIndexer(client, max_items=10, max_retries=0, retry_backoff_ms=1, spool=spool)
+    bi.add("logs-a", {"message": "1"})
+    bi.flush()
+
+    client.ping = lambda: True  # ping responde pero _bulk sigue fallando
+    assert SpoolReplayer(spool, bi).run_once() == 0
+    assert not spool.empty()
+    spool.close()
+
+
+def test_replay_keeps_permanently_rejected_actions(tmp_path):
+    client = OutageClient()
+    spool = DiskSpool(str(tmp_path), fsync=False)
+    bi = BulkIndexer(client, max_items=10, max_retries=0, retry_backoff_ms=1, spool=spool)
+    bi.add("logs-a", {"message": "good"})
+    bi.add("logs-a", {"message": "bad"})
+    bi.flush()
+    seq = spool.oldest()
+
+    client.up = True
+    client.bulk = lambda body, refresh=False: {
+        "errors": True,
+        "items": [
+            {"index": {"status": 201}},
+            {"index": {"status": 400, "error": {"type": "mapper_parsing_exception"}}},
+        ],
+    }
+    SpoolReplayer(spool, bi).run_once()
+    assert spool.empty()
+    with open(os.path.join(str(tmp_path), f"{seq:012d}.rejected"), "rb") as f:
+        rejected = f.read()
+    assert b'"bad"' in rejected and b'"good"' not in rejected
+    spool.close()
@@ -0,0 +1,155 @@
+import json
+import random
+import threading
+import time
+
+from prometheus_client import CollectorRegistry, Histogram
+
+from backend.app.metrics import stages
+from backend.app.metrics.stages import STAGE_BUCKETS, StageHistogramCollector, StageMetrics
+from backend.app.processing import consumer
+
+
+def _registry():
+    registry = CollectorRegistry()
+    direct = Histogram("direct", "x", ["stage"], buckets=STAGE_BUCKETS, registry=registry)
+    return registry, direct
+
+
+def _samples(registry, name):
+    return {
+        (s.name.replace(name, ""), tuple(sorted(s.labels.items()))): s.value
+        for metric in registry.collect()
+        if metric.name == name
+        for s in metric.samples
+        if not s.name.endswith("_created")
+    }
+
+
+def _observe_random(metrics, direct, n=5000):
+    r = random.Random(5)
+    for _ in range(n):
+        stage = r.randrange(len(stages.STAGES))
+        ns = int(r.expovariate(1 / 200_000))
+        metrics.observe_ns(stage, ns, now=0)
+        direct.labels(stage=stages.STAGES[stage]).observe(ns / 1e9)
+
+
+def _assert_same_histogram(got, want):
+    assert got.keys() == want.keys()
+    for key, value in want.items():
+        assert abs(got[key] - value) < 1e-6, key
+
+
+def test_collector_matches_observe():
+    registry, direct = _registry()
+    metrics = StageMetrics(
+        "batched", registry=registry, export_interval_ms=60_000, max_pending=10**9
+    )
+    _observe_random(metrics, direct)
+    # El scrape vuelca los acumulados sin esperar al siguiente volcado del hilo
+    _assert_same_histogram(_samples(registry, "batched"), _samples(registry, "direct"))
+
+
+def test_multiprocess_counters_rebuild_histogram_in_parent():
+    worker, direct = _registry()
+    metrics = StageMetrics(
+        "batched", registry=worker, export_interval_ms=60_000, max_pending=10**9, multiprocess=True
+    )
+    _observe_random(metrics, direct)
+    metrics.flush()
+    parent = CollectorRegistry()
+    parent.register(StageHistogramCollector(worker, name="batched"))
+    got = _samples(parent, "batched")
+    assert not any(name.startswith("batched_") for name, _ in got)
+    _assert_same_histogram(got, _samples(worker, "direct"))
+
+
+def test_multiprocess_flusher_exports_idle_threads():
+    registry, _ = _registry()
+    metrics = StageMetrics(
+        "batched", registry=registry, export_interval_ms=50, max_pending=10**9, multiprocess=True
+    )
+    thread = threading.Thread(target=metrics.observe_ns, args=(stages.FLUSH, 1000))
+    thread.start()
+    thread.join()
+    deadline = time.monotonic() + 5
+    key = ("_total", (("stage", "flush"),))
+    while time.monotonic() < deadline:
+        if _samples(registry, "batched_time_seconds").get(key):
+            break
+        time.sleep(0.02)
+    assert _samples(registry, "batched_time_seconds")[key] == 1e-6
+
+
+def test_exports_when_pending_limit_reached():
+    registry, _ = _registry()
+    metrics = StageMetrics(
+        "batched", registry=registry, export_interval_ms=60_000, max_pending=3, multiprocess=True
+    )
+    for _ in range(3):
+        metrics.observe_ns(stages.DECODE, 1000, now=0)
+    buckets = _samples(registry, "batched_bucket")
+    assert sum(buckets.values()) == 3
+
+
+def test_concurrent_flush_does_not_lose_observations():
+    metrics = StageMetrics("batched", registry=None, export_interval_ms=60_000, max_pending=10**9)
+    stop = threading.Event()
+
+    def flusher():
+        while not stop.is_set():
+            metrics.flush()
+
+    def work():
+        for _ in range(20_000):
+            metrics.observe_ns(stages.DECODE, 1000, now=0)
+
+    background = threading.Thread(target=flusher)
+    background.start()
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    stop.set()
+    background.join()
+    assert metrics.summary()["decode"]["count"] == 80_000
+
+
+def test_threads_accumulate_separately_and_flush_all():
+    metrics = StageMetrics("batched", registry=None, export_interval_ms=60_000, max_pending=10**9)
+
+    def work():
+        t = 0
+        for _ in range(1000):
+            t = metrics.lap(stages.NORMALIZE, t)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    summary = metrics.summary()
+    assert summary["normalize"]["count"] == 4000
+    assert summary["decode"] == {"count": 0, "mean_us": 0.0}
+
+
+def test_disabled_metrics_do_not_record():
+    metrics = StageMetrics("batched", registry=None, enabled=False)
+    assert metrics.lap(stages.DECODE, 123) == 123
+    metrics.observe_ns(stages.DECODE, 10)
+    assert metrics.summary()["decode"]["count"] == 0
+
+
+def test_process_message_times_each_stage(monkeypatch):
+    metrics = StageMetrics("batched", registry=None, export_interval_ms=60_000, max_pending=10**9)
+    monkeypatch.setattr(consumer, "stage_lap", metrics.lap)
+    monkeypatch.setattr(consumer, "stage_observe_ns", metrics.observe_ns)
+    monkeypatch.setattr(consumer, "is_valid_tenant", lambda t: True)
+    evt = {"tenant_id": "default", "message": "hi", "@timestamp": "2024-01-01T00:00:00Z"}
+    consumer.process_message(json.dumps(evt).encode(), None)
+    summary = metrics.summary()
+    for stage in ("decode", "normalize", "tenant", "validate"):
+        assert summary[stage]["count"] == 1, stage
+    assert summary["enqueue"]["count"] == 0
@@ -0,0 +1,50 @@
+import os
+import sys
+import time
+
+from backend.app.processing.supervisor import ConsumerSupervisor, prepare_multiproc_dir
+
+
+def _crashing_worker(index: int) -> None:
+    sys.exit(3)
+
+
+def _sleeping_worker(index: int) -> None:
+    time.sleep(30)
+
+
+def _wait_dead(sup: ConsumerSupervisor, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while sup.alive() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_supervisor_restarts_crashed_workers():
+    sup = ConsumerSupervisor(workers=2, target=_crashing_worker, backoff_seconds=0.0)
+    sup.start()
+    try:
+        _wait_dead(sup)
+        sup.check()
+        assert sup.restarts == 2
+    finally:
+        sup.stop(timeout=2.0)
+
+
+def test_supervisor_stop_terminates_workers():
+    sup = ConsumerSupervisor(workers=2, target=_sleeping_worker)
+    sup.start()
+    assert sup.alive() == 2
+    sup.stop(timeout=2.0)
+    assert sup.alive() == 0
+    assert sup.restarts == 0
+
+
+def test_prepare_multiproc_dir_removes_stale_files(tmp_path, monkeypatch):
+    # setenv (no delenv) para que monkeypatch restaure el valor que fija prepare_multiproc_dir
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    stale = tmp_path / "counter_123.db"
+    stale.write_bytes(b"x")
+    path = prepare_multiproc_dir(str(tmp_path))
+    assert path == str(tmp_path)
+    assert not stale.exists()
+    assert os.environ["PROMETHEUS_MULTIPROC_DIR"] == str(tmp_path)
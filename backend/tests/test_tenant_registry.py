@@ -0,0 +1,113 @@
+import json
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend.app.db.models import Tenant
+from backend.app.processing.tenant_registry import TenantRegistry
+
+
+def _db():
+    engine = create_engine(
+        "sqlite://",
+        poolclass=StaticPool,
+        connect_args={"check_same_thread": False},
+        future=True,
+    )
+    Tenant.__table__.create(engine)
+    return sessionmaker(bind=engine, future=True)
+
+
+def _add(factory, tid, active=True):
+    with factory() as db:
+        db.add(Tenant(id=tid, display_name=tid, policy_id="p", active=active))
+        db.commit()
+
+
+def test_file_source_accepts_tenants_object_and_lists(tmp_path):
+    # Formato de config/tenants.json
+    path = tmp_path / "tenants.json"
+    path.write_text(json.dumps({"tenants": ["default", {"id": "acme"}]}), encoding="utf-8")
+    reg = TenantRegistry(str(path), source="file")
+    assert reg.is_valid("default") and reg.is_valid("acme")
+    assert reg.metadata("acme") == {"id": "acme"}
+
+    path.write_text(json.dumps([{"id": "a"}, {"id": "b", "active": False}, " c "]))
+    reg.reload()
+    assert reg.all() == frozenset({"a", "c"})
+    assert reg.all() is reg.all()
+
+
+def test_repo_tenants_config_is_loaded():
+    assert TenantRegistry("config/tenants.json", source="file").is_valid("default")
+
+
+def test_db_source_polls_fingerprint_and_swaps(tmp_path):
+    factory = _db()
+    _add(factory, "acme")
+    _add(factory, "old", active=False)
+    changes = []
+    reg = TenantRegistry(str(tmp_path / "none.json"), source="db", session_factory=factory)
+    reg.on_change = changes.append
+    reg.load()
+    assert reg.all() == frozenset({"acme"})
+    assert reg.metadata("acme")["policy_id"] == "p"
+    assert reg.refresh() is False
+
+    _add(factory, "globex")
+    assert reg.refresh() is True
+    assert reg.is_valid("globex")
+
+    with factory() as db:
+        db.get(Tenant, "acme").active = False
+        db.commit()
+    assert reg.refresh() is True
+    assert not reg.is_valid("acme")
+    assert changes == [frozenset({"acme"}), frozenset({"acme", "globex"}), frozenset({"globex"})]
+
+
+def test_db_full_refresh_catches_changes_with_same_fingerprint(tmp_path):
+    factory = _db()
+    _add(factory, "aa")
+    _add(factory, "bb", active=False)
+    reg = TenantRegistry(
+        str(tmp_path / "none.json"), source="db", session_factory=factory, full_refresh_seconds=0
+    )
+    reg.load()
+    with factory() as db:
+        db.get(Tenant, "aa").active = False
+        db.get(Tenant, "bb").active = True
+        db.commit()
+    assert reg.refresh() is True
+    assert reg.all() == frozenset({"bb"})
+
+
+def test_db_unavailable_at_start_falls_back_to_file(tmp_path):
+    path = tmp_path / "tenants.json"
+    path.write_text(json.dumps({"tenants": ["default"]}), encoding="utf-8")
+
+    def broken():
+        raise RuntimeError("db down")
+
+    reg = TenantRegistry(str(path), source="db", session_factory=broken)
+    reg.load()
+    assert reg.all() == frozenset({"default"})
+
+
+def test_poll_thread_picks_up_new_tenants(tmp_path):
+    factory = _db()
+    reg = TenantRegistry(
+        str(tmp_path / "none.json"), source="db", session_factory=factory, poll_seconds=0.01
+    )
+    reg.load()
+    reg.start()
+    try:
+        _add(factory, "newco")
+        deadline = time.monotonic() + 2
+        while not reg.is_valid("newco") and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert reg.is_valid("newco")
+    finally:
+        reg.stop()
@@ -0,0 +1,55 @@
+import random
+import re
+from datetime import datetime, timezone
+
+from backend.app.processing import timestamps
+from backend.app.processing.timestamps import (
+    epoch_ms_to_iso,
+    kv_datetime_to_iso,
+    normalize_tz_offset,
+    ns_epoch_to_iso,
+)
+
+
+def _reference_ns(ns_str):
+    # Implementación anterior (datetime + isoformat por evento)
+    ms = int(ns_str) // 1_000_000
+    return datetime.fromtimestamp(ms / 1000.0, tz=timezone.utc).isoformat()
+
+
+def test_ns_epoch_matches_datetime_isoformat():
+    r = random.Random(7)
+    samples = [0, 1762958299127000000, 1762958299000000000, 1762958299000999999, -1_000_000]
+    samples += [r.randrange(0, 4_102_444_800 * 10**9) for _ in range(5000)]
+    for ns in samples:
+        assert ns_epoch_to_iso(str(ns)) == _reference_ns(str(ns)), ns
+
+
+def test_invalid_eventtime_falls_back_to_now():
+    for bad in ("notanumber", "", "9" * 40):
+        out = ns_epoch_to_iso(bad)
+        assert out.endswith("+00:00") and "T" in out
+
+
+def test_second_prefix_is_cached_per_second():
+    timestamps.second_prefix.cache_clear()
+    base = 1762958299 * 1000
+    out = [epoch_ms_to_iso(base + ms) for ms in (0, 5, 127, 999)]
+    assert out == [
+        "2025-11-12T14:38:19+00:00",
+        "2025-11-12T14:38:19.005000+00:00",
+        "2025-11-12T14:38:19.127000+00:00",
+        "2025-11-12T14:38:19.999000+00:00",
+    ]
+    info = timestamps.second_prefix.cache_info()
+    assert info.misses == 1 and info.hits == 3
+
+
+def test_tz_offset_normalization():
+    legacy_re = re.compile(r"^[+-]\d{4}$")
+    for tz in ("+0100", "-0530", "+01:00", "Z", "CET", "+100", "+01000"):
+        expected = tz[:3] + ":" + tz[3:] if legacy_re.match(tz) else tz
+        assert normalize_tz_offset(tz) == expected
+    assert kv_datetime_to_iso("2025-11-21", "07:29:29", "+0100") == "2025-11-21T07:29:29+01:00"
+    assert kv_datetime_to_iso("2025-11-21", "07:29:29", None) == "2025-11-21T07:29:29Z"
+    assert kv_datetime_to_iso("2025-11-21", "07:29:29", "") == "2025-11-21T07:29:29Z"
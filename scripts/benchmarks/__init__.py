@@ -0,0 +1 @@
+# Benchmarks del pipeline de ingesta (sin servicios externos).
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Asignaciones de memoria por evento en el camino json.loads -> normalize -> severidad ->
+prepare_event: versión con copias (dict(normalized) + coerce_datetimes que reconstruye
+todos los dicts/listas) vs versión en el sitio (consumer.process_message actual).
+
+Mide con tracemalloc los bloques y bytes que asigna por evento la etapa posterior a
+normalize() (la que cambia entre ambas versiones), y µs/evento del camino completo sin
+tracemalloc. Las dos versiones deben producir el mismo evento.
+
+Uso:
+  python -m scripts.benchmarks.bench_event_allocations --events 2000
+
+Salida (JSON) con ambas variantes; exit code 1 si los eventos difieren.
+"""
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from backend.app.processing.consumer import _normalize_severity
+from backend.app.processing.normalizer import normalize
+from backend.app.processing.utils import coerce_datetimes, prepare_event
+from scripts.benchmarks.bench_kv_tokenizer import build_lines
+
+
+def copying_stage(normalized: Dict[str, Any]) -> Dict[str, Any]:
+    # Camino anterior tras normalize(): copia + coerce_datetimes que reconstruye el evento
+    evt = dict(normalized)
+    _normalize_severity(evt)
+    if "@timestamp" not in evt:
+        evt["@timestamp"] = evt.get("timestamp")
+    evt = coerce_datetimes(evt)
+    evt.setdefault("dataset", "syslog.generic")
+    evt.setdefault("schema_version", "1.0.0")
+    return evt
+
+
+def inplace_stage(normalized: Dict[str, Any]) -> Dict[str, Any]:
+    _normalize_severity(normalized)
+    return prepare_event(normalized, coerce=False)
+
+
+def _stage_allocations(
+    stage: Callable[[Dict[str, Any]], Dict[str, Any]], bodies: List[bytes]
+) -> Dict[str, float]:
+    """
+    Bloques/bytes asignados por la etapa posterior a normalize(). Las entradas se mantienen
+    vivas, así que todo lo que la etapa crea (copias incluidas) aparece en el diff aunque
+    el evento original ya no se use.
+    """
+    inputs = [normalize(json.loads(body)) for body in bodies]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    outputs = [stage(evt) for evt in inputs]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    # La lista `outputs` en sí no cuenta como asignación por evento
+    blocks = sum(st.count_diff for st in stats) - 1
+    size = sum(st.size_diff for st in stats) - sys.getsizeof(outputs)
+    del outputs, inputs
+    return {
+        "alloc_blocks_per_event": round(blocks / len(bodies), 2),
+        "alloc_bytes_per_event": round(size / len(bodies)),
+    }
+
+
+def _end_to_end(stage: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Callable[[bytes], Any]:
+    return lambda body: stage(normalize(json.loads(body)))
+
+
+def _us_per_event(fn: Callable[[bytes], Any], bodies: List[bytes], rounds: int = 3) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for body in bodies:
+            fn(body)
+        best = min(best, time.perf_counter() - start)
+    return best / len(bodies) * 1e6
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Asignaciones por evento: copias vs en el sitio")
+    p.add_argument("--events", type=int, default=2000)
+    args = p.parse_args()
+
+    bodies = [
+        json.dumps({"message": line, "tenant_id": "default"}).encode()
+        for line in build_lines(args.events, 1024, 2048)
+    ]
+    mismatches = sum(
+        1
+        for body in bodies
+        if copying_stage(normalize(json.loads(body))) != inplace_stage(normalize(json.loads(body)))
+    )
+    out: Dict[str, Any] = {"events": len(bodies), "mismatches": mismatches}
+    for name, stage in (("copying", copying_stage), ("inplace", inplace_stage)):
+        out[name] = _stage_allocations(stage, bodies)
+        out[name]["us_per_event"] = round(_us_per_event(_end_to_end(stage), bodies), 2)
+    print(json.dumps(out, indent=2))
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark del codec JSON (core/json_codec.py): json estándar vs orjson en las dos
+operaciones JSON por evento del consumer, decodificar el cuerpo del mensaje y serializar
+el documento normalizado para _bulk.
+
+Comprueba que ambos backends decodifican lo mismo y que el documento serializado por
+orjson vuelve al mismo evento. Sin orjson instalado sólo mide el backend estándar.
+
+Uso:
+  python -m scripts.benchmarks.bench_json_codec --events 20000
+
+Salida (JSON): µs/evento de decode y encode por backend, speedup y mismatches.
+Exit code 1 si hay discrepancias.
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+from backend.app.core import json_codec
+from backend.app.processing.normalizer import normalize
+from scripts.benchmarks.bench_kv_tokenizer import build_lines
+
+
+def _us_per_item(fn: Callable[[Any], Any], items: List[Any], rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+    return best / len(items) * 1e6
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Microbenchmark del codec JSON")
+    p.add_argument("--events", type=int, default=20000)
+    p.add_argument("--min-bytes", type=int, default=300)
+    p.add_argument("--max-bytes", type=int, default=1200)
+    p.add_argument("--rounds", type=int, default=5)
+    args = p.parse_args()
+
+    lines = build_lines(args.events, args.min_bytes, args.max_bytes)
+    bodies = [
+        json.dumps({"message": line, "host": "fw01", "tenant_id": "acme"}).encode("utf-8")
+        for line in lines
+    ]
+    events: List[Dict[str, Any]] = [normalize(json.loads(b)) for b in bodies]
+
+    codecs = [json_codec.STDLIB]
+    if json_codec.orjson is not None:
+        codecs.append(json_codec.build_codec("orjson"))
+
+    mismatches = 0
+    for codec in codecs[1:]:
+        mismatches += sum(1 for b in bodies if codec.loads(b) != json_codec.STDLIB.loads(b))
+        mismatches += sum(1 for e in events if json.loads(codec.dumps(e)) != e)
+
+    out: Dict[str, Any] = {"events": args.events, "mismatches": mismatches}
+    for codec in codecs:
+        out[f"decode_{codec.name}_us"] = round(_us_per_item(codec.loads, bodies, args.rounds), 2)
+        out[f"encode_{codec.name}_us"] = round(_us_per_item(codec.dumps, events, args.rounds), 2)
+    if len(codecs) > 1:
+        out["decode_speedup"] = round(out["decode_stdlib_us"] / out["decode_orjson_us"], 2)
+        out["encode_speedup"] = round(out["encode_stdlib_us"] / out["encode_orjson_us"], 2)
+    print(json.dumps(out, indent=2))
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
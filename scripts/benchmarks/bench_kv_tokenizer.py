@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark del parser clave=valor de Fortinet: strip_pri + parse_kv (regex y quitado
+de comillas por par) vs tokenize() (una pasada).
+
+1. Genera líneas FortiGate sintéticas de 1–2 KB (tamaño típico en producción).
+2. Comprueba que ambos dan el mismo (mensaje limpio, kv) en todas las líneas.
+3. Mide líneas/s y µs/línea de cada uno.
+
+Uso:
+  python -m scripts.benchmarks.bench_kv_tokenizer --lines 5000 --min-bytes 1024 --max-bytes 2048
+
+Salida (JSON): {"lines": N, "avg_bytes": ..., "mismatches": 0, "regex_us": ..., "tokenize_us": ...}
+Exit code 1 si hay discrepancias.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from typing import Callable, List
+
+from backend.app.processing.normalizer import parse_kv, strip_pri, tokenize
+
+HEADER = (
+    '<189>date=2025-11-21 time={time} devname="FGT-{dev:02d}" devid="FG100FTK1900{dev:04d}" '
+    'eventtime={eventtime} tz="+0100" logid="0000000013" type="traffic" subtype="forward" '
+    'level="notice" vd="root"'
+)
+
+FIELDS: List[Callable[[random.Random], str]] = [
+    lambda r: f"srcip=10.{r.randint(0, 255)}.{r.randint(0, 255)}.{r.randint(1, 254)}",
+    lambda r: f"dstip=203.0.113.{r.randint(1, 254)}",
+    lambda r: f"srcport={r.randint(1024, 65535)}",
+    lambda r: f"dstport={r.choice([53, 80, 443, 3389])}",
+    lambda r: f'srcintf="port{r.randint(1, 9)}"',
+    lambda r: 'dstintf="wan1"',
+    lambda r: f"sessionid={r.randint(1, 10**9)}",
+    lambda r: f"proto={r.choice([6, 17])}",
+    lambda r: f'action="{r.choice(["accept", "close", "deny"])}"',
+    lambda r: f"policyid={r.randint(1, 200)}",
+    lambda r: 'policyname="LAN to WAN"',
+    lambda r: 'service="HTTPS"',
+    lambda r: f'app="{r.choice(["HTTPS.BROWSER", "DNS", "Microsoft.Portal"])}"',
+    lambda r: f"sentbyte={r.randint(0, 10**7)} rcvdbyte={r.randint(0, 10**8)}",
+    lambda r: f'srccountry="Reserved" dstcountry="{r.choice(["Spain", "United States"])}"',
+    lambda r: f'msg="anomaly: udp_flood, pps {r.randint(1, 99999)} > threshold 2000"',
+    lambda r: f'srcmac="a4:83:e7:{r.randint(0, 255):02x}:{r.randint(0, 255):02x}:56"',
+    lambda r: "utmaction=allow countweb=1",
+]
+
+
+def build_lines(n: int, min_bytes: int, max_bytes: int, seed: int = 42) -> List[str]:
+    r = random.Random(seed)
+    lines = []
+    for i in range(n):
+        target = r.randint(min_bytes, max_bytes)
+        parts = [
+            HEADER.format(
+                time=f"07:{i % 60:02d}:{r.randint(0, 59):02d}",
+                dev=r.randint(1, 40),
+                eventtime=1763710169127000000 + i,
+            )
+        ]
+        size = len(parts[0])
+        while size < target:
+            part = r.choice(FIELDS)(r)
+            parts.append(part)
+            size += len(part) + 1
+        lines.append(" ".join(parts))
+    return lines
+
+
+def regex_parse(msg: str):
+    cleaned = strip_pri(msg).strip()
+    return cleaned, parse_kv(cleaned)
+
+
+def _us_per_line(fn: Callable[[str], object], lines: List[str], rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for line in lines:
+            fn(line)
+        best = min(best, time.perf_counter() - start)
+    return best / len(lines) * 1e6
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Microbenchmark del tokenizer clave=valor")
+    p.add_argument("--lines", type=int, default=5000)
+    p.add_argument("--min-bytes", type=int, default=1024)
+    p.add_argument("--max-bytes", type=int, default=2048)
+    p.add_argument("--rounds", type=int, default=5)
+    p.add_argument("--seed", type=int, default=42)
+    args = p.parse_args()
+
+    lines = build_lines(args.lines, args.min_bytes, args.max_bytes, seed=args.seed)
+    mismatches = sum(1 for line in lines if tokenize(line) != regex_parse(line))
+    regex_us = _us_per_line(regex_parse, lines, args.rounds)
+    tokenize_us = _us_per_line(tokenize, lines, args.rounds)
+    out = {
+        "lines": len(lines),
+        "avg_bytes": round(sum(len(line) for line in lines) / len(lines)),
+        "mismatches": mismatches,
+        "regex_us": round(regex_us, 2),
+        "tokenize_us": round(tokenize_us, 2),
+        "regex_lps": round(1e6 / regex_us),
+        "tokenize_lps": round(1e6 / tokenize_us),
+        "speedup": round(regex_us / tokenize_us, 2),
+    }
+    print(json.dumps(out, indent=2))
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
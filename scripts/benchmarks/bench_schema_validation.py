@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark de validación NCS: Draft7Validator genérico vs validador compilado.
+
+1. Genera un corpus determinista de eventos válidos y mutaciones inválidas.
+2. Comprueba que ambos validadores dan el mismo veredicto en todos los eventos.
+3. Mide eventos/s de cada uno.
+
+Uso:
+  python -m scripts.benchmarks.bench_schema_validation --events 20000
+
+Salida (JSON): {"events": N, "invalid": M, "mismatches": 0, "draft7_eps": ..., "compiled_eps": ...}
+Exit code 1 si hay discrepancias de veredicto.
+"""
+import argparse
+import copy
+import json
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+from jsonschema import Draft7Validator
+
+from backend.app.processing.schema_compiler import CompiledValidator
+
+# Mutaciones que rompen (o no) el schema; cubren required, tipos, enum y objetos anidados
+MUTATIONS: List[Callable[[Dict[str, Any], random.Random], None]] = [
+    lambda e, r: e.pop(r.choice(["tenant_id", "@timestamp", "dataset", "message"])),
+    lambda e, r: e.update(severity=r.choice(["HIGH", "urgent", 3, None])),
+    lambda e, r: e["source"].update(port=r.choice(["443", 44.5, True, 8080.0])),
+    lambda e, r: e.update(message=r.choice([123, None, ["a"], {"x": 1}])),
+    lambda e, r: e.update(labels={"env": r.choice(["prod", 1, False])}),
+    lambda e, r: e.update(user=r.choice(["root", {"name": 1}, {"email": "not-an-email"}])),
+    lambda e, r: e.update(original=r.choice([{"message_raw": "x"}, "raw", []])),
+    lambda e, r: e["destination"].update(ip=r.choice(["999.1.1.1", 10])),
+]
+
+
+def base_event(r: random.Random, i: int) -> Dict[str, Any]:
+    return {
+        "tenant_id": r.choice(["default", "acme", "globex"]),
+        "@timestamp": f"2024-05-01T10:{i % 60:02d}:00Z",
+        "dataset": "fortinet.fortigate",
+        "schema_version": "1.0.0",
+        "message": f"event {i}",
+        "category": "traffic",
+        "severity": r.choice(["low", "medium", "high", "critical", "info"]),
+        "source": {"ip": "10.0.0.1", "port": r.randint(1, 65535), "host": "fw01"},
+        "destination": {"ip": "8.8.8.8", "port": 53},
+        "labels": {"site": "mad"},
+        "original": {"message_raw": f"date=2024-05-01 srcip=10.0.0.1 n={i}"},
+    }
+
+
+def build_corpus(n: int, invalid_ratio: float = 0.3, seed: int = 42) -> List[Dict[str, Any]]:
+    r = random.Random(seed)
+    corpus = []
+    for i in range(n):
+        evt = base_event(r, i)
+        if r.random() < invalid_ratio:
+            evt = copy.deepcopy(evt)
+            r.choice(MUTATIONS)(evt, r)
+        corpus.append(evt)
+    return corpus
+
+
+def _eps(fn: Callable[[Any], bool], corpus: List[Dict[str, Any]], rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for evt in corpus:
+            fn(evt)
+        best = min(best, time.perf_counter() - start)
+    return len(corpus) / best if best else 0.0
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Benchmark de validación del schema NCS")
+    p.add_argument("--schema", default="backend/app/schema/ncs_v1.0.0.json")
+    p.add_argument("--events", type=int, default=20000)
+    p.add_argument("--rounds", type=int, default=3)
+    p.add_argument("--seed", type=int, default=42)
+    args = p.parse_args()
+
+    with open(args.schema, "r", encoding="utf-8") as f:
+        schema = json.load(f)
+    generic = Draft7Validator(schema)
+    compiled = CompiledValidator(schema)
+    corpus = build_corpus(args.events, seed=args.seed)
+
+    mismatches = [
+        i for i, evt in enumerate(corpus) if generic.is_valid(evt) != compiled.is_valid(evt)
+    ]
+    # Ruta real del consumer: veredicto + informe de errores sólo en eventos inválidos
+    draft7_eps = _eps(lambda e: list(generic.iter_errors(e)), corpus, args.rounds)
+    compiled_eps = _eps(
+        lambda e: compiled.is_valid(e) or list(compiled.iter_errors(e)), corpus, args.rounds
+    )
+    out = {
+        "events": len(corpus),
+        "invalid": sum(1 for e in corpus if not generic.is_valid(e)),
+        "mismatches": len(mismatches),
+        "draft7_eps": round(draft7_eps),
+        "compiled_eps": round(compiled_eps),
+        "speedup": round(compiled_eps / draft7_eps, 2) if draft7_eps else None,
+    }
+    print(json.dumps(out, indent=2))
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
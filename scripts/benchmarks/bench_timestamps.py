@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark de conversión de timestamps: datetime + isoformat por evento (implementación
+anterior) vs prefijo por segundo cacheado (processing/timestamps.py).
+
+Simula ráfagas: `--firewalls` dispositivos intercalados, `--events-per-second` eventos por
+segundo y dispositivo. Comprueba que ambas rutas dan la misma cadena.
+
+Uso:
+  python -m scripts.benchmarks.bench_timestamps --events 200000
+
+Salida (JSON): ns/evento de cada ruta (eventtime y date/time/tz) y mismatches.
+Exit code 1 si hay discrepancias.
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, List, Sequence, Tuple
+
+from backend.app.processing.timestamps import kv_datetime_to_iso, ns_epoch_to_iso
+
+
+def legacy_ns_epoch_to_iso(ns_str: str) -> str:
+    try:
+        ms = int(ns_str) // 1_000_000
+        return datetime.fromtimestamp(ms / 1000.0, tz=timezone.utc).isoformat()
+    except Exception:
+        return datetime.now(timezone.utc).isoformat()
+
+
+def legacy_kv_datetime(date: str, timev: str, tz: str) -> str:
+    if tz and re.match(r"^[+-]\d{4}$", tz):
+        tz = tz[:3] + ":" + tz[3:]
+    return f"{date}T{timev}{tz}" if tz else f"{date}T{timev}Z"
+
+
+def build_events(n: int, firewalls: int, per_second: int, seed: int = 42) -> List[str]:
+    r = random.Random(seed)
+    base = 1763710169
+    out = []
+    for i in range(n):
+        second = base + i // (firewalls * per_second)
+        out.append(str(second * 10**9 + r.randrange(10**9)))
+    return out
+
+
+def _ns_per_call(fn: Callable, args: Sequence[Tuple], rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for a in args:
+            fn(*a)
+        best = min(best, time.perf_counter() - start)
+    return best / len(args) * 1e9
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Microbenchmark de conversión de timestamps")
+    p.add_argument("--events", type=int, default=200000)
+    p.add_argument("--firewalls", type=int, default=20)
+    p.add_argument("--events-per-second", type=int, default=50)
+    p.add_argument("--rounds", type=int, default=5)
+    args = p.parse_args()
+
+    ns_args = [(v,) for v in build_events(args.events, args.firewalls, args.events_per_second)]
+    tz_args = [
+        ("2025-11-21", f"07:29:{i % 60:02d}", ("+0100", "-0500", "")[i % 3])
+        for i in range(args.events)
+    ]
+    mismatches = sum(1 for (v,) in ns_args if ns_epoch_to_iso(v) != legacy_ns_epoch_to_iso(v))
+    mismatches += sum(1 for a in tz_args if kv_datetime_to_iso(*a) != legacy_kv_datetime(*a))
+    out = {
+        "events": args.events,
+        "mismatches": mismatches,
+        "eventtime_legacy_ns": round(_ns_per_call(legacy_ns_epoch_to_iso, ns_args, args.rounds)),
+        "eventtime_cached_ns": round(_ns_per_call(ns_epoch_to_iso, ns_args, args.rounds)),
+        "datetime_tz_legacy_ns": round(_ns_per_call(legacy_kv_datetime, tz_args, args.rounds)),
+        "datetime_tz_cached_ns": round(_ns_per_call(kv_datetime_to_iso, tz_args, args.rounds)),
+    }
+    print(json.dumps(out, indent=2))
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Corpus sintético de ingesta: mensajes FortiGate y syslog genérico tal como llegan a la cola.
+
+Distribución por defecto (aproximada a un tenant con firewalls FortiGate y algún servidor
+Linux enviando syslog):
+- 72% FortiGate traffic (forward/local), 600–1400 bytes.
+- 14% FortiGate utm (webfilter/ips/app-ctrl/virus), 900–2000 bytes, con url/msg largos.
+- 4% FortiGate anomaly/event (DoS, system, vpn).
+- 7% syslog RFC 3164 y 3% RFC 5424 (sshd, sudo, kernel, cron), 80–400 bytes.
+
+Dentro de cada tipo los valores siguen distribuciones sesgadas como en producción: pocos
+dispositivos e IPs origen generan la mayoría del tráfico (Zipf), 443/53/80 dominan los
+puertos destino y `accept`/`close` las acciones. Determinista para una semilla dada.
+
+Uso:
+    from scripts.benchmarks.corpus import build_bodies
+    bodies = build_bodies(5000, seed=42)   # List[bytes], cuerpos de mensaje de la cola
+"""
+import json
+import random
+from itertools import accumulate
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+KINDS: Tuple[Tuple[str, float], ...] = (
+    ("forti_traffic", 0.72),
+    ("forti_utm", 0.14),
+    ("forti_event", 0.04),
+    ("rfc3164", 0.07),
+    ("rfc5424", 0.03),
+)
+
+TENANTS = ("default", "acme", "globex", "initech")
+DEVICES = tuple(f"FGT-{site}-{n:02d}" for site in ("MAD", "BCN", "LIS", "PAR") for n in (1, 2))
+HOSTS = ("web01", "web02", "db01", "bastion", "mail01", "k8s-node-3")
+DST_PORTS = ((443, 0.55), (53, 0.2), (80, 0.1), (123, 0.04), (22, 0.03), (3389, 0.02))
+ACTIONS = (("accept", 0.45), ("close", 0.35), ("timeout", 0.08), ("deny", 0.1), ("ip-conn", 0.02))
+APPS = (
+    ("HTTPS.BROWSER", "Web.Client"),
+    ("DNS", "Network.Service"),
+    ("Microsoft.Portal", "Collaboration"),
+    ("Google.Services", "General.Interest"),
+    ("SSL", "Network.Service"),
+    ("Slack", "Collaboration"),
+)
+COUNTRIES = ("United States", "Spain", "Ireland", "Germany", "France", "Netherlands")
+URLS = (
+    "/api/v2/telemetry/collect?client=desktop&session={n}&build=19045",
+    "/wp-login.php",
+    "/static/js/app.{n}.chunk.js",
+    "/search?q=quarterly+report+{n}&source=hp&ei=Xk3aZb2{n}",
+    "/download/installer-x64-{n}.exe",
+)
+SYSLOG_MESSAGES = (
+    ("sshd", "Accepted publickey for deploy from 10.1.{a}.{b} port {p} ssh2: ED25519 SHA256:{h}"),
+    ("sshd", "Failed password for invalid user admin from 198.51.100.{b} port {p} ssh2"),
+    (
+        "sudo",
+        "deploy : TTY=pts/0 ; PWD=/srv/app ; USER=root ; COMMAND=/usr/bin/systemctl restart app",
+    ),
+    ("kernel", "[UFW BLOCK] IN=eth0 OUT= SRC=203.0.113.{b} DST=10.1.{a}.{b} PROTO=TCP DPT={p}"),
+    ("CRON", "(root) CMD (/usr/local/bin/backup.sh --incremental >/dev/null 2>&1)"),
+)
+
+
+def _weighted(options: Sequence[Tuple[Any, float]]) -> Callable[[random.Random], Any]:
+    values = [v for v, _ in options]
+    cum = list(accumulate(w for _, w in options))
+    return lambda r: r.choices(values, cum_weights=cum)[0]
+
+
+def _zipf(n: int, s: float = 1.2) -> Callable[[random.Random], int]:
+    cum = list(accumulate(1 / (k**s) for k in range(1, n + 1)))
+    ranks = range(n)
+    return lambda r: r.choices(ranks, cum_weights=cum)[0]
+
+
+_kind = _weighted(KINDS)
+_dst_port = _weighted(DST_PORTS)
+_action = _weighted(ACTIONS)
+_device = _zipf(len(DEVICES))
+_src_host = _zipf(250)
+
+
+def _ip_src(r: random.Random) -> str:
+    n = _src_host(r)
+    return f"10.{n % 4}.{n // 4 % 256}.{n % 250 + 2}"
+
+
+def _header(r: random.Random, i: int, pri: int, type_: str, subtype: str, level: str) -> str:
+    dev = _device(r)
+    sec = 1763710169 + i // 50
+    return (
+        f"<{pri}>date=2025-11-21 time={sec // 3600 % 24:02d}:{sec // 60 % 60:02d}:{sec % 60:02d} "
+        f'devname="{DEVICES[dev]}" devid="FG100FTK19{dev:06d}" '
+        f"eventtime={sec}{r.randint(0, 999):03d}000000 "
+        f'tz="+0100" logid="{r.randint(0, 10**10 - 1):010d}" type="{type_}" subtype="{subtype}" '
+        f'level="{level}" vd="root"'
+    )
+
+
+def _session(r: random.Random) -> List[str]:
+    app, appcat = r.choice(APPS)
+    dstport = _dst_port(r)
+    sent = int(r.lognormvariate(8, 2))
+    rcvd = int(r.lognormvariate(9, 2.5))
+    return [
+        f'srcip={_ip_src(r)} srcport={r.randint(1024, 65535)} srcintf="port{r.randint(1, 8)}" '
+        'srcintfrole="lan"',
+        f"dstip={r.randint(1, 223)}.{r.randint(0, 255)}.{r.randint(0, 255)}.{r.randint(1, 254)} "
+        f'dstport={dstport} dstintf="wan1" dstintfrole="wan"',
+        f'srccountry="Reserved" dstcountry="{r.choice(COUNTRIES)}"',
+        f"sessionid={r.randint(1, 2**31)} proto={17 if dstport in (53, 123) else 6}",
+        f'policyid={r.randint(1, 120)} policytype="policy" policyname="LAN to WAN"',
+        f'appid={r.randint(10000, 50000)} app="{app}" appcat="{appcat}" apprisk="'
+        f'{r.choice(["low", "elevated", "medium"])}"',
+        f"duration={int(r.expovariate(1 / 60))} sentbyte={sent} rcvdbyte={rcvd} "
+        f"sentpkt={sent // 900 + 1} rcvdpkt={rcvd // 1200 + 1}",
+    ]
+
+
+_PADDING = (
+    lambda r: 'trandisp="snat" transip=203.0.113.10 transport={}'.format(r.randint(1024, 65535)),
+    lambda r: 'mastersrcmac="a4:83:e7:{:02x}:{:02x}:56" srcserver=0'.format(
+        r.randint(0, 255), r.randint(0, 255)
+    ),
+    lambda r: 'poluuid="5f0c3a8e-1d2b-51ee-8a3c-{:012x}"'.format(r.getrandbits(48)),
+    lambda r: 'vwlid=0 utmaction="allow" countweb=1 countapp={}'.format(r.randint(1, 5)),
+    lambda r: 'osname="{}" srchwvendor="{}"'.format(
+        r.choice(["Windows", "macOS", "Linux", "iOS"]), r.choice(["Dell", "Apple", "Lenovo"])
+    ),
+)
+
+
+def _pad(r: random.Random, parts: List[str], target: int) -> None:
+    size = sum(len(p) + 1 for p in parts)
+    while size < target:
+        part = r.choice(_PADDING)(r)
+        parts.append(part)
+        size += len(part) + 1
+
+
+def forti_traffic(r: random.Random, i: int) -> str:
+    subtype = "forward" if r.random() < 0.9 else "local"
+    parts = [_header(r, i, 189, "traffic", subtype, "notice"), *_session(r)]
+    parts.append(f'action="{_action(r)}" service="{r.choice(["HTTPS", "DNS", "HTTP", "NTP"])}"')
+    _pad(r, parts, r.randint(600, 1400))
+    return " ".join(parts)
+
+
+def forti_utm(r: random.Random, i: int) -> str:
+    subtype, level = r.choice(
+        [
+            ("webfilter", "warning"),
+            ("ips", "alert"),
+            ("app-ctrl", "information"),
+            ("virus", "warning"),
+        ]
+    )
+    url = r.choice(URLS).format(n=r.randint(1, 10**6))
+    parts = [_header(r, i, 188, "utm", subtype, level), *_session(r)]
+    parts.append(
+        f'action="{r.choice(["blocked", "passthrough", "monitored"])}" '
+        f'hostname="www.example{r.randint(1, 40)}.com" url="{url}" '
+        f'msg="{subtype}: {r.choice(["URL belongs to a denied category", "signature match"])} '
+        f'id={r.randint(1, 99999)}" crscore={r.choice([5, 10, 30, 50])} crlevel="low"'
+    )
+    _pad(r, parts, r.randint(900, 2000))
+    return " ".join(parts)
+
+
+def forti_event(r: random.Random, i: int) -> str:
+    if r.random() < 0.5:
+        parts = [
+            _header(r, i, 185, "anomaly", "anomaly", "alert"),
+            f'srcip=198.51.100.{r.randint(1, 254)} dstip=203.0.113.5 srcintf="wan1" sessionid=0',
+            f'action="clear_session" proto=17 service="udp/53" count={r.randint(1, 5000)} '
+            f'attack="udp_flood" attackid=285212772 severity="critical" '
+            f'msg="anomaly: udp_flood, {r.randint(2001, 99999)} > threshold 2000"',
+        ]
+    else:
+        parts = [
+            _header(r, i, 190, "event", r.choice(["system", "vpn", "user"]), "information"),
+            f'logdesc="{r.choice(["Admin login successful", "IPsec tunnel up", "Config edit"])}" '
+            f'user="{r.choice(["admin", "netops", "svc-backup"])}" ui="https({_ip_src(r)})" '
+            f'status="success" msg="Administrator logged in successfully"',
+        ]
+    return " ".join(parts)
+
+
+def _syslog_text(r: random.Random) -> Tuple[str, str]:
+    app, template = r.choice(SYSLOG_MESSAGES)
+    text = template.format(
+        a=r.randint(0, 255),
+        b=r.randint(1, 254),
+        p=r.randint(1024, 65535),
+        h="".join(
+            r.choices("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789", k=43)
+        ),
+    )
+    return app, text
+
+
+def rfc3164(r: random.Random, i: int) -> str:
+    app, text = _syslog_text(r)
+    host = r.choice(HOSTS)
+    return (
+        f"<{r.choice([38, 86, 4, 13])}>Nov 21 07:{i // 60 % 60:02d}:{i % 60:02d} "
+        f"{host} {app}[{r.randint(100, 65000)}]: {text}"
+    )
+
+
+def rfc5424(r: random.Random, i: int) -> str:
+    app, text = _syslog_text(r)
+    host = r.choice(HOSTS)
+    return (
+        f"<{r.choice([38, 86, 134])}>1 2025-11-21T07:{i // 60 % 60:02d}:{i % 60:02d}."
+        f"{r.randint(0, 999999):06d}+01:00 {host} {app} {r.randint(100, 65000)} - "
+        f'[meta@32473 env="prod" region="eu-west-1"] {text}'
+    )
+
+
+GENERATORS: Dict[str, Callable[[random.Random, int], str]] = {
+    "forti_traffic": forti_traffic,
+    "forti_utm": forti_utm,
+    "forti_event": forti_event,
+    "rfc3164": rfc3164,
+    "rfc5424": rfc5424,
+}
+
+
+def build_messages(n: int, seed: int = 42) -> List[Tuple[str, str]]:
+    """Lista de (tipo, mensaje) con la distribución de KINDS."""
+    r = random.Random(seed)
+    out = []
+    for i in range(n):
+        kind = _kind(r)
+        out.append((kind, GENERATORS[kind](r, i)))
+    return out
+
+
+def build_bodies(n: int, seed: int = 42) -> List[bytes]:
+    """Cuerpos de mensaje como los publica el ingestor: {"message", "tenant_id"} en JSON."""
+    r = random.Random(seed + 1)
+    return [
+        json.dumps({"message": msg, "tenant_id": r.choice(TENANTS)}).encode()
+        for _, msg in build_messages(n, seed)
+    ]
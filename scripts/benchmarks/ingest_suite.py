@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Suite de microbenchmarks del camino caliente del consumer sobre el corpus sintético de
+`scripts/benchmarks/corpus.py`.
+
+Etapas (cada una sobre la salida de la anterior, preparada fuera de la medida):
+- parse_kv: strip_pri + parse_kv del mensaje (parser de referencia).
+- tokenize: tokenize() del mensaje (el del parser clave=valor de normalize).
+- normalize: normalize() del evento decodificado.
+- normalize_severity: consumer._normalize_severity.
+- prepare_event: prepare_event(coerce=False), como en process_message.
+- validate_draft7: list(Draft7Validator.iter_errors(evt)).
+- validate_compiled: validador compilado (veredicto + errores sólo si es inválido).
+- bulk_build: NdjsonEncoder.encode + join en batches de --batch acciones (payload _bulk).
+
+Por etapa: eventos/s y µs/evento (mejor de --rounds, sin tracemalloc) y bloques/bytes por
+evento que la etapa deja asignados (tracemalloc, conservando la salida: incluye todo lo que
+la etapa crea y sigue vivo, no los temporales ya liberados).
+
+Uso:
+  python -m scripts.benchmarks.ingest_suite run --events 5000 --output bench/base.json
+  python -m scripts.benchmarks.ingest_suite compare bench/base.json bench/new.json
+
+`run` imprime el resultado (JSON) y lo guarda en --output. `compare` imprime la variación
+por etapa y sale con exit code 1 si alguna pierde más de --max-regression de eventos/s o
+asigna más de --max-regression bytes por evento (por defecto 0.2: las etapas de menos de 1 µs
+varían ±10–20% entre ejecuciones; comparar resultados de la misma máquina).
+"""
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from jsonschema import Draft7Validator
+
+from backend.app.core import json_codec
+from backend.app.processing.bulk_indexer import NdjsonEncoder
+from backend.app.processing.consumer import _normalize_severity
+from backend.app.processing.normalizer import normalize, parse_kv, strip_pri, tokenize
+from backend.app.processing.schema_compiler import CompiledValidator
+from backend.app.processing.utils import prepare_event
+from scripts.benchmarks.corpus import build_bodies
+
+DEFAULT_SCHEMA = "backend/app/schema/ncs_v1.0.0.json"
+
+
+class Stage(NamedTuple):
+    name: str
+    # Entradas nuevas para una pasada (copias si la etapa modifica en el sitio)
+    inputs: Callable[[], List[Any]]
+    run: Callable[[List[Any]], Any]
+
+
+def build_stages(bodies: List[bytes], schema: Dict[str, Any], batch: int = 500) -> List[Stage]:
+    raws = [json.loads(body) for body in bodies]
+    messages = [raw["message"] for raw in raws]
+    normalized = [normalize(raw) for raw in raws]
+    prepared = []
+    for evt in normalized:
+        evt = dict(evt)
+        _normalize_severity(evt)
+        prepared.append(prepare_event(evt, coerce=False))
+    draft7 = Draft7Validator(schema)
+    compiled = CompiledValidator(schema)
+
+    def parse(msgs):
+        return [parse_kv(strip_pri(m).strip()) for m in msgs]
+
+    def severity(evts):
+        for evt in evts:
+            _normalize_severity(evt)
+        return evts
+
+    def bulk_build(evts):
+        encoder = NdjsonEncoder()
+        return [
+            b"".join(
+                encoder.encode(f"logs-{evt['tenant_id']}", evt, "logs_ingest")
+                for evt in evts[i : i + batch]
+            )
+            for i in range(0, len(evts), batch)
+        ]
+
+    return [
+        Stage("parse_kv", lambda: messages, parse),
+        Stage("tokenize", lambda: messages, lambda msgs: [tokenize(m) for m in msgs]),
+        Stage("normalize", lambda: raws, lambda rs: [normalize(r) for r in rs]),
+        Stage("normalize_severity", lambda: [dict(e) for e in normalized], severity),
+        Stage(
+            "prepare_event",
+            lambda: [dict(e) for e in prepared],
+            lambda evts: [prepare_event(e, coerce=False) for e in evts],
+        ),
+        Stage(
+            "validate_draft7",
+            lambda: prepared,
+            lambda evts: [list(draft7.iter_errors(e)) for e in evts],
+        ),
+        Stage(
+            "validate_compiled",
+            lambda: prepared,
+            lambda evts: [compiled.is_valid(e) or list(compiled.iter_errors(e)) for e in evts],
+        ),
+        Stage("bulk_build", lambda: prepared, bulk_build),
+    ]
+
+
+def _seconds(stage: Stage, rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        inputs = stage.inputs()
+        gc.collect()
+        start = time.perf_counter()
+        stage.run(inputs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _allocations(stage: Stage, events: int) -> Dict[str, float]:
+    inputs = stage.inputs()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    output = stage.run(inputs)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    blocks = sum(st.count_diff for st in stats)
+    size = sum(st.size_diff for st in stats)
+    del output, inputs
+    return {
+        "alloc_blocks_per_event": round(blocks / events, 2),
+        "alloc_bytes_per_event": round(size / events),
+    }
+
+
+def run_suite(
+    events: int,
+    rounds: int = 7,
+    seed: int = 42,
+    batch: int = 500,
+    schema_path: str = DEFAULT_SCHEMA,
+    only: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    with open(schema_path, "r", encoding="utf-8") as f:
+        schema = json.load(f)
+    bodies = build_bodies(events, seed=seed)
+    stages: Dict[str, Dict[str, float]] = {}
+    for stage in build_stages(bodies, schema, batch):
+        if only and stage.name not in only:
+            continue
+        seconds = _seconds(stage, rounds)
+        result: Dict[str, float] = {
+            "eps": round(events / seconds) if seconds else 0,
+            "us_per_event": round(seconds / events * 1e6, 3),
+        }
+        result.update(_allocations(stage, events))
+        stages[stage.name] = result
+    return {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "json_codec": json_codec.BACKEND,
+            "events": events,
+            "avg_bytes": round(sum(len(b) for b in bodies) / len(bodies)),
+            "rounds": rounds,
+            "seed": seed,
+            "batch": batch,
+        },
+        "stages": stages,
+    }
+
+
+def compare(
+    base: Dict[str, Any], new: Dict[str, Any], max_regression: float = 0.2
+) -> Dict[str, Any]:
+    """Variación por etapa común a ambos resultados; `regressions` lista las que empeoran."""
+    stages: Dict[str, Dict[str, Any]] = {}
+    regressions = []
+    for name, b in base["stages"].items():
+        n = new["stages"].get(name)
+        if n is None:
+            continue
+        eps_change = n["eps"] / b["eps"] - 1 if b["eps"] else 0.0
+        bytes_change = (
+            n["alloc_bytes_per_event"] / b["alloc_bytes_per_event"] - 1
+            if b["alloc_bytes_per_event"] > 0
+            else 0.0
+        )
+        regressed = eps_change < -max_regression or bytes_change > max_regression
+        stages[name] = {
+            "base_eps": b["eps"],
+            "new_eps": n["eps"],
+            "eps_change_pct": round(eps_change * 100, 1),
+            "base_alloc_bytes_per_event": b["alloc_bytes_per_event"],
+            "new_alloc_bytes_per_event": n["alloc_bytes_per_event"],
+            "alloc_bytes_change_pct": round(bytes_change * 100, 1),
+            "regressed": regressed,
+        }
+        if regressed:
+            regressions.append(name)
+    return {"max_regression": max_regression, "stages": stages, "regressions": regressions}
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Microbenchmarks del camino caliente de ingesta")
+    sub = p.add_subparsers(dest="command", required=True)
+    run_p = sub.add_parser("run", help="Ejecuta la suite e imprime/guarda el resultado")
+    run_p.add_argument("--events", type=int, default=5000)
+    run_p.add_argument("--rounds", type=int, default=7)
+    run_p.add_argument("--seed", type=int, default=42)
+    run_p.add_argument("--batch", type=int, default=500)
+    run_p.add_argument("--schema", default=DEFAULT_SCHEMA)
+    run_p.add_argument("--only", help="Etapas separadas por comas")
+    run_p.add_argument("--output", help="Fichero JSON donde guardar el resultado")
+    cmp_p = sub.add_parser("compare", help="Compara dos resultados guardados")
+    cmp_p.add_argument("base")
+    cmp_p.add_argument("new")
+    cmp_p.add_argument("--max-regression", type=float, default=0.2)
+    args = p.parse_args()
+
+    if args.command == "run":
+        out = run_suite(
+            args.events,
+            rounds=args.rounds,
+            seed=args.seed,
+            batch=args.batch,
+            schema_path=args.schema,
+            only=args.only.split(",") if args.only else None,
+        )
+        text = json.dumps(out, indent=2)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+        print(text)
+        return
+
+    with open(args.base, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, "r", encoding="utf-8") as f:
+        new = json.load(f)
+    out = compare(base, new, args.max_regression)
+    print(json.dumps(out, indent=2))
+    sys.exit(1 if out["regressions"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+"""
+Harness de carga offline del consumer (sin RabbitMQ ni OpenSearch).
+
+Ejecuta el consumer.main real (handle, process_message, BulkIndexer, ack diferido,
+backpressure...) con:
+- FakeChannel/FakeConnection en lugar de pika: entregan los mensajes del corpus sintético
+  (`scripts/benchmarks/corpus.py`) a --rate eventos/s (0 = sin límite) respetando el
+  prefetch, como el broker, y registran cada ack/nack.
+- OpenSearchStub: servidor HTTP local con `_bulk`, `_doc` y `_create`, latencia
+  configurable (--latency-ms, --jitter-ms) e inyección de errores: items 429
+  (--item-error-rate, reintentables), items 400 mapper_parsing_exception
+  (--permanent-error-rate) y peticiones 503 (--request-error-rate).
+
+La configuración del consumer es la de siempre (variables de entorno: USE_BULK,
+BULK_DEFERRED_ACK, BULK_MAX_ITEMS, CONSUMER_PREFETCH...). Los tenants del corpus se
+registran en un fichero temporal salvo que se fije TENANTS_REGISTRY_PATH.
+
+Resultado (JSON): eventos/s sostenidos (total y mediana por segundo), percentiles de
+latencia entrega -> ack y publicación -> ack, memoria RSS (inicio, fin, pico, crecimiento)
+y contadores del stub. Exit code 1 si quedan mensajes sin ack/nack.
+
+Uso:
+  USE_BULK=true BULK_DEFERRED_ACK=true python -m scripts.integration.load_harness \\
+      --events 50000 --rate 5000 --latency-ms 20 --item-error-rate 0.01
+"""
+import argparse
+import heapq
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from scripts.benchmarks.corpus import TENANTS, build_bodies
+
+
+def _percentiles_ms(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": pick(1.0)}
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        import resource
+
+        # Sin /proc (macOS): pico en lugar de actual, en bytes
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**20
+
+
+class OpenSearchStub:
+    """Servidor HTTP con las APIs de indexación que usa el consumer."""
+
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        item_error_rate: float = 0.0,
+        permanent_error_rate: float = 0.0,
+        request_error_rate: float = 0.0,
+        seed: int = 42,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.item_error_rate = item_error_rate
+        self.permanent_error_rate = permanent_error_rate
+        self.request_error_rate = request_error_rate
+        self.stats = {
+            "bulk_requests": 0,
+            "doc_requests": 0,
+            "indexed": 0,
+            "item_errors_429": 0,
+            "item_errors_400": 0,
+            "request_errors_503": 0,
+        }
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        handler = type("StubHandler", (_StubHandler,), {"stub": self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "OpenSearchStub":
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, name="opensearch-stub", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _delay(self) -> None:
+        if self.latency_ms or self.jitter_ms:
+            with self._lock:
+                jitter = self._random.uniform(0, self.jitter_ms)
+            time.sleep((self.latency_ms + jitter) / 1000.0)
+
+    def _outcome(self) -> int:
+        """Estado de un documento: 201, 429 o 400 según las tasas de error."""
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.item_error_rate:
+            self._count("item_errors_429")
+            return 429
+        if roll < self.item_error_rate + self.permanent_error_rate:
+            self._count("item_errors_400")
+            return 400
+        self._count("indexed")
+        return 201
+
+    def _request_failed(self) -> bool:
+        if not self.request_error_rate:
+            return False
+        with self._lock:
+            failed = self._random.random() < self.request_error_rate
+        if failed:
+            self._count("request_errors_503")
+        return failed
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += n
+
+    def bulk(self, body: bytes) -> Tuple[int, Dict[str, Any]]:
+        self._count("bulk_requests")
+        self._delay()
+        if self._request_failed():
+            return 503, _error("unavailable_shards_exception", 503)
+        items = []
+        lines = iter(body.split(b"\n"))
+        for line in lines:
+            if not line.strip():
+                continue
+            action = json.loads(line)
+            op, meta = next(iter(action.items()))
+            if op != "delete":
+                next(lines, None)  # documento
+            status = self._outcome()
+            item: Dict[str, Any] = {"_index": meta.get("_index"), "status": status}
+            if status == 429:
+                item["error"] = _error("es_rejected_execution_exception", 429)["error"]
+            elif status == 400:
+                item["error"] = _error("mapper_parsing_exception", 400)["error"]
+            else:
+                item["result"] = "created"
+            items.append({op: item})
+        errors = any(next(iter(i.values()))["status"] >= 300 for i in items)
+        return 200, {"took": int(self.latency_ms), "errors": errors, "items": items}
+
+    def doc(self, index: str, doc_id: Optional[str]) -> Tuple[int, Dict[str, Any]]:
+        self._count("doc_requests")
+        self._delay()
+        if self._request_failed():
+            return 503, _error("unavailable_shards_exception", 503)
+        status = self._outcome()
+        if status == 429:
+            return status, _error("es_rejected_execution_exception", 429)
+        if status == 400:
+            return status, _error("mapper_parsing_exception", 400)
+        return status, {"_index": index, "_id": doc_id or "stub", "result": "created"}
+
+
+def _error(error_type: str, status: int) -> Dict[str, Any]:
+    return {"error": {"type": error_type, "reason": "injected by load harness"}, "status": status}
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Cabeceras y cuerpo en un único envío: sin Nagle + delayed ACK (~40 ms por respuesta)
+    disable_nagle_algorithm = True
+    wbufsize = 64 * 1024
+    stub: OpenSearchStub
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _reply(self, status: int, payload: Dict[str, Any], body: bool = True) -> None:
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if body:
+            self.wfile.write(data)
+
+    def do_HEAD(self) -> None:
+        self._reply(200, {}, body=False)
+
+    def do_GET(self) -> None:
+        if urlsplit(self.path).path == "/":
+            info = {"cluster_name": "load-harness", "version": {"number": "2.11.0"}}
+            self._reply(200, info)
+        else:
+            self._reply(404, _error("index_not_found_exception", 404))
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        parts = urlsplit(self.path).path.strip("/").split("/")
+        if parts[-1] == "_bulk":
+            self._reply(*self.stub.bulk(body))
+        elif len(parts) >= 2 and parts[1] in ("_doc", "_create"):
+            self._reply(*self.stub.doc(parts[0], parts[2] if len(parts) > 2 else None))
+        else:
+            self._reply(404, _error("unsupported_operation", 404))
+
+    do_PUT = do_POST
+
+
+class FakeChannel:
+    """
+    Canal pika simulado: entrega el mensaje i en t0 + i / rate (en cuanto se pueda con
+    rate=0) mientras los no confirmados no superen el prefetch, y mide cada ack/nack.
+    """
+
+    def __init__(
+        self,
+        bodies: List[bytes],
+        events: int,
+        rate: float = 0.0,
+        routing_key: str = "nubla.log.default",
+    ):
+        self.bodies = bodies
+        self.events = events
+        self.rate = rate
+        self.routing_key = routing_key
+        self.prefetch = 0
+        self.consumer_tags: List[str] = []
+        self.acked = 0
+        self.nacked = 0
+        self.dlx_published = 0
+        self.ack_latencies: List[float] = []
+        self.end_to_end_latencies: List[float] = []
+        self.settled_per_second: Dict[int, int] = {}
+        self.start: Optional[float] = None
+        self.last_settle: Optional[float] = None
+        self._callback: Optional[Callable[..., None]] = None
+        self._next = 0
+        self._tags = 0
+        # delivery_tag -> (instante de publicación, instante de entrega)
+        self._unacked: "OrderedDict[int, Tuple[float, float]]" = OrderedDict()
+
+    @property
+    def unsettled(self) -> int:
+        return self.events - self._next + len(self._unacked)
+
+    @property
+    def done(self) -> bool:
+        return self._next >= self.events and not self._unacked
+
+    def basic_qos(self, prefetch_count: int = 0, **kwargs: Any) -> None:
+        self.prefetch = prefetch_count
+
+    def basic_consume(
+        self, queue: str, on_message_callback: Callable[..., None], auto_ack: bool = False
+    ) -> str:
+        self._tags += 1
+        tag = f"ctag-{self._tags}"
+        self._callback = on_message_callback
+        self.consumer_tags = [tag]
+        return tag
+
+    def basic_cancel(self, consumer_tag: Optional[str] = None) -> None:
+        self.consumer_tags = [t for t in self.consumer_tags if t != consumer_tag]
+
+    def stop_consuming(self) -> None:
+        self.consumer_tags = []
+
+    def basic_publish(self, exchange: str, routing_key: str, body: bytes, properties=None):
+        self.dlx_published += 1
+
+    def basic_ack(self, delivery_tag: int, multiple: bool = False) -> None:
+        self._settle(delivery_tag, multiple, ack=True)
+
+    def basic_nack(self, delivery_tag: int, requeue: bool = True, multiple: bool = False) -> None:
+        self._settle(delivery_tag, multiple, ack=False)
+
+    def _settle(self, delivery_tag: int, multiple: bool, ack: bool) -> None:
+        now = time.perf_counter()
+        if multiple:
+            tags = []
+            for tag in self._unacked:
+                if tag > delivery_tag:
+                    break
+                tags.append(tag)
+        else:
+            tags = [delivery_tag] if delivery_tag in self._unacked else []
+        for tag in tags:
+            published, delivered = self._unacked.pop(tag)
+            self.ack_latencies.append(now - delivered)
+            self.end_to_end_latencies.append(now - published)
+        if ack:
+            self.acked += len(tags)
+        else:
+            self.nacked += len(tags)
+        second = int(now - (self.start or now))
+        self.settled_per_second[second] = self.settled_per_second.get(second, 0) + len(tags)
+        self.last_settle = now
+
+    def deliver_ready(self, now: float) -> Optional[float]:
+        """Entrega lo que toca; devuelve cuándo toca el siguiente si se espera al ritmo."""
+        if self.start is None:
+            self.start = now
+        while self.consumer_tags and self._next < self.events:
+            if self.prefetch and len(self._unacked) >= self.prefetch:
+                return None
+            scheduled = self.start + self._next / self.rate if self.rate else self.start
+            if scheduled > now:
+                return scheduled
+            body = self.bodies[self._next % len(self.bodies)]
+            self._next += 1
+            method = SimpleNamespace(
+                delivery_tag=self._next, routing_key=self.routing_key, redelivered=False
+            )
+            self._unacked[self._next] = (scheduled, time.perf_counter())
+            self._callback(self, method, SimpleNamespace(headers=None), body)
+            now = time.perf_counter()
+        return None
+
+
+class FakeConnection:
+    """BlockingConnection simulada: callbacks threadsafe, timers y el bucle de entrega."""
+
+    def __init__(self, channel: FakeChannel, max_seconds: float = 600.0):
+        self.channel = channel
+        self.max_seconds = max_seconds
+        self.timed_out = False
+        self.rss_peak_mb = _rss_mb()
+        self._callbacks: deque = deque()
+        self._timers: List[Tuple[float, int, Callable[[], None]]] = []
+        self._timer_seq = 0
+        self._wake = threading.Event()
+        self._next_rss = 0.0
+
+    def add_callback_threadsafe(self, callback: Callable[[], None]) -> None:
+        self._callbacks.append(callback)
+        self._wake.set()
+
+    def call_later(self, delay: float, callback: Callable[[], None]) -> None:
+        self._timer_seq += 1
+        heapq.heappush(self._timers, (time.perf_counter() + delay, self._timer_seq, callback))
+
+    def close(self) -> None:
+        pass
+
+    def process_data_events(self, time_limit: float = 0) -> None:
+        deadline = time.perf_counter() + (time_limit or 0)
+        channel = self.channel
+        while True:
+            self._wake.clear()
+            while self._callbacks:
+                self._callbacks.popleft()()
+            now = time.perf_counter()
+            while self._timers and self._timers[0][0] <= now:
+                heapq.heappop(self._timers)[2]()
+            next_due = channel.deliver_ready(time.perf_counter())
+            now = time.perf_counter()
+            if now >= self._next_rss:
+                self.rss_peak_mb = max(self.rss_peak_mb, _rss_mb())
+                self._next_rss = now + 0.5
+            if channel.done:
+                # Todo confirmado: el bucle de consumer.main termina al no haber consumers
+                channel.consumer_tags = []
+                return
+            if channel.start is not None and now - channel.start > self.max_seconds:
+                self.timed_out = True
+                # Como SIGTERM en el supervisor: flush final y cierre de consumer.main
+                raise KeyboardInterrupt
+            if now >= deadline:
+                return
+            wait = deadline - now
+            if next_due is not None:
+                wait = min(wait, next_due - now)
+            if self._timers:
+                wait = min(wait, self._timers[0][0] - now)
+            if wait > 0:
+                self._wake.wait(wait)
+
+
+def run_load(
+    stub: OpenSearchStub,
+    events: int,
+    rate: float = 0.0,
+    corpus_size: int = 20000,
+    max_seconds: float = 600.0,
+    seed: int = 42,
+) -> Dict[str, Any]:
+    """Ejecuta consumer.main contra el stub y el canal simulado; devuelve el informe."""
+    from backend.app.core.opensearch_client import OpenSearch, _client_kwargs
+    from backend.app.processing import consumer
+
+    bodies = build_bodies(min(events, corpus_size), seed=seed)
+    channel = FakeChannel(bodies, events, rate)
+    connection = FakeConnection(channel, max_seconds)
+    client = OpenSearch(**{**_client_kwargs(), "hosts": [stub.url]})
+    saved = consumer.get_channel, consumer.get_es
+    consumer.get_channel = lambda: (connection, channel, "load_harness", "logs_default")
+    consumer.get_es = lambda: client
+    rss_start = _rss_mb()
+    try:
+        consumer.main(start_metrics_server=False)
+    finally:
+        consumer.get_channel, consumer.get_es = saved
+    finished = time.perf_counter()
+    rss_end = _rss_mb()
+
+    start = channel.start or finished
+    elapsed = (channel.last_settle or finished) - start
+    settled = channel.acked + channel.nacked
+    # Segundos completos: sin el primero (arranque) ni el último (parcial)
+    windows = [channel.settled_per_second.get(s, 0) for s in range(1, int(elapsed))]
+    return {
+        "events": events,
+        "rate_target": rate,
+        "prefetch": channel.prefetch,
+        "acked": channel.acked,
+        "nacked": channel.nacked,
+        "dlx_published": channel.dlx_published,
+        "unsettled": channel.unsettled,
+        "timed_out": connection.timed_out,
+        "elapsed_seconds": round(elapsed, 3),
+        "drain_seconds": round(finished - (channel.last_settle or finished), 3),
+        "eps": round(settled / elapsed) if elapsed > 0 else None,
+        "eps_per_second_p50": sorted(windows)[len(windows) // 2] if windows else None,
+        "ack_latency_ms": _percentiles_ms(channel.ack_latencies),
+        "end_to_end_latency_ms": _percentiles_ms(channel.end_to_end_latencies),
+        "rss_mb": {
+            "start": round(rss_start, 1),
+            "end": round(rss_end, 1),
+            "peak": round(max(connection.rss_peak_mb, rss_end), 1),
+            "growth": round(rss_end - rss_start, 1),
+        },
+        "opensearch": dict(stub.stats),
+        "consumer": {
+            "bulk": consumer.USE_BULK,
+            "deferred_ack": consumer.BULK_DEFERRED_ACK,
+            "bulk_max_items": consumer.BULK_MAX_ITEMS,
+            "background_flush": consumer.BULK_BACKGROUND_FLUSH,
+            "deterministic_ids": consumer.DETERMINISTIC_IDS,
+        },
+    }
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Harness de carga offline del consumer")
+    p.add_argument("--events", type=int, default=20000)
+    p.add_argument("--rate", type=float, default=0.0, help="Eventos/s publicados (0 = sin límite)")
+    p.add_argument("--corpus-size", type=int, default=20000, help="Mensajes distintos (cíclico)")
+    p.add_argument("--latency-ms", type=float, default=5.0)
+    p.add_argument("--jitter-ms", type=float, default=0.0)
+    p.add_argument("--item-error-rate", type=float, default=0.0)
+    p.add_argument("--permanent-error-rate", type=float, default=0.0)
+    p.add_argument("--request-error-rate", type=float, default=0.0)
+    p.add_argument("--max-seconds", type=float, default=600.0)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--log-level", default="WARNING")
+    args = p.parse_args()
+
+    if "TENANTS_REGISTRY_PATH" not in os.environ:
+        tenants = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+        json.dump({"tenants": list(TENANTS)}, tenants)
+        tenants.close()
+        os.environ["TENANTS_REGISTRY_PATH"] = tenants.name
+    # Import diferido: el consumer lee la configuración del entorno al importarse
+    from backend.app.core.logging import configure_logging
+
+    configure_logging(level=args.log_level)
+    stub = OpenSearchStub(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        item_error_rate=args.item_error_rate,
+        permanent_error_rate=args.permanent_error_rate,
+        request_error_rate=args.request_error_rate,
+        seed=args.seed,
+    ).start()
+    try:
+        out = run_load(
+            stub,
+            args.events,
+            rate=args.rate,
+            corpus_size=args.corpus_size,
+            max_seconds=args.max_seconds,
+            seed=args.seed,
+        )
+    finally:
+        stub.stop()
+    print(json.dumps(out, indent=2))
+    sys.exit(1 if out["unsettled"] else 0)
+
+
+if __name__ == "__main__":
+    main()